@@ -6,18 +6,22 @@ add_gaps_for_missing_taxa.py
 
 Created by Brant Faircloth on 05 July 2011.
 Copyright 2011 Brant C. Faircloth. All rights reserved.
+
+Pad alignments with missing data ('?') for the organisms they lack.  The
+--notstrict index of missing loci is read once, into sets, and files are
+padded in parallel with --cores.
 """
 
 import os
 import sys
-import copy
 import glob
+import numpy
 import argparse
 import ConfigParser
-from Bio import AlignIO
 from collections import defaultdict
-from Bio.Alphabet import IUPAC, Gapped
-from Bio.Align.Generic import Alignment
+from phyluce import align_io
+from phyluce.scheduler import get_chunks, map_chunks
+from phyluce.alignment import Alignment
 
 import pdb
 
@@ -63,6 +67,12 @@ def get_args():
             default=False,
             help="""Do not parse species names at all - use them verbatim""",
         )
+    parser.add_argument(
+            "--cores",
+            type=int,
+            default=1,
+            help="""The number of cores to use.""",
+        )
     return parser.parse_args()
 
 
@@ -73,48 +83,76 @@ def get_names_from_config(config, group):
         return None
 
 
+def is_genus(name, genera):
+    return genera and any(sp for sp in genera if sp in name)
+
+
+def get_new_name(name, verbatim=False, genera=False):
+    if is_genus(name, genera):
+        return '_'.join(name.split('_')[-1:])
+    elif not verbatim:
+        return '_'.join(name.split('_')[-2:])
+    else:
+        return name.lower()
+
+
+def get_locus_name(name, verbatim=False, genera=False):
+    if is_genus(name, genera):
+        return '_'.join(name.split('_')[:-1])
+    elif not verbatim:
+        return '_'.join(name.split('_')[:-2])
+    else:
+        return name
+
+
 def add_gaps_to_align(organisms, missing, align, verbatim=False, genera=False, min_taxa=3):
-    local_organisms = copy.deepcopy(organisms)
-    for a in align:
-        if len(a) < min_taxa:
-            new_align = None
-            break
-        elif len(a) >= min_taxa:
-            #pdb.set_trace()
-            new_align = Alignment(Gapped(IUPAC.unambiguous_dna, "-"))
-            overall_length = len(a[0])
-            for seq in a:
-                if genera and any(sp for sp in genera if sp in seq.name):
-                    new_seq_name = '_'.join(seq.name.split('_')[-1:])
-                elif not verbatim:
-                    new_seq_name = '_'.join(seq.name.split('_')[-2:])
-                else:
-                    new_seq_name = seq.name.lower()
-                new_align.add_sequence(new_seq_name, str(seq.seq))
-                local_organisms.remove(new_seq_name)
-            for org in local_organisms:
-                if genera and any(sp for sp in genera if sp in seq.name):
-                    loc = '_'.join(seq.name.split('_')[:-1])
-                elif not verbatim:
-                    loc = '_'.join(seq.name.split('_')[:-2])
-                else:
-                    loc = seq.name
-                if missing:
-                    try:
-                        assert loc in missing[org], "Locus missing"
-                    except:
-                        assert loc in missing['{}*'.format(org)], "Locus missing"
-                new_align.add_sequence(org, '?' * overall_length)
-    return new_align
+    """return a copy of the alignment, with taxa renamed, padded with '?'
+    for each organism it lacks, or None if it has fewer than min_taxa taxa"""
+    if len(align) < min_taxa:
+        return None
+    names = [get_new_name(name, verbatim, genera) for name in align.names]
+    known, present = set(organisms), set()
+    for name in names:
+        if name not in known or name in present:
+            raise ValueError("{0} is not in the organisms to pad".format(name))
+        present.add(name)
+    absent = [org for org in organisms if org not in present]
+    if missing:
+        # the locus name comes from the last sequence
+        loc = get_locus_name(align.names[-1], verbatim, genera)
+        for org in absent:
+            assert loc in missing.get(org, ()) or \
+                    loc in missing.get('{}*'.format(org), ()), "Locus missing"
+    matrix = numpy.empty((len(names) + len(absent), align.get_alignment_length()), dtype=numpy.uint8)
+    matrix[:len(names)] = align.matrix
+    matrix[len(names):] = ord('?')
+    return Alignment(names + absent, matrix)
 
 
 def get_missing_loci_from_conf_file(config):
-    missing = defaultdict(list)
+    missing = defaultdict(set)
     for sec in config.sections():
-    #    pdb.set_trace()
         for item in config.items(sec):
-            missing[sec].append(item[0])
-    return missing
+            missing[sec].add(item[0])
+    return dict(missing)
+
+
+def worker(work):
+    """pad and write a chunk of files, returning the messages to print"""
+    files, organisms, missing, args = work
+    messages = []
+    for count, nex in files:
+        align = align_io.read(nex, 'nexus')
+        new_align = add_gaps_to_align(organisms, missing, align, args.verbatim, args.genera,
+                args.min_taxa)
+        if new_align is not None:
+            outf = os.path.join(args.output, os.path.basename(nex))
+            align_io.write(new_align, outf, 'nexus')
+            messages.append(count)
+        else:
+            messages.append("{0} Skipping {1} - < {2} taxon".format(count, nex,
+                    args.min_taxa))
+    return messages
 
 
 def main():
@@ -128,17 +166,11 @@ def main():
     else:
         missing = None
     organisms = get_names_from_config(config, 'Organisms')
-    for count, nex in enumerate(glob.glob(os.path.join(args.input, '*.nex*'))):
-        align = AlignIO.parse(nex, "nexus")
-        new_align = add_gaps_to_align(organisms, missing, align, args.verbatim, args.genera,
-                args.min_taxa)
-        if new_align is not None:
-            outf = os.path.join(args.output, os.path.basename(nex))
-            AlignIO.write(new_align, open(outf, 'w'), 'nexus')
-            print count
-        else:
-            print "{0} Skipping {1} - < {2} taxon".format(count, nex,
-                    args.min_taxa)
+    files = list(enumerate(glob.glob(os.path.join(args.input, '*.nex*'))))
+    work = [(chunk, organisms, missing, args) for chunk in get_chunks(files, args.cores)]
+    for messages in map_chunks(worker, work, args.cores):
+        for message in messages:
+            print message
 
 if __name__ == '__main__':
     main()
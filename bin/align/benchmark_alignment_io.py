@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+File: benchmark_alignment_io.py
+Author: Brant Faircloth
+
+Copyright (c) 2012 Brant C. Faircloth. All rights reserved.
+
+Description: Compare the time taken to read and write a directory of
+alignments using phyluce.align_io and BioPython's AlignIO, checking that
+both return the same data.
+
+"""
+
+import os
+import sys
+import glob
+import time
+import argparse
+from Bio import AlignIO
+from Bio.Alphabet import IUPAC, Gapped
+from phyluce import align_io
+from phyluce.alignment import Alignment
+from phyluce.helpers import is_dir, FullPaths, get_file_extensions
+
+import pdb
+
+
+def get_args():
+    """Get arguments from CLI"""
+    parser = argparse.ArgumentParser(
+            description="""Benchmark alignment reading and writing against BioPython""")
+    parser.add_argument(
+            "alignments",
+            type=is_dir,
+            action=FullPaths,
+            help="""The directory of alignments"""
+        )
+    parser.add_argument(
+            "--input-format",
+            dest="input_format",
+            choices=['fasta', 'nexus', 'phylip'],
+            default='nexus',
+            help="""The input alignment format""",
+        )
+    parser.add_argument(
+            "--output-formats",
+            dest="output_formats",
+            nargs='+',
+            choices=['fasta', 'nexus', 'phylip'],
+            default=['fasta', 'nexus', 'phylip'],
+            help="""The output formats to benchmark""",
+        )
+    parser.add_argument(
+            "--repeats",
+            type=int,
+            default=3,
+            help="""The number of times to repeat each test (the best is kept)""",
+        )
+    return parser.parse_args()
+
+
+def get_files(input_dir, input_format):
+    alignments = []
+    for ftype in get_file_extensions(input_format):
+        alignments.extend(glob.glob(os.path.join(input_dir, "*{}".format(ftype))))
+    return alignments
+
+
+def best_time(function, items, repeats):
+    times = []
+    for i in xrange(repeats):
+        start = time.time()
+        result = [function(item) for item in items]
+        times.append(time.time() - start)
+    return min(times), result
+
+
+def report(task, biopython, native):
+    print "{0:<16}biopython {1:>8.3f}s\tphyluce {2:>8.3f}s\tspeedup {3:>6.1f}x".format(
+            task,
+            biopython,
+            native,
+            biopython / native if native else float('inf')
+        )
+
+
+def main():
+    args = get_args()
+    files = get_files(args.alignments, args.input_format)
+    if not files:
+        sys.exit("No {0} alignments in {1}".format(args.input_format, args.alignments))
+    print "{0} {1} alignments".format(len(files), args.input_format)
+    bio_time, bio_alns = best_time(
+            lambda f: AlignIO.read(f, args.input_format, alphabet=Gapped(IUPAC.ambiguous_dna, "-")),
+            files,
+            args.repeats
+        )
+    native_time, native_alns = best_time(
+            lambda f: align_io.read(f, args.input_format),
+            files,
+            args.repeats
+        )
+    report("read", bio_time, native_time)
+    for f, bio, native in zip(files, bio_alns, native_alns):
+        bio = Alignment.from_biopython(bio)
+        if bio.names != native.names or (bio.matrix != native.matrix).any():
+            print "\tDifferent data read from {0}".format(os.path.basename(f))
+    for fmt in args.output_formats:
+        bio_time, bio_out = best_time(
+                lambda aln: aln.format(fmt),
+                bio_alns,
+                args.repeats
+            )
+        native_time, native_out = best_time(
+                lambda aln: align_io.to_string(aln, fmt),
+                native_alns,
+                args.repeats
+            )
+        report("write {0}".format(fmt), bio_time, native_time)
+        for f, bio, native in zip(files, bio_out, native_out):
+            if bio != native:
+                print "\tDifferent {0} output for {1}".format(fmt, os.path.basename(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+File: benchmark_trimming.py
+Author: Brant Faircloth
+
+Copyright (c) 2012 Brant C. Faircloth. All rights reserved.
+
+Description: Compare the time taken by stage two (row-by-row) alignment
+trimming in GenericAlign, which works on all rows at once, with the
+original implementation, which scanned each row in turn, on synthetic
+alignments of increasing width - checking that both trim the same data.
+
+"""
+
+import time
+import numpy
+import argparse
+from phyluce.alignment import Alignment
+from phyluce.generic_align import GenericAlign
+
+import pdb
+
+
+def get_args():
+    """Get arguments from CLI"""
+    parser = argparse.ArgumentParser(
+            description="""Benchmark stage two alignment trimming""")
+    parser.add_argument(
+            "--taxa",
+            type=int,
+            default=100,
+            help="""The number of taxa in each alignment""",
+        )
+    parser.add_argument(
+            "--columns",
+            type=int,
+            nargs='+',
+            default=[1000, 5000, 10000],
+            help="""The alignment widths to benchmark""",
+        )
+    parser.add_argument(
+            "--repeats",
+            type=int,
+            default=3,
+            help="""The number of times to repeat each test (the best is kept)""",
+        )
+    parser.add_argument(
+            "--seed",
+            type=int,
+            default=1,
+            help="""The random seed""",
+        )
+    return parser.parse_args()
+
+
+def get_alignment(taxa, columns, random):
+    """return a synthetic alignment - copies of one sequence with scattered
+    differences, more of them toward the edges, and ragged edge gaps"""
+    bases = numpy.frombuffer('ACGT', dtype=numpy.uint8)
+    matrix = numpy.tile(bases[random.randint(0, 4, columns)], (taxa, 1))
+    position = numpy.arange(columns)
+    edge = numpy.minimum(position, columns - 1 - position) / float(columns)
+    differ = random.random_sample((taxa, columns)) < 0.02 + 0.6 * (edge < 0.15)
+    matrix[differ] = bases[random.randint(0, 4, differ.sum())]
+    for row in xrange(taxa):
+        matrix[row, :random.randint(0, columns // 20)] = ord('-')
+        matrix[row, columns - random.randint(0, columns // 20):] = ord('-')
+    return Alignment(['taxon{0}'.format(row) for row in xrange(taxa)], matrix)
+
+
+def row_by_row(aln, alignment, window_size=5):
+    """stage two trimming as it was, scanning each row in turn"""
+    consensus_array = numpy.array(list(aln._alignment_consensus(alignment)))
+    trimmed = []
+    for name, sequence in alignment:
+        orig_seq_array = numpy.array(list(sequence))
+        gaps = numpy.flatnonzero(orig_seq_array != '-')
+        start, end = (gaps[0], gaps[-1] + 1) if len(gaps) else (len(sequence), len(sequence))
+        seq_array = orig_seq_array[start:end]
+        compare = (seq_array == consensus_array[start:end])
+        weight = numpy.repeat(1.0, window_size) / window_size
+        running_average = numpy.convolve(compare, weight, 'same')
+        gm = (running_average > 0.99)
+        for i in xrange(gm.size):
+            if numpy.all(gm[i:i + 5] == True):
+                bad_start = i
+                break
+        reversed_gm = gm[::-1]
+        for i in xrange(reversed_gm.size):
+            if numpy.all(reversed_gm[i:i + 5] == True):
+                bad_end = reversed_gm.size - i
+                break
+        orig_seq_array[:start + bad_start] = '-'
+        orig_seq_array[start + bad_end:] = '-'
+        trim = ''.join(orig_seq_array)
+        if set(trim) == set(['-']):
+            return None
+        trimmed.append(trim)
+    return Alignment.from_sequences(alignment.names, trimmed)
+
+
+def best_time(function, repeats):
+    times = []
+    for i in xrange(repeats):
+        start = time.time()
+        result = function()
+        times.append(time.time() - start)
+    return min(times), result
+
+
+def main():
+    args = get_args()
+    random = numpy.random.RandomState(args.seed)
+    aln = GenericAlign(None)
+    for columns in args.columns:
+        alignment = get_alignment(args.taxa, columns, random)
+        old_time, old = best_time(lambda: row_by_row(aln, alignment), args.repeats)
+        new_time, new = best_time(lambda: aln.stage_two_trimming(alignment), args.repeats)
+        print "{0} taxa x {1:<8}row-by-row {2:>8.3f}s\tall rows {3:>8.3f}s\tspeedup {4:>6.1f}x".format(
+                args.taxa,
+                columns,
+                old_time,
+                new_time,
+                old_time / new_time if new_time else float('inf')
+            )
+        if (old is None) != (new is None) or \
+                (old is not None and (old.matrix != new.matrix).any()):
+            print "\tDifferent trimming of {0} columns".format(columns)
+
+
+if __name__ == '__main__':
+    main()
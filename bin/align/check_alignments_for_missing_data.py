@@ -7,14 +7,16 @@ Author: Brant Faircloth
 Created by Brant Faircloth on 10 August 2012 11:08 PDT (-0700)
 Copyright (c) 2012 Brant C. Faircloth. All rights reserved.
 
-Description: 
+Description: Print the names of alignments having a taxon without data.
+With --catalog (or --stats), query a database of alignment statistics,
+reading only new or changed alignments.
 
 """
 
 import os
 import glob
 import argparse
-from Bio import AlignIO
+from phyluce import align_stats
 from phyluce.helpers import is_dir, FullPaths, get_file_extensions
 
 
@@ -35,6 +37,18 @@ def get_args():
             default='fasta',
             help="""The input alignment format""",
         )
+    parser.add_argument(
+            "--stats",
+            type=str,
+            default=None,
+            help="""A database of alignment statistics (from get_alignment_stats.py) to query instead of reading the alignments""",
+        )
+    parser.add_argument(
+            "--catalog",
+            action="store_true",
+            default=False,
+            help="""Keep alignment statistics in a catalog alongside the alignments""",
+        )
     return parser.parse_args()
 
 
@@ -49,17 +63,18 @@ def main():
     args = get_args()
     # iterate through all the files to determine the longest alignment
     files = get_files(args.input, args.input_format)
+    db = align_stats.get_catalog(args.input) if args.catalog else args.stats
+    stats = align_stats.get_stats(files, args.input_format, db=db)
     for f in files:
-        try:
-            aln = AlignIO.read(f, args.input_format)
-            for taxon in aln:
-                if set(taxon.seq) == set('-') or set(taxon.seq) == set('?'):
+        error = stats.get_error(f)
+        if error == 'No records found in handle':
+            print 'No records found in {0}'.format(os.path.basename(f))
+        elif error:
+            raise ValueError('Something is wrong with alignment {0}'.format(os.path.basename(f)))
+        else:
+            for taxon in stats.get_taxa(f):
+                if taxon.empty:
                     print os.path.basename(f)
-        except ValueError, e:
-            if e.message == 'No records found in handle':
-                print 'No records found in {0}'.format(os.path.basename(f))
-            else:
-                raise ValueError('Something is wrong with alignment {0}'.format(os.path.basename(f)))
 
 if __name__ == '__main__':
     main()
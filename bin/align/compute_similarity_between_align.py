@@ -16,16 +16,14 @@ import os
 import re
 import sys
 import glob
+import numpy
 import argparse
 
 from collections import defaultdict
 from multiprocessing import cpu_count, Pool
 
-from Bio import AlignIO
-from cogent import LoadSeqs
-from cogent.phylo import distance
-from cogent.evolve.models import GTR
-
+from phyluce import align_io
+from phyluce import pairwise
 from phyluce.helpers import is_dir, FullPaths
 
 import pdb
@@ -54,6 +52,13 @@ def get_args():
             default=False,
             help="""Trim alignments using regular expressions""",
         )
+    parser.add_argument(
+            "--p-distance",
+            dest="p_distance",
+            action="store_true",
+            default=False,
+            help="""Compute pairwise p-distances (the mean over all pairs of taxa) rather than GTR distances (with pycogent)""",
+        )
     parser.add_argument(
             "--multiprocessing",
             action="store_true",
@@ -75,31 +80,18 @@ def get_files(input_dir):
 
 
 def get_aln_starts(aln):
-    mn, mx = 0, aln.get_alignment_length()
-    for sp in aln:
-        for count, base in enumerate(sp.seq):
-            if base != '-':
-                tf = count
-                break
-        for count, base in enumerate(sp.seq[::-1]):
-            if base != '-':
-                tr = count
-                break
-        tr = len(sp.seq) - tr
-        if tf > mn:
-            mn = tf
-        if mx == 0:
-            mx = tr
-        elif tr < mx:
-            mx = tr
+    # first and last non-gap positions of the rows containing data
+    start, end = aln.ends('-')
+    data = start < end
+    mn, mx = start[data].max(), end[data].min()
     return aln[:, mn:mx]
 
 
 def trim_with_regex(aln, forw, rev):
     mn, mx = 0, aln.get_alignment_length()
-    for sp in aln:
-        f = forw.search(str(sp.seq))
-        e = rev.search(str(sp.seq))
+    for name, seq in aln:
+        f = forw.search(seq)
+        e = rev.search(seq)
         if f and f.end() > mn:
             mn = f.end()
         if e:
@@ -114,46 +106,61 @@ def get_sequence_divergence(aln, forw=None, rev=None):
     aln = get_aln_starts(aln)
     if forw and rev:
         aln = trim_with_regex(aln, forw, rev)
-    diff_gaps = [0]
-    diff_no_gaps = [0]
-    for column in xrange(aln.get_alignment_length()):
-        bases = set(aln[:, column])
-        if len(bases) > 1:
-            diff_gaps.append(1)
-        bases.discard('-')
-        if len(bases) > 1:
-            diff_no_gaps.append(1)
-    return aln, sum(diff_gaps), sum(diff_no_gaps)
-
-
-def get_pairwise_distance(aln):
+    # get the characters present in each column
+    characters, counts = aln.character_counts()
+    present = counts > 0
+    gaps = numpy.array([c == '-' for c in characters], dtype=bool)
+    diff_gaps = (present.sum(axis=0) > 1).sum()
+    diff_no_gaps = (present[~gaps].sum(axis=0) > 1).sum()
+    return aln, int(diff_gaps), int(diff_no_gaps)
+
+
+def get_gtr_distance(aln):
+    from cogent import LoadSeqs
+    from cogent.phylo import distance
+    from cogent.evolve.models import GTR
     seqs = []
-    for sp in aln:
-        seqs.extend(['>{}'.format(sp.id), str(sp.seq)])
+    for name, seq in aln:
+        seqs.extend(['>{}'.format(name), seq])
     paln = LoadSeqs(data=seqs)
     d = distance.EstimateDistances(paln, submodel=GTR())
     d.run(show_progress=False)
-    pd = d.getPairwiseDistances()
-    return pd.values()
+    return d.getPairwiseDistances()
+
+
+def get_pairwise_distance(aln, p_distance=False):
+    """return the distance of a locus and the matrix of pairwise distances
+    between its taxa - GTR distances, where the distance of the locus is
+    the first pair pycogent returns, or p-distances ignoring gaps and
+    missing data, where it is the mean over all pairs"""
+    if p_distance:
+        distances, compared = pairwise.p_distances(aln)
+        return pairwise.mean_distance(distances), distances
+    pairs = get_gtr_distance(aln)
+    distances = numpy.zeros((len(aln), len(aln)))
+    for (first, second), value in pairs.iteritems():
+        distances[aln.index(first), aln.index(second)] = value
+    return pairs.values()[0], distances
 
 
 def worker(work):
-    f, forw, rev = work
+    f, forw, rev, p_distance = work
     sys.stdout.write('.')
     sys.stdout.flush()
     diverge, dist = defaultdict(list), defaultdict(list)
     locus = os.path.basename(f)
     sys.stdout.write('.')
     sys.stdout.flush()
-    aln = AlignIO.read(f, 'nexus')
+    aln = align_io.read(f, 'nexus')
     aln, div, divnogap = get_sequence_divergence(aln, forw, rev)
     diverge[locus] = [
             aln.get_alignment_length(),
             div,
             divnogap
         ]
-    dist[locus] = get_pairwise_distance(aln)
-    return [diverge, dist, aln]
+    distance, distances = get_pairwise_distance(aln, p_distance)
+    dist[locus] = [distance]
+    return [diverge, dist, aln, distances]
 
 
 def get_sum_diffs(results):
@@ -174,6 +181,8 @@ def get_average_distance(results):
     dist = []
     for r in results:
         dist.append(r[1].values()[0][0])
+    # loci without any pair of taxa sharing sites have no distance
+    dist = [d for d in dist if not numpy.isnan(d)]
     return float(sum(dist)) / len(dist)
 
 
@@ -191,7 +200,7 @@ def main():
         for_regex, rev_regex = None, None
     # get files and packge for map()
     files = get_files(args.nexus)
-    files = [[f, for_regex, rev_regex] for f in files]
+    files = [[f, for_regex, rev_regex, args.p_distance] for f in files]
     if args.multiprocessing:
         pool = Pool(cpu_count() - 1)
         results = pool.map(worker, files)
@@ -209,15 +218,22 @@ def main():
     divergewriter.write('locus,len,diff(gaps),diff(nogaps)\n')
     distwriter = open(os.path.join(args.output, 'pairwise_distance.csv'), 'w')
     distwriter.write('locus,pairwise_distance\n')
+    # the full distance matrix of each locus
+    matrix_dir = os.path.join(args.output, 'distance_matrices')
+    if not os.path.isdir(matrix_dir):
+        os.makedirs(matrix_dir)
     for r in results:
-        diverge, dist, aln = r
+        diverge, dist, aln, distances = r
         for locus, values in diverge.iteritems():
             divergewriter.write("{},{},{},{}\n".format(locus, values[0], values[1], values[2]))
         for locus, values in dist.iteritems():
             distwriter.write("{},{}\n".format(locus, values[0]))
+            matrix_name = os.path.splitext(locus)[0] + '.csv'
+            with open(os.path.join(matrix_dir, matrix_name), 'w') as matrix_out:
+                pairwise.write_matrix(matrix_out, aln.names, distances)
             if args.keep:
                 aln_out = open(os.path.join(args.output, locus), 'w')
-                AlignIO.write(aln, aln_out, 'nexus')
+                align_io.write(aln, aln_out, 'nexus')
     for i in [divergewriter, distwriter]:
         i.close()
 
@@ -7,15 +7,18 @@ Author: Brant Faircloth
 Created by Brant Faircloth on 26 June 2012 22:06 PDT (-0700)
 Copyright (c) 2012 Brant C. Faircloth. All rights reserved.
 
-Description: 
+Description: Split a concatenated nexus file into a nexus file for each
+of its charsets.  The matrix and charsets are read in one pass, with the
+matrix memory-mapped where its layout allows, and loci are written in
+parallel with --cores.
 
 """
 
 import os
 import sys
 import argparse
-from Bio import AlignIO
-from Bio.Nexus import Nexus
+from collections import OrderedDict
+from phyluce import concatenate
 from phyluce.helpers import is_dir, is_file, FullPaths
 
 import pdb
@@ -36,33 +39,32 @@ def get_args():
             type=is_dir,
             help="""Help text""",
         )
+    parser.add_argument(
+            "--cores",
+            type=int,
+            default=1,
+            help="""The number of cores to use.""",
+        )
     return parser.parse_args()
 
 
 def main():
     args = get_args()
-    # get the partitions from the nexus file
-    print "Getting partition information..."
-    aln = Nexus.Nexus()
-    aln.read(args.nexus)
-    partitions = aln.charsets
+    # get the alignment and the partitions from the nexus file
+    print "Parsing alignment and partition information..."
+    aln, partitions, skipped = concatenate.read_supermatrix(args.nexus)
+    for name in skipped:
+        print "Cannot parse charset {0}, skipping".format(name)
     print "\tThere are {0} partitions".format(len(partitions))
-    print "Parsing alignment..."
-    aln = AlignIO.read(args.nexus, 'nexus')
+    for name, positions in partitions.iteritems():
+        if positions.size == 0:
+            print "Skipping empty partition {0}".format(name)
     print "Writing output"
-    for k in sorted(partitions.iterkeys()):
-        #sys.stdout.write('.')
-        #sys.stdout.flush()
-        try:
-            start, end = partitions[k][0], partitions[k][-1]
-            #pdb.set_trace()
-            #print start, end
-            temp = aln[:, start:end]
-            outf = open(os.path.join(args.output, "{}.nex".format(k)), 'w')
-            outf.write(temp.format('nexus'))
-        except IndexError:
-            print "Died on partition {0}".format(k)
-        outf.close()
+    partitions = OrderedDict([(k, partitions[k]) for k in sorted(partitions.iterkeys())])
+    for name in concatenate.split_supermatrix(aln, partitions, args.output, args.cores):
+        sys.stdout.write('.')
+        sys.stdout.flush()
+    print ""
 
 # charset AC010974= 1320460-1320459;
 # charset AC069154= 1324339-1324338;
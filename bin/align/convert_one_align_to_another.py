@@ -3,10 +3,9 @@ import os
 import sys
 import glob
 import argparse
-from Bio import AlignIO
-from Bio.Align import MultipleSeqAlignment as Alignment
-from multiprocessing import Pool
-from Bio.Alphabet import IUPAC, Gapped
+from phyluce import align_io
+from phyluce.scheduler import get_chunks, map_chunks
+from phyluce.alignment import Alignment
 from phyluce.helpers import get_file_extensions, is_dir, FullPaths
 
 
@@ -34,8 +33,9 @@ def get_args():
             "--output-format",
             dest="output_format",
             choices=['fasta', 'nexus', 'phylip', 'clustal', 'emboss', 'stockholm'],
-            default='nexus',
-            help="""The input alignment format"""
+            nargs='+',
+            default=['nexus'],
+            help="""The output alignment format(s) - each file is read once and written in all of them"""
         )
     parser.add_argument(
             "--cores",
@@ -73,65 +73,64 @@ def test_if_name_in_keys(name, keys):
     return name
 
 
-def shorten_name(args, aln):
-    aln = AlignIO.read(aln, args.input_format)
-    names = {}
-    for seq in aln:
-        if "-" in seq.id:
-            split_name = seq.id.split("-")
-        elif "_" in seq.id:
-            split_name = seq.id.split("_")
-        elif " " in seq.id:
-            split_name = seq.id.split(" ")
+def shorten_name(names):
+    """return a dict mapping each name to a 6 or 7 character name, unique
+    among the new names"""
+    name_map = {}
+    # the new names, as a set for constant-time lookups
+    used = set()
+    for name in names:
+        if "-" in name:
+            split_name = name.split("-")
+        elif "_" in name:
+            split_name = name.split("_")
+        elif " " in name:
+            split_name = name.split(" ")
         else:
             split_name = None
         if split_name is not None:
             f3, l3 = split_name[0][0:3].title(), split_name[1][0:3].title()
             new_name = "{0}{1}".format(f3, l3)
         else:
-            new_name = seq.id[:6]
-        new_name = test_if_name_in_keys(new_name, names.keys())
-        names[seq.id] = new_name
-        seq.id, seq.name = new_name, new_name
-    return names
+            new_name = name[:6]
+        new_name = test_if_name_in_keys(new_name, used)
+        if name in name_map:
+            used.discard(name_map[name])
+        name_map[name] = new_name
+        used.add(new_name)
+    return name_map
 
 
 def rename_alignment_taxa(aln, name_map):
-    new_align = Alignment([], alphabet=Gapped(IUPAC.unambiguous_dna, "-"))
-    for seq in aln:
-        seq.id, seq.name = name_map[seq.id], name_map[seq.id]
-        new_align.append(seq)
-    return new_align
+    return Alignment([name_map[name] for name in aln.names], aln.matrix)
 
 
 def convert_files_worker(params):
-    f, args, name_map = params
-    aln = AlignIO.read(f, args.input_format, alphabet=Gapped(IUPAC.ambiguous_dna))
-    if args.shorten_name:
-        aln = rename_alignment_taxa(aln, name_map)
-    new_name = os.path.splitext(os.path.split(f)[1])[0] + '.{0}'.format(args.output_format)
-    outf = open(os.path.join(args.outdir, new_name), 'w')
-    AlignIO.write(aln, outf, args.output_format)
-    outf.close()
-    sys.stdout.write('.')
-    sys.stdout.flush()
+    """read each file of a chunk once and write it in every output format"""
+    files, args, name_map = params
+    for f in files:
+        aln = align_io.read(f, args.input_format)
+        if args.shorten_name:
+            aln = rename_alignment_taxa(aln, name_map)
+        for output_format in args.output_format:
+            new_name = os.path.splitext(os.path.split(f)[1])[0] + '.{0}'.format(output_format)
+            align_io.write(aln, os.path.join(args.outdir, new_name), output_format)
+    return len(files)
 
 
 def main():
     args = get_args()
     files = get_files(args.indir, args.input_format)
     if args.shorten_name:
-        name_map = shorten_name(args, files[0])
+        name_map = shorten_name(align_io.read(files[0], args.input_format).names)
     else:
         name_map = None
-    params = [[f, args, name_map] for f in files]
+    params = [[chunk, args, name_map] for chunk in get_chunks(files, args.cores)]
     sys.stdout.write('Converting')
     sys.stdout.flush()
-    if args.cores > 1:
-        pool = Pool(args.cores)
-        pool.map(convert_files_worker, params)
-    else:
-        map(convert_files_worker, params)
+    for count in map_chunks(convert_files_worker, params, args.cores):
+        sys.stdout.write('.' * count)
+        sys.stdout.flush()
     if args.shorten_name:
         print "\n\nTaxa renamed (from) => (to):"
         for k, v in name_map.iteritems():
@@ -18,9 +18,7 @@ import os
 import sys
 import glob
 import argparse
-from Bio import AlignIO
-from Bio.Alphabet import IUPAC, Gapped
-from Bio.Align.Generic import Alignment
+from phyluce import align_io
 from phyluce.helpers import is_dir
 
 def get_args():
@@ -53,10 +51,7 @@ def get_samples_to_run(args, all_names):
 def get_all_taxon_names(nexus_files):
     taxa = set()
     for align_file in nexus_files:
-        for align in AlignIO.parse(align_file, "nexus"):
-            for taxon in list(align):
-                #pdb.set_trace()
-                taxa.add(taxon.name)
+        taxa.update(align_io.read(align_file, "nexus").names)
     return taxa
 
 def get_files(input_dir):
@@ -68,13 +63,10 @@ def main():
     taxa = get_all_taxon_names(nexus_files)
     taxa_to_keep = get_samples_to_run(args, taxa)
     for count, align_file in enumerate(nexus_files):
-        new_align = Alignment(Gapped(IUPAC.unambiguous_dna, "-"))
-        for align in AlignIO.parse(align_file, "nexus"):
-            for taxon in list(align):
-                if taxon.name in taxa_to_keep:
-                    new_align.add_sequence(taxon.name, str(taxon.seq))
+        align = align_io.read(align_file, "nexus")
+        new_align = align.select([name in taxa_to_keep for name in align.names])
         outf = os.path.join(args.output, os.path.basename(align_file))
-        AlignIO.write(new_align, open(outf, 'w'), 'nexus')
+        align_io.write(new_align, outf, 'nexus')
         print count
 
 
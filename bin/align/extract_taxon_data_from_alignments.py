@@ -15,7 +15,7 @@ sequence data for a single taxon and output in fasta format.
 import os
 import glob
 import argparse
-from Bio import AlignIO
+from phyluce import align_io
 from phyluce.helpers import is_dir, FullPaths, get_file_extensions
 
 import pdb
@@ -57,10 +57,10 @@ def main():
     for ftype in get_file_extensions(args.input_format):
         alignments.extend(glob.glob(os.path.join(args.alignments, "*{}".format(ftype))))
     for count, f in enumerate(alignments):
-        aln = AlignIO.read(f, args.input_format)
-        for taxon in aln:
-            if taxon.id == args.taxon:
-                seq = str(taxon.seq).replace('-', '')
+        aln = align_io.read(f, args.input_format)
+        for name, seq in aln:
+            if name == args.taxon:
+                seq = seq.replace('-', '')
                 locus = os.path.splitext(os.path.basename(f))[0]
                 if not len(seq) == 0:
                     args.output.write(">{0}\n{1}\n".format(locus, seq))
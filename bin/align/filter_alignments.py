@@ -10,7 +10,9 @@ Copyright (c) 2012 Brant C. Faircloth. All rights reserved.
 Description: Given a folder of alignments, output the name and length.
 Filter on presence of data for a taxon with --containing-data-for and/or
 length with --min-length.  If --output, copy resulting files into a new
-directory.
+directory.  With --catalog (or --stats), lengths and taxa are queried
+from a database of alignment statistics, and only new or changed
+alignments are read.
 
 Usage: python filter_alignments phylip-with-gaps \
     --input-format phylip \
@@ -23,7 +25,7 @@ import os
 import glob
 import shutil
 import argparse
-from Bio import AlignIO
+from phyluce import align_stats
 from phyluce.helpers import is_dir, FullPaths, get_file_extensions
 
 #import pdb
@@ -73,6 +75,24 @@ def get_args():
             action=FullPaths,
             help="""Place alignments meeting criteria in an output folder"""
         )
+    parser.add_argument(
+            "--catalog",
+            action="store_true",
+            default=False,
+            help="""Keep alignment statistics in a catalog alongside the alignments""",
+        )
+    parser.add_argument(
+            "--stats",
+            type=str,
+            default=None,
+            help="""A database of alignment statistics (from get_alignment_stats.py) to query instead of reading the alignments""",
+        )
+    parser.add_argument(
+            "--cores",
+            type=int,
+            default=1,
+            help="""The number of cores to use.""",
+        )
     return parser.parse_args()
 
 
@@ -83,32 +103,25 @@ def get_files(input_dir, input_format):
     return alignments
 
 
-def align_contains_taxa(args, aln):
-    for taxon in aln:
-        if taxon.id in args.containing:
-            if (set(taxon.seq) == set('-')) or (set(taxon.seq) == set('?')):
-                containing = False
-            else:
-                containing = True
+def align_contains_taxa(args, taxa):
+    containing = False
+    for taxon in taxa:
+        if taxon.taxon in args.containing:
+            containing = not taxon.empty
     return containing
 
 
-def align_min_length(args, aln):
-    if aln.get_alignment_length() >= args.min_length:
+def align_min_length(args, locus):
+    if locus.length >= args.min_length:
         length = True
     else:
         length = False
     return length
 
 
-def align_min_taxa(args, aln):
-    count = 0
+def align_min_taxa(args, locus):
     # remove taxa having only missing data designators
-    for taxon in aln:
-        if (set(taxon.seq) == set('-')) or (set(taxon.seq) == set('?')):
-            pass
-        else:
-            count += 1
+    count = locus.taxa - locus.empty_taxa
     if count >= args.min_taxa:
         taxa = True
     else:
@@ -119,32 +132,34 @@ def align_min_taxa(args, aln):
 def main():
     args = get_args()
     files = get_files(args.input, args.input_format)
+    db = align_stats.get_catalog(args.input) if args.catalog else args.stats
+    stats = align_stats.get_stats(files, args.input_format, args.cores, db)
     print "Good Alignments\n"
     for f in files:
-        try:
-            aln = AlignIO.read(f, args.input_format)
-            if args.containing:
-                containing = align_contains_taxa(args, aln)
-            else:
-                containing = True
-            if args.min_length:
-                length = align_min_length(args, aln)
-            else:
-                length = True
-            if args.min_taxa:
-                taxa = align_min_taxa(args, aln)
-            else:
-                taxa = True
-            if containing and taxa and length:
-                print "{0}\t{1}".format(os.path.basename(f))
-            if containing and taxa and length and args.output:
-                name = os.path.basename(f)
-                shutil.copy(f, os.path.join(args.output, name))
-        except ValueError, e:
-            if e.message == 'No records found in handle':
-                print 'No records found in {0}'.format(os.path.basename(f))
-            else:
-                raise ValueError('Something is wrong with alignment {0}'.format(os.path.basename(f)))
+        error = stats.get_error(f)
+        if error == 'No records found in handle':
+            print 'No records found in {0}'.format(os.path.basename(f))
+            continue
+        elif error:
+            raise ValueError('Something is wrong with alignment {0}'.format(os.path.basename(f)))
+        locus = stats.get_locus(f)
+        if args.containing:
+            containing = align_contains_taxa(args, stats.get_taxa(f))
+        else:
+            containing = True
+        if args.min_length:
+            length = align_min_length(args, locus)
+        else:
+            length = True
+        if args.min_taxa:
+            taxa = align_min_taxa(args, locus)
+        else:
+            taxa = True
+        if containing and taxa and length:
+            print "{0}\t{1}".format(os.path.basename(f), locus.length)
+        if containing and taxa and length and args.output:
+            name = os.path.basename(f)
+            shutil.copy(f, os.path.join(args.output, name))
 
 if __name__ == '__main__':
     main()
@@ -17,11 +17,7 @@ import os
 import re
 import glob
 import argparse
-from Bio import SeqIO
-from Bio import AlignIO
-from Bio.Seq import Seq
-from Bio.Alphabet import generic_dna
-from Bio.SeqRecord import SeqRecord
+from phyluce import align_io
 from phyluce.helpers import FullPaths, is_dir, get_file_extensions
 
 import pdb
@@ -66,16 +62,13 @@ def main():
     files = get_files(args.input, args.input_format)
     for count, f in enumerate(files):
         new_records = []
-        for align in AlignIO.parse(f, args.input_format):
-            for oldseq in list(align):
-                seqstr = str(oldseq.seq)
-                #pdb.set_trace()
-                new_seq = re.sub("[acgtn]", "", seqstr)
-                new_seq = re.sub("-", "", new_seq)
-                new_seq_record = SeqRecord(Seq(new_seq, generic_dna), id=oldseq.id, name=oldseq.name, description=oldseq.description)
-                new_records.append(new_seq_record)
+        for name, seqstr in align_io.read(f, args.input_format):
+            #pdb.set_trace()
+            new_seq = re.sub("[acgtn]", "", seqstr)
+            new_seq = re.sub("-", "", new_seq)
+            new_records.append(align_io.fasta_record(name, new_seq))
         outf = os.path.join(args.output, os.path.split(f)[1])
-        SeqIO.write(new_records, open(outf, 'w'), 'fasta')
+        open(outf, 'w').write(''.join(new_records))
         print count
 
 
@@ -7,14 +7,16 @@ Author: Brant Faircloth
 Created by Brant Faircloth on 21 April 2012 16:04 PDT (-0700)
 Copyright (c) 2012 Brant C. Faircloth. All rights reserved.
 
-Description: Convert individual files to a large concantenated phylip file
+Description: Convert individual files to a large concantenated phylip file.
+Files are read once into a phyluce.concatenate.LocusStore and stacked into
+the supermatrix, optionally writing a RAxML partition file of the loci.
 
 """
 
 import os
 import glob
 import argparse
-from Bio.Nexus import Nexus
+from phyluce import concatenate
 from phyluce.helpers import is_dir, FullPaths
 
 
@@ -33,6 +35,18 @@ def get_args():
             action=FullPaths,
             help="""The output file for the concatenated phylip data""",
         )
+    parser.add_argument(
+            "--partitions",
+            action=FullPaths,
+            default=None,
+            help="""An output file for a RAxML partition file of the loci""",
+        )
+    parser.add_argument(
+            "--cores",
+            type=int,
+            default=1,
+            help="""The number of cores to use.""",
+        )
     return parser.parse_args()
 
 
@@ -40,11 +54,15 @@ def main():
     args = get_args()
     print "Reading files..."
     nexus_files = glob.glob(os.path.join(args.input, '*.nex*'))
-    data = [(fname, Nexus.Nexus(fname)) for fname in nexus_files]
+    store = concatenate.LocusStore.from_files(nexus_files, 'nexus', args.cores)
     print "Concatenating files..."
-    concatenated = Nexus.combine(data)
+    concatenated, charsets = store.supermatrix()
     print "Writing to phylip..."
-    concatenated.export_phylip(args.output)
+    with open(args.output, 'w') as outf:
+        outf.write(concatenate.format_phylip(concatenated))
+    if args.partitions:
+        with open(args.partitions, 'w') as outf:
+            outf.write(concatenate.format_partitions(charsets))
 
 
 if __name__ == '__main__':
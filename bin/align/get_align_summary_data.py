@@ -13,14 +13,15 @@ of alignments having more than "--percent" of "--taxa" taxa.
 
 
 import os
-import re
 import sys
 import glob
 import numpy
 import shutil
 import argparse
-from Bio import AlignIO
-from collections import Counter, defaultdict
+from collections import defaultdict
+from phyluce import align_stats
+from phyluce.align_stats import RunningStats
+from phyluce.scheduler import get_chunks, map_chunks
 from phyluce.helpers import is_dir, FullPaths, get_file_extensions
 
 import pdb
@@ -48,6 +49,18 @@ def get_args():
             default='fasta',
             help="""The input alignment format""",
         )
+    parser.add_argument(
+            "--cores",
+            type=int,
+            default=1,
+            help="""The number of cores to use.""",
+        )
+    parser.add_argument(
+            "--stats",
+            type=str,
+            default=None,
+            help="""A database of alignment statistics (from get_alignment_stats.py) to query instead of reading the alignments""",
+        )
     return parser.parse_args()
 
 
@@ -62,49 +75,120 @@ def pretty_printer(result):
     print "{:<65}{:<20}".format(result[0], result[1])
 
 
+class Summary(object):
+    """Partial sums over a set of alignments, which merge with those of
+    other workers"""
+    def __init__(self):
+        self.lengths = RunningStats()
+        self.counts = RunningStats(histogram=True)
+        self.characters = 0
+        self.trimmed = 0
+        self.bases = defaultdict(int)
+        # taxon name: [sum of ambiguities, alignments]
+        self.ambiguities = defaultdict(lambda: [0, 0])
+
+    def merge(self, other):
+        self.lengths.merge(other.lengths)
+        self.counts.merge(other.counts)
+        self.characters += other.characters
+        self.trimmed += other.trimmed
+        for base, count in other.bases.iteritems():
+            self.bases[base] += count
+        for taxon, (total, n) in other.ambiguities.iteritems():
+            self.ambiguities[taxon][0] += total
+            self.ambiguities[taxon][1] += n
+        return self
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['ambiguities'] = dict(self.ambiguities)
+        return state
+
+    def __setstate__(self, state):
+        ambiguities = state.pop('ambiguities')
+        self.__dict__.update(state)
+        self.ambiguities = defaultdict(lambda: [0, 0], ambiguities)
+
+
+def summarize(work):
+    """summarize a chunk of files, returning the messages to print and the
+    partial sums"""
+    files, args = work
+    messages = []
+    summary = Summary()
+    stats = align_stats.get_stats(files, args.input_format, db=args.stats)
+    for f in files:
+        error = stats.get_error(f)
+        if error == 'No records found in handle':
+            messages.append('No records found in {0}'.format(os.path.basename(f)))
+            continue
+        elif error:
+            raise ValueError('Something is wrong with alignment {0}'.format(os.path.basename(f)))
+        locus = stats.get_locus(f)
+        summary.lengths.add(locus.length)
+        if locus.length < 100:
+            messages.append("{0} is < 100 bp long".format(locus.locus))
+        # get characters - columns holding something other than ?, n, N, -
+        summary.characters += locus.characters
+        for base, count in stats.get_bases(f).iteritems():
+            summary.bases[base] += count
+        if args.min_taxa:
+            if locus.taxa >= args.min_taxa:
+                summary.counts.add(locus.taxa)
+            else:
+                messages.append("{0} has fewer than {1} taxa".format(f, args.min_taxa))
+        else:
+            summary.counts.add(locus.taxa)
+        # count leading and trailing gaps
+        summary.trimmed += locus.trimmed
+        for taxon in stats.get_taxa(f):
+            summary.ambiguities[taxon.taxon][0] += taxon.ambiguities
+            summary.ambiguities[taxon.taxon][1] += 1
+    return messages, summary
+
+
 def compute_lengths(lengths, characters, ambiguities):
     print "\nLengths\n-----"
-    l = numpy.array(lengths)
-    sm = ["Total length(aln)", sum(l)]
-    avg = ["Mean length(aln)", numpy.mean(l)]
+    sm = ["Total length(aln)", lengths.total]
+    avg = ["Mean length(aln)", lengths.mean()]
     ci = ["95 CI length(aln)", \
-            1.96 * (numpy.std(l, ddof=1) / numpy.sqrt(len(l)))
+            1.96 * (lengths.std(ddof=1) / numpy.sqrt(lengths.n))
             ]
-    mn = ["Minimum length(aln)", min(l)]
-    mx = ["Maximum length(aln)", max(l)]
-    char = ["Total characters(aln)", sum(characters)]
-    avg_amb = [numpy.mean(v) for k, v in ambiguities.iteritems()]
+    mn = ["Minimum length(aln)", lengths.min]
+    mx = ["Maximum length(aln)", lengths.max]
+    char = ["Total characters(aln)", characters]
+    avg_amb = [total / float(n) for total, n in ambiguities.itervalues()]
     min_amb = ["Minimum avg. ambiguities(aln)", min(avg_amb)]
     max_amb = ["Maximum avg. ambiguities(aln)", max(avg_amb)]
-    min_percent_amb = ["Percent avg. ambiguities(aln) as fxn of mean(length)", min(avg_amb) / numpy.mean(l) * 100]
-    max_percent_amb = ["Percent avg. ambiguities(aln) as fxn of mean(length)", max(avg_amb) / numpy.mean(l) * 100]
+    min_percent_amb = ["Percent avg. ambiguities(aln) as fxn of mean(length)", min(avg_amb) / lengths.mean() * 100]
+    max_percent_amb = ["Percent avg. ambiguities(aln) as fxn of mean(length)", max(avg_amb) / lengths.mean() * 100]
     for result in [sm, char, avg, ci, mn, mx, min_amb, max_amb, min_percent_amb, max_percent_amb]:
         pretty_printer(result)
 
 
 def compute_taxa(counts):
     print "\nTaxa\n-----"
-    avg = ["Average(taxa)", sum(counts) / float(len(counts))]
+    avg = ["Average(taxa)", counts.mean()]
     ci = [
                 "95 CI(taxa)",
-                1.96 * numpy.std(numpy.array(counts), ddof=1) / \
-                numpy.sqrt(len(counts))
+                1.96 * counts.std(ddof=1) / \
+                numpy.sqrt(counts.n)
             ]
-    mn = ["min(taxa)", min(counts)]
-    mx = ["max(taxa)", max(counts)]
-    cnt = ["Count(taxa:# alns)", dict(Counter(counts))]
+    mn = ["min(taxa)", counts.min]
+    mx = ["max(taxa)", counts.max]
+    cnt = ["Count(taxa:# alns)", dict(counts.histogram)]
     for result in [avg, ci, mn, mx, cnt]:
         pretty_printer(result)
 
 
 def compute_bases(bases, trimmed):
     print "\nBase composition\n-----"
-    bssm = {base:sum(bases[base]) for base in bases}
+    bssm = {base:bases[base] for base in bases}
     sm = ["Bases", bssm]
     al = ["Sum(all)", sum(bssm.values())]
     nogpsm = sum([bssm[i] for i in ['A', 'C', 'G', 'T']])
     nogp = ["Sum(nucleotide only)", nogpsm]
-    trim = ["Missing data from trim (%)", round(sum(trimmed) / float(sum(bssm.values())) * 100, 2)]
+    trim = ["Missing data from trim (%)", round(trimmed / float(sum(bssm.values())) * 100, 2)]
     for result in [sm, al, nogp, trim]:
         pretty_printer(result)
 
@@ -113,51 +197,19 @@ def main():
     args = get_args()
     # iterate through all the files to determine the longest alignment
     files = get_files(args.input, args.input_format)
-    counts = []
-    lengths = []
-    trimmed = []
-    characters = []
-    bases = defaultdict(list)
-    ambiguities = defaultdict(list)
-    repl = re.compile('\?|n|N|-')
-    for f in files:
-        try:
-            aln = AlignIO.read(f, args.input_format)
-            l = aln.get_alignment_length()
-            lengths.append(l)
-            name = os.path.basename(f)
-            if l < 100:
-                print "{0} is < 100 bp long".format(name)
-            for col_num in xrange(len(aln[0])):
-                col = aln[:, col_num]
-                # get characters
-                informative = re.sub(repl, '', col)
-                col_count = Counter(informative)
-                if len(informative) > 0:
-                    if max(col_count) > 2:
-                        characters.append(1)
-                for base in col:
-                    bases[base.upper()].append(1)
-            if args.min_taxa:
-                if len(aln) >= args.min_taxa:
-                    counts.append(len(aln))
-                else:
-                    print "{0} has fewer than {1} taxa".format(f, args.min_taxa)
-            else:
-                counts.append(len(aln))
-            for read in aln:
-                left = len(read.seq) - len(str(read.seq).lstrip('-'))
-                right = len(read.seq) - len(str(read.seq).rstrip('-'))
-                trimmed.append(left + right)
-                ambiguities[read.id].append(read.seq.count('N') + read.seq.count('n'))
-        except ValueError, e:
-            if e.message == 'No records found in handle':
-                print 'No records found in {0}'.format(os.path.basename(f))
-            else:
-                raise ValueError('Something is wrong with alignment {0}'.format(os.path.basename(f)))
-    compute_lengths(lengths, characters, ambiguities)
-    compute_taxa(counts)
-    compute_bases(bases, trimmed)
+    if args.stats:
+        # fill in the database first, so workers only read from it
+        align_stats.update_stats(files, args.stats, args.input_format, args.cores)
+    work = [(chunk, args) for chunk in get_chunks(files, args.cores)]
+    summary = Summary()
+    # chunks return in order, so messages print in file order
+    for messages, partial in map_chunks(summarize, work, args.cores):
+        for message in messages:
+            print message
+        summary.merge(partial)
+    compute_lengths(summary.lengths, summary.characters, summary.ambiguities)
+    compute_taxa(summary.counts)
+    compute_bases(summary.bases, summary.trimmed)
 
 
 if __name__ == '__main__':
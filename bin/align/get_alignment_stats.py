@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+File: get_alignment_stats.py
+Author: Brant Faircloth
+
+Copyright (c) 2012 Brant C. Faircloth. All rights reserved.
+
+Description: Make one (parallel) pass over a directory of alignments,
+computing lengths, taxon counts, informative and variable sites, base
+composition, missing data, runs of N, and X-bases, and store the results
+in a sqlite database.  get_align_summary_data.py, get_informative_sites.py,
+check_alignments_for_missing_data.py, get_only_counts_of_taxa_in_align.py,
+and screen_alignments_for_problems.py will query the database (--stats)
+rather than reading the alignments again.  Running it again only reads
+alignments that are new or have changed.  Without a database name, the
+statistics are kept in a catalog alongside the alignments (see --catalog
+in those programs).
+
+"""
+
+import os
+import glob
+import argparse
+from phyluce import align_stats
+from phyluce.helpers import is_dir, FullPaths, get_file_extensions
+
+import pdb
+
+
+def get_args():
+    """Get arguments from CLI"""
+    parser = argparse.ArgumentParser(
+            description="""Compute statistics for a directory of alignments in a single pass"""
+        )
+    parser.add_argument(
+            'input',
+            type=is_dir,
+            action=FullPaths,
+            help="""The directory containing the alignment files"""
+        )
+    parser.add_argument(
+            'db',
+            nargs='?',
+            default=None,
+            help="""The sqlite database in which to store the statistics (default: a catalog in the input directory)"""
+        )
+    parser.add_argument(
+            "--input-format",
+            dest="input_format",
+            choices=['fasta', 'nexus', 'phylip', 'clustal', 'emboss', 'stockholm'],
+            default='fasta',
+            help="""The input alignment format""",
+        )
+    parser.add_argument(
+            "--cores",
+            type=int,
+            default=1,
+            help="""The number of cores to use.""",
+        )
+    return parser.parse_args()
+
+
+def get_files(input_dir, input_format):
+    alignments = []
+    for ftype in get_file_extensions(input_format):
+        alignments.extend(glob.glob(os.path.join(input_dir, "*{}".format(ftype))))
+    return alignments
+
+
+def main():
+    args = get_args()
+    files = get_files(args.input, args.input_format)
+    db = os.path.abspath(args.db) if args.db else align_stats.get_catalog(args.input)
+    align_stats.update_stats(files, db, args.input_format, args.cores)
+    stats = align_stats.AlignmentStats.load(db, files)
+    for path, message in sorted(stats.errors.iteritems()):
+        print "{0}: {1}".format(os.path.basename(path), message)
+    print "{0:<20}{1}".format("alignments", stats.totals['loci'])
+    for column in align_stats.TOTALS:
+        print "{0:<20}{1}".format(column, stats.totals[column])
+
+
+if __name__ == '__main__':
+    main()
@@ -14,12 +14,12 @@ Description:
 import os
 import sys
 import glob
+import numpy
 import sqlite3
 import argparse
 import multiprocessing
-from Bio import AlignIO
-from Bio.Alphabet import generic_dna
-from Bio.Align import MultipleSeqAlignment
+from phyluce import align_io
+from phyluce.alignment import encode
 from phyluce.helpers import is_dir, FullPaths, get_file_extensions
 
 import pdb
@@ -76,20 +76,15 @@ def get_files(input_dir, input_format):
     return alignments
 
 
-def get_starts_and_stops(seq):
-    for position, base in enumerate(seq):
-        if base == '-' or base == '?':
-            continue
-        else:
-            start = position
-            break
-    for position, base in enumerate(seq[::-1]):
-        if base == '-' or base == '?':
-            continue
-        else:
-            stop = len(seq) - position
-            break
-    return start, stop
+def get_starts_and_stops(aln):
+    """return arrays of the first and (one past) the last positions of each
+    row that are not gaps or missing data"""
+    leading, trailing = aln.terminal_runs('-?')
+    length = aln.get_alignment_length()
+    if (leading == length).any():
+        # a row holds no data
+        raise UnboundLocalError("Alignment has a row without data")
+    return leading, length - trailing
 
 
 def get_absolute_starts_and_ends(aln, outgroup):
@@ -97,22 +92,15 @@ def get_absolute_starts_and_ends(aln, outgroup):
     to the outgroup, we also need to determine its start and stop, and use those
     values if less than the taxon-specific values"""
     outgroup_start, outgroup_stop = get_starts_and_stops(outgroup)
-    trim_positions = {}
-    for taxon in aln:
-        taxon_start, taxon_stop = get_starts_and_stops(taxon.seq)
-        if taxon_start < outgroup_start:
-            start = outgroup_start
-        else:
-            start = taxon_start
-        if taxon_stop > outgroup_stop:
-            stop = outgroup_stop
-        else:
-            stop = taxon_stop
-        trim_positions[taxon.id] = [start, stop]
+    taxon_start, taxon_stop = get_starts_and_stops(aln)
+    start = numpy.maximum(taxon_start, outgroup_start[0])
+    stop = numpy.minimum(taxon_stop, outgroup_stop[0])
+    trim_positions = dict(zip(aln.names, zip(start.tolist(), stop.tolist())))
     # return the absolute min and max start and stop across all alignments
-    minimum = max([v[0] for v in trim_positions.values()])
-    maximum = min([v[1] for v in trim_positions.values()])
-    trim_positions['minmax'] = [minimum, maximum]
+    trim_positions['minmax'] = [
+            max([v[0] for v in trim_positions.values()]),
+            min([v[1] for v in trim_positions.values()])
+        ]
     return trim_positions
 
 
@@ -145,84 +133,84 @@ def create_indel_database(db):
     return conn, c
 
 
-def trim_alignments_with_start_and_stop(arguments, iden, new_aln, outgroup, trim_positions):
+def get_trim_window(arguments, iden, length, trim_positions):
     if arguments.trim == 'relative':
-        trim_new_aln = new_aln[:, trim_positions[iden][0]:trim_positions[iden][1]]
-        trim_outgroup = outgroup[trim_positions[iden][0]:trim_positions[iden][1]]
+        start, stop = trim_positions[iden]
     elif arguments.trim == 'absolute':
-        trim_new_aln = new_aln[:, trim_positions['minmax'][0]:trim_positions['minmax'][1]]
-        trim_outgroup = outgroup[trim_positions['minmax'][0]:trim_positions['minmax'][1]]
+        start, stop = trim_positions['minmax']
     elif arguments.trim == 'none':
-        trim_new_aln = new_aln
-        trim_outgroup = outgroup
-    return trim_new_aln, trim_outgroup
+        start, stop = 0, length
+    # an empty window, as slicing would give
+    return start, max(start, stop)
+
+
+def get_differences(aln, outgroup):
+    """return boolean (taxa x columns) arrays of insertions, deletions, and
+    substitutions in each taxon relative to the outgroup"""
+    matrix, og = aln.matrix, outgroup.matrix[0]
+    bases = encode('ACGTacgt')
+    gap = ord('-')
+    og_base = numpy.in1d(og, bases)
+    # if outgroup only has insertion it is [ACGT] while set(base) == (['-'])
+    outgroup_insertion = og_base & (matrix == gap).all(axis=0)
+    # if outgroup only has deletion it is '-', while len(set(base)) >= 1 and not (['-'])
+    outgroup_deletion = (og == gap) & (matrix == matrix[0]).all(axis=0) & (matrix[0] != gap)
+    compare = ~outgroup_insertion & ~outgroup_deletion
+    base = numpy.in1d(matrix, bases).reshape(matrix.shape)
+    insertions = compare & base & (og == gap)
+    deletions = compare & (matrix == gap) & og_base
+    substitutions = compare & ~insertions & ~deletions & (matrix != og)
+    return insertions, deletions, substitutions
+
+
+def count_in_window(cumulative, row, start, stop):
+    return int(cumulative[row, stop] - cumulative[row, start])
 
 
 def worker(work):
     arguments, f = work
     results = {}
-    name_map = {}
     try:
-        aln = AlignIO.read(f, arguments.input_format)
+        aln = align_io.read(f, arguments.input_format)
         # create new alignment to hold everything but the outgroup
-        new_aln = MultipleSeqAlignment([], generic_dna)
-        count = 0
-        for taxon in aln:
-            if taxon.id == arguments.outgroup:
-                outgroup = taxon
-            else:
-                results[taxon.id] = {
-                        'insertions': [],
-                        'deletions': [],
-                        'substitutions': [],
-                        'length': [],
-                        'filename': os.path.splitext(os.path.basename(f))[0]
-                    }
-                new_aln.append(taxon)
-                name_map[taxon.id] = count
-                count += 1
+        is_outgroup = numpy.array([name == arguments.outgroup for name in aln.names], dtype=bool)
+        new_aln = aln.select(~is_outgroup)
+        # map taxon name to position in the alignment
+        name_map = dict([(name, count) for count, name in enumerate(new_aln.names)])
+        for name in new_aln.names:
+            results[name] = {
+                    'insertions': 0,
+                    'deletions': 0,
+                    'substitutions': 0,
+                    'length': [],
+                    'filename': os.path.splitext(os.path.basename(f))[0]
+                }
         sys.stdout.write('.')
         sys.stdout.flush()
         # exception block catches case where a given alignment has missing data for a taxon
         # which we're avoiding (for now).
         try:
+            if not is_outgroup.any():
+                raise UnboundLocalError("Outgroup not in alignment")
+            # when the outgroup name is duplicated, we compare to the last
+            outgroup = aln.select([numpy.flatnonzero(is_outgroup)[-1]])
             # get starts and ends of true bases in alignment
             trim_positions = get_absolute_starts_and_ends(new_aln, outgroup)
-            # loop through taxa and get outgroup
-            bases = set(['A', 'C', 'G', 'T', 'a', 'c', 'g', 't'])
-            for taxon in new_aln:
-                trim_new_aln, trim_outgroup = trim_alignments_with_start_and_stop(
+            # running counts of each type of difference along each row
+            cumulative = {}
+            for key, diffs in zip(['insertions', 'deletions', 'substitutions'], get_differences(new_aln, outgroup)):
+                cumulative[key] = numpy.zeros((len(new_aln), new_aln.get_alignment_length() + 1), dtype=numpy.int64)
+                cumulative[key][:, 1:] = diffs.cumsum(axis=1)
+            for name in new_aln.names:
+                start, stop = get_trim_window(
                             arguments,
-                            taxon.id,
-                            new_aln,
-                            outgroup,
+                            name,
+                            new_aln.get_alignment_length(),
                             trim_positions
                         )
-                results[taxon.id]['length'] = trim_new_aln.get_alignment_length()
-                for idx in xrange(results[taxon.id]['length']):
-                    col = list(trim_new_aln[:, idx])
-                    # if outgroup only has insertion it is [ACGT] while set(base) == (['-'])
-                    if trim_outgroup[idx] in bases and set(col) == set(['-']):
-                        outgroup_insertion = True
-                    else:
-                        outgroup_insertion = False
-                    # if outgroup only has deletion it is '-', while len(set(base)) >= 1 and not (['-'])
-                    if trim_outgroup[idx] == '-' and (len(set(col)) == 1 and set(col) != set(['-'])):
-                        outgroup_deletion = True
-                    else:
-                        outgroup_deletion = False
-                    if not outgroup_insertion and not outgroup_deletion:
-                        # loop through columns and compare to outgroup
-                        base = col[name_map[taxon.id]]
-                        # insertion
-                        if base in bases and trim_outgroup[idx] == '-':
-                            results[taxon.id]['insertions'].append(1)
-                        # deletion
-                        elif base == '-' and trim_outgroup[idx] in bases:
-                            results[taxon.id]['deletions'].append(1)
-                        # substitution
-                        elif base != trim_outgroup[idx]:
-                            results[taxon.id]['substitutions'].append(1)
+                results[name]['length'] = stop - start
+                for key in cumulative:
+                    results[name][key] += count_in_window(cumulative[key], name_map[name], start, stop)
         except UnboundLocalError, e:
             results = {None: os.path.splitext(os.path.basename(f))[0]}
     except ValueError, e:
@@ -263,9 +251,9 @@ def main():
                                 taxon_name,
                                 values['filename'],
                                 values['length'],
-                                sum(values['insertions']),
-                                sum(values['deletions']),
-                                sum(values['substitutions'])
+                                values['insertions'],
+                                values['deletions'],
+                                values['substitutions']
                             ))
     conn.commit()
     c.close()
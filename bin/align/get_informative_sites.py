@@ -14,9 +14,7 @@ Description:
 import os
 import glob
 import argparse
-import multiprocessing
-from Bio import AlignIO
-from collections import Counter
+from phyluce import align_stats
 from phyluce.helpers import is_dir, FullPaths, get_file_extensions
 
 
@@ -52,6 +50,12 @@ def get_args():
             default=1,
             help="""The number of cores to use.""",
         )
+    parser.add_argument(
+            "--stats",
+            type=str,
+            default=None,
+            help="""A database of alignment statistics (from get_alignment_stats.py) to query instead of reading the alignments""",
+        )
     return parser.parse_args()
 
 
@@ -62,61 +66,22 @@ def get_files(input_dir, input_format):
     return alignments
 
 
-def get_informative_sites(count):
-    # remove gaps
-    del count['-']
-    # remove N
-    del count['N']
-    # remove ?
-    del count['?']
-    sufficient_sites = len(count)
-    if sufficient_sites >= 2:
-        sufficient_sequences = sum([1 for i in count.values() if i >= 2])
-        if sufficient_sequences >= 2:
-            return True
-    return False
-
-def get_differences(count):
-    # remove gaps
-    del count['-']
-    # remove N
-    del count['N']
-    # remove ?
-    del count['?']
-    sufficient_sites = len(count)
-    if sufficient_sites >= 2:
-        return True
-    else:
-        return False
-
-def worker(work):
-    args, f = work
-    aln = AlignIO.read(f, args.input_format)
-    name = os.path.basename(f)
-    informative_sites = []
-    differences = []
-    for idx in xrange(aln.get_alignment_length()):
-        col = aln[:, idx]
-        count = Counter(col)
-        if get_informative_sites(count):
-            informative_sites.append(1)
-        else:
-            informative_sites.append(0)
-        if get_differences(count):
-            differences.append(1)
-        else:
-            differences.append(0)
-    return (name, aln.get_alignment_length(), sum(informative_sites), sum(differences))
+def get_results(stats, files):
+    results = []
+    for f in files:
+        error = stats.get_error(f)
+        if error:
+            raise ValueError(error)
+        locus = stats.get_locus(f)
+        results.append((locus.locus, locus.length, locus.informative, locus.variable))
+    return results
 
 
 def main():
     args = get_args()
-    work = [(args, f) for f in get_files(args.input, args.input_format)]
-    if args.cores <= 1:
-        results = map(worker, work)
-    elif args.cores > 1:
-        pool = multiprocessing.Pool(args.cores)
-        results = pool.map(worker, work)
+    files = get_files(args.input, args.input_format)
+    stats = align_stats.get_stats(files, args.input_format, args.cores, args.stats)
+    results = get_results(stats, files)
     if args.output:
         outf = open(args.output, 'w')
         outf.write("locus,length,informative_sites,differences\n")
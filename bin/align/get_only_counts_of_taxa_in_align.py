@@ -19,7 +19,7 @@ import glob
 import numpy
 import shutil
 import argparse
-from Bio import AlignIO
+from phyluce import align_stats
 from phyluce.helpers import is_dir
 
 
@@ -30,6 +30,8 @@ def get_args():
     parser.add_argument('taxa', type=int, help='The number of taxa expected')
     parser.add_argument('output', type=is_dir, help='The output dir in which to store copies of the alignments')
     parser.add_argument('--percent', dest = 'percent', type=float, default = 0.5, help='The percent of taxa to require')
+    parser.add_argument('--stats', type=str, default=None, help='A database of alignment statistics (from get_alignment_stats.py) to query instead of reading the alignments')
+    parser.add_argument('--catalog', action='store_true', default=False, help='Keep alignment statistics in a catalog alongside the alignments')
     return parser.parse_args()
 
 
@@ -44,14 +46,19 @@ def main():
     #                        for f in files]
     counts = []
     frac = []
+    db = align_stats.get_catalog(os.path.expanduser(args.nexus)) if args.catalog else args.stats
+    stats = align_stats.get_stats(files, 'nexus', db=db)
     for f in files:
-        aln = AlignIO.read(f, 'nexus')
+        error = stats.get_error(f)
+        if error:
+            raise ValueError(error)
+        taxa = stats.get_locus(f).taxa
         proportion = round(args.percent * args.taxa)
-        if len(aln) < int(proportion):
+        if taxa < int(proportion):
             pass
         else:
             counts.append(1)
-            frac.append(len(aln)/float(args.taxa))
+            frac.append(taxa/float(args.taxa))
             shutil.copyfile(f,os.path.join(args.output, os.path.basename(f)))
     print "Copied {0} alignments containing an proportion of {1} taxa".format(sum(counts), round(sum(frac)/len(frac), 2))
     #pdb.set_trace()
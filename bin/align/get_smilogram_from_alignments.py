@@ -12,19 +12,15 @@ Description: Given a folder of alignments, generate a smilogram
 """
 
 import os
-import re
 import sys
 import glob
+import numpy
 import sqlite3
 import argparse
 import multiprocessing
-from collections import Counter
 from random import choice
-from Bio import AlignIO
-from Bio.Seq import Seq
-from Bio.SeqRecord import SeqRecord
-from Bio.Alphabet import generic_dna
-from Bio.Align import MultipleSeqAlignment
+from phyluce import align_io
+from phyluce.alignment import encode
 from phyluce.helpers import is_dir, FullPaths, get_file_extensions
 
 import pdb
@@ -65,6 +61,19 @@ def get_args():
             default=False,
             help="""Help text""",
         )
+    parser.add_argument(
+            "--npz",
+            action="store_true",
+            default=False,
+            help="""Also write per-position counts for every locus to a compressed numpy (.npz) file""",
+        )
+    parser.add_argument(
+            "--no-database",
+            dest="no_database",
+            action="store_true",
+            default=False,
+            help="""Do not create the sqlite database (use with --smilogram and/or --npz)""",
+        )
     return parser.parse_args()
 
 
@@ -87,7 +96,7 @@ def create_differences_database(db):
             )'''
         )
         c.execute('''CREATE TABLE differences (
-                idx INTEGER PRIMARY KEY AUTOINCREMENT,
+                idx INTEGER PRIMARY KEY,
                 taxon text,
                 locus text,
                 position int,
@@ -97,7 +106,7 @@ def create_differences_database(db):
             )'''
         )
         c.execute('''CREATE TABLE by_locus (
-                idx INTEGER PRIMARY KEY AUTOINCREMENT,
+                idx INTEGER PRIMARY KEY,
                 locus text,
                 substitutions real,
                 count int,
@@ -122,46 +131,151 @@ def create_differences_database(db):
     return conn, c
 
 
-def replace_gaps_at_start_and_ends(seq):
-    """walk end from the ends of alignments to locate and replace gaps at ends"""
-    begin, end = [], []
-    for start, base in enumerate(seq):
-        if base == '-':
-            begin.append('?')
-            continue
-        else:
-            break
-    for stop, base in enumerate(seq[::-1]):
-        if base == '-':
-            end.append('?')
-            continue
-        else:
-            stop = len(seq) - stop
-            break
-    newseq = ''.join(begin) + str(seq[start:stop]) + ''.join(end)
-    return Seq(newseq, generic_dna)
+def tune_database(c):
+    """speed up the bulk load - the database is rebuilt from scratch if
+    the load fails, so we do not need the journal or syncs"""
+    c.execute("PRAGMA synchronous = OFF")
+    c.execute("PRAGMA journal_mode = MEMORY")
+    c.execute("PRAGMA temp_store = MEMORY")
+    c.execute("PRAGMA cache_size = 100000")
+
+
+def index_database(c):
+    """create indexes once the data are loaded"""
+    c.execute("CREATE INDEX differences_locus_idx ON differences(locus)")
+    c.execute("CREATE INDEX by_locus_locus_idx ON by_locus(locus)")
+    c.execute("CREATE INDEX by_locus_position_from_center_idx ON by_locus(position_from_center)")
+
+
+def get_difference_rows(locus, result, center):
+    for taxon_name, values in result.iteritems():
+        for typ, positions in values.iteritems():
+            for pos in positions:
+                yield (taxon_name, locus, pos, pos - center, typ)
+
+
+def get_by_locus_rows(locus, substitutions, bases, center):
+    # iterate over counts of all positions - having subs and not having subs
+    for pos, (subs, count) in enumerate(zip(substitutions.tolist(), bases.tolist())):
+        yield (locus, subs, count, pos, pos - center, 'substitutions')
+
+
+def load_database(conn, c, results):
+    """bulk load the worker results in a single transaction"""
+    tune_database(c)
+    with conn:
+        for locus, result, length, bases, counts in results:
+            # get approximate center of alignment
+            center = length / 2
+            # fill locus table
+            c.execute('''INSERT INTO loci VALUES (?,?)''', (locus, length))
+            # fill the position specific table
+            c.executemany('''INSERT INTO differences (
+                    taxon,
+                    locus,
+                    position,
+                    position_from_center,
+                    type
+                )
+                VALUES (?,?,?,?,?)''', get_difference_rows(locus, result, center))
+            # we also want a locus specific list of all variable positions
+            # basically we'll use this to generate the distro of variable
+            # positions relative to centerline of the UCE (AKA the "smilogram")
+            #
+            # NOTE:  currently only doing this for substitutions
+            c.executemany('''INSERT INTO by_locus (
+                    locus,
+                    substitutions,
+                    count,
+                    position,
+                    position_from_center,
+                    type
+                )
+                VALUES (?,?,?,?,?,?)''', get_by_locus_rows(locus, counts['substitution'], bases, center))
+        index_database(c)
+
+
+def write_npz(filename, results):
+    """write the per-position counts of all loci as columns of a compressed
+    numpy file.  rows for locus i are [offsets[i]:offsets[i + 1]]."""
+    loci = [r[0] for r in results]
+    lengths = numpy.array([r[2] for r in results], dtype=numpy.int64)
+    offsets = numpy.concatenate([[0], numpy.cumsum(lengths)])
+    position = numpy.concatenate([numpy.arange(l) for l in lengths] or [[]]).astype(numpy.int64)
+    center = numpy.repeat(lengths / 2, lengths)
+    columns = {}
+    for typ in ['insertion', 'deletion', 'substitution']:
+        columns[typ] = numpy.concatenate([r[4][typ] for r in results] or [[]]).astype(numpy.int64)
+    numpy.savez_compressed(
+            filename,
+            loci=numpy.array(loci),
+            lengths=lengths,
+            offsets=offsets,
+            position=position,
+            position_from_center=position - center,
+            bases=numpy.concatenate([r[3] for r in results] or [[]]).astype(numpy.int64),
+            **columns
+        )
+
+
+def get_smilogram(results):
+    """sum substitutions and bases by position from the center of every
+    locus"""
+    if not results:
+        return []
+    low = min([-(r[2] / 2) for r in results])
+    high = max([r[2] - r[2] / 2 for r in results])
+    substitutions = numpy.zeros(high - low, dtype=numpy.int64)
+    bases = numpy.zeros(high - low, dtype=numpy.int64)
+    for locus, result, length, base_counts, counts in results:
+        start = -(length / 2) - low
+        substitutions[start:start + length] += counts['substitution']
+        bases[start:start + length] += base_counts
+    rows = []
+    for idx in numpy.flatnonzero(substitutions):
+        ss = float(substitutions[idx])
+        count = int(bases[idx])
+        rows.append((ss, count, ss / count, int(idx + low)))
+    return rows
 
 
 def replace_gaps(aln):
-    """we need to determine actual starts of alignments"""
-    new_aln = MultipleSeqAlignment([], generic_dna)
-    for taxon in aln:
-        seq = replace_gaps_at_start_and_ends(taxon.seq)
-        new_aln.append(SeqRecord(seq, id=taxon.id, name=taxon.name, description=taxon.description))
-    return new_aln
+    """we need to determine actual starts of alignments - locate gaps at the
+    ends of every row and replace them with '?'"""
+    leading, trailing = aln.terminal_runs('-')
+    length = aln.get_alignment_length()
+    position = numpy.arange(length)
+    ends = (position < leading[:, None]) | (position >= (length - trailing)[:, None])
+    return aln.mask(ends, '?')
+
+
+def get_major_alleles(characters, counts, variable):
+    """get the code of the major allele in every variable column"""
+    maximum = counts.max(axis=0)
+    tied = (counts == maximum).sum(axis=0) > 1
+    major = encode(characters)[counts.argmax(axis=0)]
+    for idx in numpy.flatnonzero(variable & tied):
+        # randomly select a major allele (excluding gaps)
+        # when there is a tie
+        common_bases = []
+        for base, c in zip(characters, counts[:, idx]):
+            base = base.lower()
+            # bases can be any of IUPAC set except N|n
+            if c == maximum[idx] and base in ['a', 'c', 't', 'g', 'r', 'y', 's', 'w', 'k', 'm', 'b', 'd', 'h', 'v']:
+                common_bases.append(base)
+        # randomly select 1 of the bases
+        major[idx] = ord(choice(common_bases))
+    return major
 
 
 def worker(work):
     arguments, f = work
     results = {}
-    name_map = {}
-    base_count = {}
     locus = os.path.splitext(os.path.basename(f))[0]
-    aln = AlignIO.read(f, arguments.input_format)
+    aln = align_io.read(f, arguments.input_format)
     # map taxon position in alignment to name
-    for idx, taxon in enumerate(aln):
-        name_map[idx] = taxon.id
-        results[taxon.id] = {
+    for name in aln.names:
+        results[name] = {
                     'insertion': [],
                     'deletion': [],
                     'substitution': []
@@ -171,54 +285,41 @@ def worker(work):
     # we assume internal gaps are "real" whereas end gaps usually
     # represent missing data.
     aln = replace_gaps(aln)
-    for idx in xrange(aln.get_alignment_length()):
-        col = aln[:, idx]
-        # strip the "n" or "N"
-        bases = re.sub('N|n|\?', "", col)
-        # count total number of sites considered
-        base_count[idx] = len(bases)
-        # if all the bases besides N|n are the same; skip
-        if len(set(bases)) == 1 or len(bases) == 0:
-            pass
-        else:
-            # count all the bases in a column
-            count = Counter(bases)
-            # get major allele if possible
-            count_of_count = Counter(count.values())
-            # we can't have a tie
-            if count_of_count[max(count_of_count)] == 1:
-                major = count.most_common()[0][0]
-            else:
-                # randomly select a major allele (excluding gaps)
-                # when there is a tie
-                common_bases = []
-                for base, c in count.most_common():
-                    base = base.lower()
-                    # bases can be any of IUPAC set except N|n
-                    if c == max(count_of_count) and base in ['a', 'c', 't', 'g', 'r', 'y', 's', 'w', 'k', 'm', 'b', 'd', 'h', 'v']:
-                        common_bases.append(base)
-                # randomly select 1 of the bases
-                major = choice(common_bases)
-            # now, check for indels/substitutions
-            for pos, base in enumerate(col):
-                base = base.lower()
-                if (base == major) or (base in ['N', 'n', '?']):
-                    pass
-                elif major == '-' and base != '-':
-                    results[name_map[pos]]['insertion'].append(idx)
-                elif base == '-' and major != '-':
-                    results[name_map[pos]]['deletion'].append(idx)
-                elif base != '-' and major != '-':
-                    results[name_map[pos]]['substitution'].append(idx)
+    # count total number of sites considered, stripping "n", "N", and "?"
+    base_count = (~aln.is_in('Nn?')).sum(axis=0)
+    # count all the bases in a column.  if all the bases besides N|n are
+    # the same, skip.
+    characters, counts = aln.character_counts(exclude='Nn?')
+    variable = (counts > 0).sum(axis=0) > 1
+    # get major allele if possible - we can't have a tie
+    major = get_major_alleles(characters, counts, variable)
+    # now, check for indels/substitutions
+    lower = aln.lower().matrix
+    gap = ord('-')
+    considered = variable & (lower != major) & (lower != ord('n')) & (lower != ord('?'))
+    insertion = considered & (major == gap) & (lower != gap)
+    deletion = considered & (lower == gap) & (major != gap)
+    substitution = considered & (lower != gap) & (major != gap)
+    for pos, name in enumerate(aln.names):
+        results[name]['insertion'] = numpy.flatnonzero(insertion[pos]).tolist()
+        results[name]['deletion'] = numpy.flatnonzero(deletion[pos]).tolist()
+        results[name]['substitution'] = numpy.flatnonzero(substitution[pos]).tolist()
+    # the number of taxa differing at each position
+    counts = {
+            'insertion': insertion.sum(axis=0),
+            'deletion': deletion.sum(axis=0),
+            'substitution': substitution.sum(axis=0)
+        }
     sys.stdout.write('.')
     sys.stdout.flush()
-    return (locus, results, aln.get_alignment_length(), base_count)
+    return (locus, results, aln.get_alignment_length(), base_count, counts)
 
 
 def main():
     args = get_args()
-    db_name = "{0}.sqlite".format(args.output)
-    conn, c = create_differences_database(db_name)
+    if not args.no_database:
+        db_name = "{0}.sqlite".format(args.output)
+        conn, c = create_differences_database(db_name)
     # iterate through all the files to determine the longest alignment
     work = [(args, f) for f in get_files(args.input, args.input_format)]
     sys.stdout.write("Running")
@@ -227,78 +328,19 @@ def main():
         results = pool.map(worker, work)
     else:
         results = map(worker, work)
-    print "\nEntering data to sqlite...."
-    # fill the individual/locus/position specific table
-    for locus, result, length, bases in results:
-        # get approximate center of alignment
-        center = length / 2
-        # fill locus table
-        c.execute('''INSERT INTO loci VALUES (?,?)''', (locus, length))
-        # fill the position specific table
-        for taxon_name, values in result.iteritems():
-            for typ, positions in values.iteritems():
-                if positions != []:
-                    #pdb.set_trace()
-                    for pos in positions:
-                        c.execute('''INSERT INTO differences (
-                            taxon,
-                            locus,
-                            position,
-                            position_from_center,
-                            type
-                        )
-                        VALUES (?,?,?,?,?)''', (
-                            taxon_name,
-                            locus,
-                            pos,
-                            pos - center,
-                            typ
-                        ))
-        # we also want a locus specific list of all variable positions
-        # basically we'll use this to generate the distro of variable
-        # positions relative to centerline of the UCE (AKA the "smilogram")
-        #
-        # NOTE:  currently only doing this for substitutions
-        variable_locations = []
-        # get all substitution locations across individuals
-        for k, v in result.iteritems():
-            variable_locations.extend(v['substitution'])
-        # get a count of variability by position in BP
-        cnt = Counter(variable_locations)
-        # iterate over counts of all positions - having subs and not having subs
-        # then add those + any sub location to the DB
-        for pos in sorted(bases.keys()):
-            c.execute('''INSERT INTO by_locus (
-                    locus,
-                    substitutions,
-                    count,
-                    position,
-                    position_from_center,
-                    type
-                )
-                VALUES (?,?,?,?,?,?)''', (
-                    locus,
-                    cnt[pos],
-                    bases[pos],
-                    pos,
-                    pos - center,
-                    'substitutions'
-                    ))
-    conn.commit()
+    if not args.no_database:
+        print "\nEntering data to sqlite...."
+        load_database(conn, c, results)
+        c.close()
+        conn.close()
+    if args.npz:
+        write_npz("{0}.npz".format(args.output), results)
     if args.smilogram:
         outf = open("{0}-smilogram.csv".format(args.output), 'w')
         outf.write('substitutions,bp,freq,distance_from_center\n')
-        c.execute('''CREATE TEMP TABLE ssb AS
-            SELECT sum(substitutions) AS ss, sum(count), sum(substitutions)/sum(count), position_from_center
-            FROM by_locus GROUP BY position_from_center
-            ''')
-        c.execute('''SELECT * FROM ssb WHERE ss != 0''')
-        results = c.fetchall()
-        for row in results:
+        for row in get_smilogram(results):
             outf.write("{0}\n".format(','.join(map(str, row))))
         outf.close()
-    c.close()
-    conn.close()
     print "Done."
 
 
@@ -9,6 +9,8 @@ Copyright (c) 2012 Brant C. Faircloth. All rights reserved.
 
 Description: Given an input directory of nexus files, randomly sample
 some, concatenate them, and return a conatenated nexus file as output.
+The sampled files are read once, into a phyluce.concatenate.LocusStore,
+and the samples are concatenated from that, in parallel with --cores.
 
 """
 
@@ -17,7 +19,7 @@ import sys
 import glob
 import numpy
 import argparse
-from Bio.Nexus import Nexus
+from phyluce.concatenate import LocusStore, write_supermatrices
 from phyluce.helpers import is_dir, FullPaths
 
 import pdb
@@ -52,6 +54,19 @@ def get_args():
             default=1,
             help="""The number of samples to take""",
         )
+    parser.add_argument(
+            "--output-format",
+            dest="output_format",
+            choices=['nexus', 'phylip'],
+            default='nexus',
+            help="""The output format (phylip also writes a RAxML partition file)""",
+        )
+    parser.add_argument(
+            "--cores",
+            type=int,
+            default=1,
+            help="""The number of cores to use.""",
+        )
     return parser.parse_args()
 
 
@@ -62,18 +77,20 @@ def main():
     files = numpy.array(glob.glob(os.path.join(args.nexus, '*.nex*')))
     # make sure we have enough
     assert len(files) >= args.sample_size, "Sample size must be < number(files)"
-    print "Running"
+    samples = []
     for i in xrange(args.samples):
-        sys.stdout.write('.')
-        sys.stdout.flush()
         # get list of random numbers
         sample = numpy.random.random_integers(0, len(files) - 1, args.sample_size)
         # reindex filenames by random selections
-        random_files = sorted(files[sample].tolist())
-        # concatenate and output
-        files_to_combine = [(f, Nexus.Nexus(f)) for f in random_files]
-        combined = Nexus.combine(files_to_combine)
-        align_name = "random-sample-{}-{}-loci.nex".format(i, args.sample_size)
+        samples.append(sorted(files[sample].tolist()))
+    # read every sampled file once
+    print "Reading"
+    sampled = sorted(set([f for random_files in samples for f in random_files]))
+    store = LocusStore.from_files(sampled, 'nexus', args.cores)
+    extension = {'nexus': 'nex', 'phylip': 'phylip'}[args.output_format]
+    work = []
+    for i, random_files in enumerate(samples):
+        align_name = "random-sample-{}-{}-loci.{}".format(i, args.sample_size, extension)
         # open metadata file
         meta_name = 'META-random-sample-{}-{}-loci.txt'.format(i, args.sample_size)
         meta = open(
@@ -81,9 +98,13 @@ def main():
             )
         meta.write('{}'.format('\n'.join(random_files)))
         meta.close()
-        combined.write_nexus_data(filename=open(
-                os.path.join(args.output, align_name), 'w')
-            )
+        loci = [store.index(f) for f in random_files]
+        work.append((loci, os.path.join(args.output, align_name), args.output_format))
+    print "Running"
+    # concatenate and output
+    for outfile in write_supermatrices(store, work, args.cores):
+        sys.stdout.write('.')
+        sys.stdout.flush()
     sys.stdout.write("Done")
 
 if __name__ == '__main__':
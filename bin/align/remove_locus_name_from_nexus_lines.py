@@ -20,9 +20,7 @@ import os
 import re
 import glob
 import argparse
-from Bio import AlignIO
-from Bio.Alphabet import generic_dna
-from Bio.Align import MultipleSeqAlignment
+from phyluce import align_io
 from phyluce.helpers import FullPaths, is_dir
 
 import pdb
@@ -62,21 +60,14 @@ def main():
     files = get_files(args.input)
     all_taxa = set([])
     for count, f in enumerate(files):
-        #new_align = Alignment(Gapped(IUPAC.unambiguous_dna, "-"))
-        new_align = MultipleSeqAlignment([], generic_dna)
-        for align in AlignIO.parse(f, 'nexus'):
-            for seq in list(align):
-                #pdb.set_trace()
-                fname = os.path.splitext(os.path.basename(f))[0]
-                new_seq_name = re.sub("^{}_*".format(fname), "", seq.name)
-                all_taxa.add(new_seq_name)
-                seq.id = new_seq_name
-                seq.name = new_seq_name
-                new_align.append(seq)
+        new_align = align_io.read(f, 'nexus')
+        fname = os.path.splitext(os.path.basename(f))[0]
+        new_align.names = [re.sub("^{}_*".format(fname), "", name) for name in new_align.names]
+        all_taxa.update(new_align.names)
         assert len(all_taxa) == args.taxa, "Taxon names are not identical"
         outf = os.path.join(args.output, os.path.split(f)[1])
         try:
-            AlignIO.write(new_align, open(outf, 'w'), 'nexus')
+            align_io.write(new_align, outf, 'nexus')
         except ValueError:
             pdb.set_trace()
         print count
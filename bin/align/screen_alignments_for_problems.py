@@ -7,16 +7,18 @@ Author: Brant Faircloth
 Created by Brant Faircloth on 07 March 2012 15:03 PST (-0800)
 Copyright (c) 2012 Brant C. Faircloth. All rights reserved.
 
-Description: 
+Description: Screen alignments for runs of N and X-bases, copying (or
+hardlinking) the alignments without X-bases to --output.  Raw bytes are
+scanned in parallel (--cores), and only alignments that may hold problem
+bases are parsed.  With --stats, query a database of alignment statistics
+instead.
 
 """
 
 import os
-import re
 import glob
-import shutil
 import argparse
-from Bio import AlignIO
+from phyluce import align_stats, align_screen
 from phyluce.helpers import is_dir, FullPaths, get_file_extensions
 
 import pdb
@@ -40,6 +42,18 @@ def get_args():
         type=is_dir,
         action=FullPaths,
         help="""The directory to copy good alignments to""")
+    parser.add_argument('--stats',
+        type=str,
+        default=None,
+        help="""A database of alignment statistics (from get_alignment_stats.py) to query instead of reading the alignments""")
+    parser.add_argument('--link',
+        action="store_true",
+        default=False,
+        help="""Hardlink, rather than copy, good alignments to --output""")
+    parser.add_argument('--cores',
+        type=int,
+        default=1,
+        help="""The number of cores to use.""")
     return parser.parse_args()
 
 
@@ -50,42 +64,53 @@ def get_files(input_dir, input_format):
     return alignments
 
 
-def find_multiple_N_bases(regex, aln):
+def find_multiple_N_bases(n_runs):
     n = {}
-    for seq in list(aln):
-        result = regex.findall(str(seq.seq))
-        if result:
-            ncount = [len(i) for i in result]
-            n[seq.name] = ncount
+    for name, ncount in n_runs:
+        n[name] = ncount
     return n
 
 
-def find_any_X_bases(f, aln):
-    x_bases = False
-    for seq in list(aln):
-        if 'X' in str(seq.seq) or 'x' in str(seq.seq):
-            x_bases = True
-            print "X-bases in ", os.path.basename(f)
-    return x_bases
+def find_any_X_bases(f, x_bases):
+    for name, count in x_bases:
+        print "X-bases in ", os.path.basename(f)
+    return bool(x_bases)
+
+
+def get_stats_screens(files, args):
+    """yield (path, error, n_runs, x_bases) from a database of statistics"""
+    stats = align_stats.get_stats(files, args.input_format, args.cores, args.stats)
+    for f in files:
+        error = stats.get_error(f)
+        if error:
+            yield f, error, [], []
+        else:
+            taxa = stats.get_taxa(f)
+            yield (
+                    f,
+                    None,
+                    [(t.taxon, [int(i) for i in t.n_runs.split(',')]) for t in taxa if t.n_runs],
+                    [(t.taxon, t.x_bases) for t in taxa if t.x_bases]
+                )
 
 
 def main():
     args = get_args()
     # iterate through all the files to determine the longest alignment
     files = get_files(args.input, args.input_format)
-    # compile our regexes once
-    n_bases = re.compile("N{3,}")
-    for f in files:
-        aln = AlignIO.read(f, args.input_format)
-        n = find_multiple_N_bases(n_bases, aln)
-        x_bases = find_any_X_bases(f, aln)
+    if args.stats:
+        screens = get_stats_screens(files, args)
+    else:
+        screens = align_screen.screen_files(files, args.input_format, args.cores)
+    for f, error, n_runs, x_bases in screens:
+        if error:
+            raise ValueError(error)
+        n = find_multiple_N_bases(n_runs)
+        x_bases = find_any_X_bases(f, x_bases)
         for name, count in n.iteritems():
             print "{0}\n\t{1}\n\t{2}".format(f, name, count)
         if args.output and not x_bases:
-            #pdb.set_trace()
-            fname = os.path.basename(f)
-            outpath = os.path.join(args.output, fname)
-            shutil.copy(f, outpath)
+            align_screen.copy_file(f, args.output, args.link)
 
 
 if __name__ == '__main__':
@@ -4,19 +4,46 @@ Author: Brant Faircloth
 
 Created by Brant Faircloth on 7 March 2012 09:31 PST (-0800)
 Copyright (c) 2012 Brant C. Faircloth. All rights reserved.
+
+Taxa are assembled concurrently within a budget of --cores and --memory.
+Each assembly needs <t> cores, and memory estimated from the size of its
+reads (--memory-factor times the gzipped size, for each of the <t>
+velvet processes VelvetOptimiser runs); the largest are started first.
+
+Each assembly runs in its own directory, <taxon>/assembly-running, which
+is moved to <taxon>/assembly when it finishes.  Finished (and failed)
+assemblies are recorded in a journal in the output directory - with the
+size, mtime, and SHA-1 of their reads and of their contigs - so that a
+re-run skips taxa already assembled from the same reads and resumes the
+rest.
 """
 
 import os
 import re
+import sys
 import glob
+import json
 import errno
+import shutil
+import signal
+import hashlib
 import argparse
 import subprocess
 from phyluce.helpers import is_dir, FullPaths
 from phyluce.third_party import which
+from phyluce.scheduler import Job, run_jobs, get_size
 
 import pdb
 
+# Total number of contigs: 4882
+CONTIG = re.compile('Total\snumber\sof\scontigs:\s(\d+)')
+KMER = re.compile('Velvet\shash\svalue:\s(\d+)')
+#n50: 335
+N50 = re.compile('n50:\s(\d+)')
+JOURNAL = 'assemblo-journal.json'
+# VelvetOptimiser processes of running assemblies
+RUNNING = set()
+
 
 def get_args():
     parser = argparse.ArgumentParser(description="""Batch assembly folders of reads
@@ -47,6 +74,18 @@ def get_args():
         default=False,
         help='Choose this flag if you are assembling paired-end data in separate read files'
         )
+    parser.add_argument('--cores',
+        type=int,
+        default=None,
+        help='The number of cores to share among assemblies (default = t, one at a time)')
+    parser.add_argument('--memory',
+        type=float,
+        default=None,
+        help='The memory (GB) to share among assemblies (default = no limit)')
+    parser.add_argument('--memory-factor',
+        type=float,
+        default=4.,
+        help='The memory velvet needs per byte of gzipped reads (default = 4)')
     group = parser.add_mutually_exclusive_group()
     group.add_argument('--exclude',
         type=str,
@@ -77,7 +116,40 @@ def mkdir_p(path):
     return path
 
 
-def assemble_paired_end_reads(args, velvet_optimiser, indiv, read, interleaved_dir):
+def run_velvet_optimiser(cmd, assembly_dir):
+    """run VelvetOptimiser in its own process group, which kill_assemblies
+    can stop (with the velvet processes it starts), returning its output.
+    If it fails, its output is left in assembly_dir/velvet_optimiser.log
+    and IOError is raised with the end of its stderr"""
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            cwd=assembly_dir, preexec_fn=os.setsid)
+    RUNNING.add(proc)
+    try:
+        stdout, stderr = proc.communicate()
+    finally:
+        RUNNING.discard(proc)
+    if proc.returncode != 0:
+        log = os.path.join(assembly_dir, 'velvet_optimiser.log')
+        with open(log, 'w') as outfile:
+            outfile.write(stdout)
+            outfile.write(stderr)
+        tail = ' '.join(stderr.strip().splitlines()[-3:])
+        raise IOError("VelvetOptimiser exited with status {0} (see {1}): {2}".format(
+                proc.returncode, log, tail))
+    return stdout, stderr
+
+
+def kill_assemblies():
+    """stop running assemblies, which threads cannot be made to give up"""
+    for proc in list(RUNNING):
+        try:
+            os.killpg(proc.pid, signal.SIGTERM)
+        except OSError:
+            # already finished
+            pass
+
+
+def assemble_paired_end_reads(args, velvet_optimiser, indiv, read, interleaved_dir, assembly_dir):
     assert is_dir(interleaved_dir), IOError("Directory {} containing interleaved reads does not exist".format(interleaved_dir))
     singletons = os.path.join(
             interleaved_dir,
@@ -89,9 +161,7 @@ def assemble_paired_end_reads(args, velvet_optimiser, indiv, read, interleaved_d
         )
     for f in [singletons, interleaved]:
         assert os.path.isfile(f), IOError("Missing sequence file(s): {0}".format(f))
-    assembly_dir = os.path.join(args.output, indiv, 'assembly')
     mkdir_p(assembly_dir)
-    os.chdir(assembly_dir)
     velveth = "-fastq.gz -shortPaired {} -short {}".format(singletons, interleaved)
     cmd = [velvet_optimiser,
             "-s", args.s,
@@ -101,11 +171,11 @@ def assemble_paired_end_reads(args, velvet_optimiser, indiv, read, interleaved_d
             "-a",
             "-f", velveth
         ]
-    stdout, stderr = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE).communicate()
+    stdout, stderr = run_velvet_optimiser(cmd, assembly_dir)
     return stdout, stderr, assembly_dir
 
 
-def assemble_separate_paired_end_reads(args, velvet_optimiser, indiv, read, paired_dir):
+def assemble_separate_paired_end_reads(args, velvet_optimiser, indiv, read, paired_dir, assembly_dir):
     assert is_dir(paired_dir), IOError("Directory {} containing separate reads does not exist".format(paired_dir))
     singletons = os.path.join(
             paired_dir,
@@ -121,9 +191,7 @@ def assemble_separate_paired_end_reads(args, velvet_optimiser, indiv, read, pair
         )
     for f in [singletons, read1, read2]:
         assert os.path.isfile(f), IOError("Missing sequence file(s): {0}".format(f))
-    assembly_dir = os.path.join(args.output, indiv, 'assembly')
     mkdir_p(assembly_dir)
-    os.chdir(assembly_dir)
     velveth = "-fastq.gz -separate -shortPaired {} {} -short {}".format(read1, read2, singletons)
     cmd = [velvet_optimiser,
             "-s", args.s,
@@ -134,11 +202,11 @@ def assemble_separate_paired_end_reads(args, velvet_optimiser, indiv, read, pair
             "-f", velveth
         ]
     #pdb.set_trace()
-    stdout, stderr = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE).communicate()
+    stdout, stderr = run_velvet_optimiser(cmd, assembly_dir)
     return stdout, stderr, assembly_dir
 
 
-def assemble_single_end_reads(args, velvet_optimiser, indiv, read, singles_dir):
+def assemble_single_end_reads(args, velvet_optimiser, indiv, read, singles_dir, assembly_dir):
     assert is_dir(singles_dir), IOError("Directory {} containing single reads does not exist".format(singles_dir))
     singles = os.path.join(
             singles_dir,
@@ -146,9 +214,7 @@ def assemble_single_end_reads(args, velvet_optimiser, indiv, read, singles_dir):
         )
     for f in [singles]:
         assert os.path.isfile(f), IOError("Missing sequence file(s): {0}".format(f))
-    assembly_dir = os.path.join(args.output, indiv, 'assembly')
     mkdir_p(assembly_dir)
-    os.chdir(assembly_dir)
     velveth = "-fastq.gz -short {}".format(singles)
     cmd = [velvet_optimiser,
             "-s", args.s,
@@ -158,7 +224,7 @@ def assemble_single_end_reads(args, velvet_optimiser, indiv, read, singles_dir):
             "-a",
             "-f", velveth
         ]
-    stdout, stderr = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE).communicate()
+    stdout, stderr = run_velvet_optimiser(cmd, assembly_dir)
     return stdout, stderr, assembly_dir
 
 
@@ -186,51 +252,174 @@ def get_velvet_optimiser(name='VelvetOptimiser'):
         velvet_optimiser = which("{}.pl".format(name))[0]
         return velvet_optimiser
 
+def hash_file(path, size=1 << 20):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as infile:
+        for chunk in iter(lambda: infile.read(size), ''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def get_signatures(paths, previous={}):
+    """return [size, mtime, sha1] for each file, reusing the sha1 of any
+    previous signature of the same size and mtime"""
+    signatures = {}
+    for path in paths:
+        stat = os.stat(path)
+        old = previous.get(path)
+        if old and old[:2] == [stat.st_size, stat.st_mtime]:
+            signatures[path] = old
+        else:
+            signatures[path] = [stat.st_size, stat.st_mtime, hash_file(path)]
+    return signatures
+
+
+def read_journal(journal):
+    """return the last record of each taxon in the journal"""
+    records = {}
+    if os.path.isfile(journal):
+        for line in open(journal):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # a line cut off by a crash
+                continue
+            records[record['taxon']] = record
+    return records
+
+
+def write_journal(journal, record):
+    with open(journal, 'a') as outfile:
+        outfile.write(json.dumps(record, sort_keys=True) + "\n")
+        outfile.flush()
+        os.fsync(outfile.fileno())
+
+
+def is_finished(record, inputs):
+    """return True if a journal record is of an assembly of the same reads
+    (by size and SHA-1) whose contigs still exist"""
+    if not record or record['status'] != 'done' or not os.path.isfile(record['fasta']):
+        return False
+    previous = record['inputs']
+    if sorted(previous) != sorted(inputs):
+        return False
+    current = get_signatures(inputs, previous)
+    return all([current[path][0::2] == previous[path][0::2] for path in inputs])
+
+
+def run_assembly(assembler, args, velvet_optimiser, indiv, read, read_dir, inputs, previous):
+    """assemble a taxon in its own working directory, returning its journal
+    record"""
+    record = {'taxon': indiv}
+    assembly_dir = os.path.join(args.output, indiv, 'assembly')
+    work_dir = "{}-running".format(assembly_dir)
+    try:
+        record['inputs'] = get_signatures(inputs, previous)
+        if os.path.isdir(work_dir):
+            shutil.rmtree(work_dir)
+        stdout, stderr, work_dir = assembler(args, velvet_optimiser, indiv, read, read_dir, work_dir)
+        kmer, contigs, n50 = [get_values(search, stderr) for search in [KMER, CONTIG, N50]]
+        fasta = glob.glob(os.path.join(work_dir, 'auto_data_*/contigs.fa'))[0]
+        if os.path.isdir(assembly_dir):
+            shutil.rmtree(assembly_dir)
+        os.rename(work_dir, assembly_dir)
+        fasta = os.path.join(assembly_dir, os.path.relpath(fasta, work_dir))
+        record.update({'status': 'done', 'kmer': kmer, 'contigs': contigs, 'n50': n50,
+                'fasta': fasta, 'fasta_sha1': hash_file(fasta)})
+    except Exception, e:
+        # one failed taxon should not stop the others; its working
+        # directory is left for inspection, and cleared on a re-run
+        record.update({'status': 'failed', 'message': str(e) or "VelvetOptimiser failed"})
+    return record
+
+
+def get_assembly_job(args, velvet_optimiser, indiv, read, previous):
+    """return a Job to assemble the reads of a taxon, estimating its memory
+    use from the size of its reads, or None if the journal shows the reads
+    are already assembled"""
+    if not args.separate_reads:
+        read_dir = os.path.join(read, 'interleaved-adapter-quality-trimmed')
+    else:
+        read_dir = os.path.join(read, 'split-adapter-quality-trimmed')
+    if not args.single_end and not args.separate_reads:
+        assembler = assemble_paired_end_reads
+    elif not args.single_end and args.separate_reads:
+        assembler = assemble_separate_paired_end_reads
+    else:
+        assembler = assemble_single_end_reads
+    inputs = sorted(glob.glob(os.path.join(read_dir, '*.fastq.gz')))
+    if is_finished(previous, inputs):
+        return None
+    size = get_size(inputs)
+    previous = previous['inputs'] if previous else {}
+    return Job(indiv, run_assembly, (assembler, args, velvet_optimiser, indiv, read, read_dir,
+            inputs, previous), int(args.t), int(args.memory_factor * size * int(args.t)), size)
+
+
+def print_results(args, record, comment=None):
+    if record['status'] == 'done':
+        results = [record['taxon'], record['kmer'], record['contigs'], record['n50']]
+        if results[1] == args.s or results[1] == args.e:
+            results.extend(["kmer at edge of range"])
+    else:
+        # the message may hold commas, quotes, or newlines
+        message = "failed: {}".format(' '.join(record['message'].split()))
+        results = [record['taxon'], '', '', '', '"{}"'.format(message.replace('"', '""'))]
+    if comment:
+        results.append(comment)
+    print "{}".format(','.join(results))
+
+
+def link_contigs(contig_dir, record):
+    fastalink = os.path.join(contig_dir, "{}.contigs.fasta".format(record['taxon']))
+    if os.path.lexists(fastalink):
+        os.remove(fastalink)
+    os.symlink(record['fasta'], fastalink)
+
+
 def main():
     args = get_args()
-    basedir = args.input
     if not args.output:
         args.output = args.input
+    if not args.cores:
+        args.cores = int(args.t)
     contig_dir = mkdir_p(os.path.join(args.output, 'contigs'))
-    # Total number of contigs: 4882
-    contig = re.compile('Total\snumber\sof\scontigs:\s(\d+)')
-    kmer = re.compile('Velvet\shash\svalue:\s(\d+)')
-    #n50: 335
-    n50 = re.compile('n50:\s(\d+)')
+    journal = os.path.join(args.output, JOURNAL)
+    previous = read_journal(journal)
     print "Running...\n"
     print "taxon,opt-kmer,contigs,n50,comments"
     # skip contigs dir that we just added
     reads = [f for f in glob.glob(os.path.join(args.input, '*')) \
-            if os.path.basename(f) != 'contigs']
+            if os.path.basename(f) != 'contigs' and os.path.isdir(f)]
     taxa_to_run = get_samples_to_run(args, reads)
     # find VelvetOptimiser
     velvet_optimiser = get_velvet_optimiser()
+    jobs = []
     for read in reads:
         indiv = os.path.basename(read)
         if indiv in taxa_to_run:
-            if not args.separate_reads:
-                read_dir = os.path.join(read, 'interleaved-adapter-quality-trimmed')
+            job = get_assembly_job(args, velvet_optimiser, indiv, read, previous.get(indiv))
+            if job:
+                jobs.append(job)
             else:
-                read_dir = os.path.join(read, 'split-adapter-quality-trimmed')
-            if not args.single_end and not args.separate_reads:
-                stdout, stderr, assembly_dir = assemble_paired_end_reads(args, velvet_optimiser, indiv, read, read_dir)
-            elif not args.single_end and args.separate_reads:
-                stdout, stderr, assembly_dir = assemble_separate_paired_end_reads(args, velvet_optimiser, indiv, read, read_dir)
-            else:
-                stdout, stderr, assembly_dir = assemble_single_end_reads(args, velvet_optimiser, indiv, read, read_dir)
-            results = [indiv]
-            for search in [kmer, contig, n50]:
-                results.append(get_values(search, stderr))
-            if results[1] == args.s or results[1] == args.e:
-                results.extend(["kmer at edge of range"])
-            print "{}".format(','.join(results))
+                print_results(args, previous[indiv], "assembled previously")
+                link_contigs(contig_dir, previous[indiv])
+    memory = args.memory * 1024 ** 3 if args.memory else None
+    failed = []
+    # assemblies mostly wait on VelvetOptimiser, so threads will do
+    for job, record, error in run_jobs(jobs, args.cores, memory, threads=True, abort=kill_assemblies):
+        if error:
+            record = {'taxon': job.name, 'status': 'failed', 'message': error.strip().splitlines()[-1]}
+        write_journal(journal, record)
+        print_results(args, record)
+        if record['status'] == 'done':
             # symlink assembly contig file
-            #pdb.set_trace()
-            fasta = glob.glob(os.path.join(assembly_dir, 'auto_data_*/contigs.fa'))[0]
-            fastalink = os.path.join(contig_dir, "{}.contigs.fasta".format(indiv))
-            os.symlink(fasta, fastalink)
-            # move up to basedir
-            os.chdir(basedir)
+            link_contigs(contig_dir, record)
+        else:
+            failed.append(job.name)
+    if failed:
+        sys.stderr.write("{0} taxa failed to assemble: {1}\n".format(len(failed), ', '.join(sorted(failed))))
+        sys.exit(1)
 
 if __name__ == '__main__':
     main()
@@ -39,10 +39,16 @@ ends with *.afg.  Must pass UCE match database to compute coverage across
 UCE loci.  Probably you need to be strict about file structure above, as
 dealing with filenames, etc. is rather fragile.
 
+Taxa are run in parallel with --cores.  The match database is read once,
+up front, and the cvgStat output of each taxon is parsed in-process; all
+taxa are written to one CSV, in the order they were found.  An existing
+BNK file is reused if it is newer than its AFG file, and rebuilt if not -
+with --batch, without asking.
+
 Execution:
 
     python get_AMOS_coverage_for_contigs.py ./ results.csv 
-        --db probe.matches.sqlite
+        --db probe.matches.sqlite --batch --cores 8
         
 """
 
@@ -52,6 +58,8 @@ import shutil
 import sqlite3
 import argparse
 import subprocess
+from collections import defaultdict
+from phyluce.scheduler import Job, run_jobs
 
 import pdb
 
@@ -76,45 +84,56 @@ def get_args():
             help='The folder containing contigs')
     parser.add_argument('--db',
             help='Path to the database containing UCE matches')
+    parser.add_argument('--amos',
+            default="/Users/bcf/Source/amos-3.0.0/src/",
+            help='The path to the AMOS source directory')
+    parser.add_argument('--batch',
+            action='store_true',
+            default=False,
+            help='Do not ask before reusing or rebuilding BNK files')
+    parser.add_argument('--cores',
+            type=int,
+            default=1,
+            help='The number of cores to use')
     return parser.parse_args()
 
 
-def create_bnk(amos, infile, bank):
-    print "\tCreating AMOS bnk file..."
-    cmd = [os.path.join(amos, 'Bank/bank-transact'), '-m', infile, '-b', bank, '-c']
+def run(cmd):
     process = subprocess.Popen(cmd, stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE)
-    output = process.communicate()
-    return output
+    return process.communicate()
+
 
+def create_bnk(amos, infile, bank):
+    cmd = [os.path.join(amos, 'Bank/bank-transact'), '-m', infile, '-b', bank, '-c']
+    return run(cmd)
 
-def get_overall_cvg(amos, infile, bank, outfile):
-    print "\tGetting read depth..."
+
+def get_overall_cvg(amos, bank):
     cmd = [os.path.join(amos, 'Validation/analyze-read-depth'), bank, '-d']
-    process = subprocess.Popen(cmd, stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE)
-    stdout, stderr = process.communicate()
-    results = stdout.split()
-    outfile.write("{},{},{},{},".format(infile, results[1], results[2], results[3]))
+    stdout, stderr = run(cmd)
+    return stdout.split()[1:4]
 
 
-def get_cvg_stat(amos, infile, bank):
-    print "\tGetting all loci cvgStat..."
+def get_cvg_stat(amos, bank):
     cmd = [os.path.join(amos, 'Utils/cvgStat'), '-b', bank]
-    process = subprocess.Popen(cmd, stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE)
-    stdout, stderr = process.communicate()
+    stdout, stderr = run(cmd)
     return stdout
 
 
+def get_taxon(fullpath):
+    """return the taxon of an afg file - the name of the directory above
+    auto_data_*/ (and assembly/), as a match_map column"""
+    taxon = os.path.dirname(os.path.dirname(os.path.abspath(fullpath)))
+    if os.path.basename(taxon) == 'assembly':
+        taxon = os.path.dirname(taxon)
+    return os.path.basename(taxon).replace('-', '_')
+
+
 def get_iids_from_cvg_stat(cvg, nodenames, fullpath):
     """parse cvg st output into iid file"""
     d = {}
-    outpath = os.path.dirname(fullpath)
-    taxon = os.path.dirname(os.path.dirname(fullpath)).replace('-', '_')
-    if '/assembly' in taxon:
-        taxon = os.path.dirname(taxon)
-    outfile_name = os.path.join(outpath, "{}.iid".format(taxon))
+    outfile_name = os.path.join(os.path.dirname(fullpath), "{}.iid".format(get_taxon(fullpath)))
     outfile = open(outfile_name, 'w')
     for line in cvg.split('\n'):
         if line.startswith('>'):
@@ -130,76 +149,114 @@ def get_iids_from_cvg_stat(cvg, nodenames, fullpath):
     return outfile_name
 
 
-def get_loci_list(db, fullpath):
-    """Get list of UCE loci for taxon from sqlite"""
-    #pdb.set_trace()
-    outpath = os.path.dirname(fullpath)
-    taxon = os.path.dirname(os.path.dirname(fullpath)).replace('-', '_').strip('./')
-    if '/assembly' in taxon:
-        taxon = os.path.dirname(taxon)
-    outfile = open(os.path.join(outpath, "{}.loci".format(taxon)), 'w')
+def get_loci(db):
+    """Get the UCE loci of every taxon from sqlite, in one pass"""
     conn = sqlite3.connect(db)
     cur = conn.cursor()
+    cur.execute("SELECT * FROM match_map")
+    taxa = [column[0] for column in cur.description]
+    loci = defaultdict(list)
+    for row in cur:
+        for taxon, result in zip(taxa, row):
+            if result is not None:
+                loci[taxon].append(result)
+    conn.close()
+    return loci
+
+
+def write_loci_list(loci, fullpath):
+    """write the UCE loci of a taxon, returning the names of their nodes"""
+    taxon = get_taxon(fullpath)
+    outfile = open(os.path.join(os.path.dirname(fullpath), "{}.loci".format(taxon)), 'w')
     nodenames = []
-    query = "SELECT {0} FROM match_map WHERE {0} IS NOT NULL".format(taxon)
-    for result in cur.execute(query):
-        outfile.write("{}\n".format(result[0]))
-        if result[0].startswith('node'):
-            nodenames.append(result[0].split('_')[1].split('(')[0])
+    for result in loci:
+        outfile.write("{}\n".format(result))
+        if result.startswith('node'):
+            nodenames.append(result.split('_')[1].split('(')[0])
     outfile.close()
-    nodenames = set(nodenames)
-    print "\t{0} distinct UCE loci".format(len(nodenames))
-    return nodenames
+    return set(nodenames)
 
 
-def get_uce_cvg(amos, infile, bank, iid, outfile):
-    print "\tGetting UCE cvgStat..."
+def get_uce_cvg(amos, bank, iid):
     cmd = [os.path.join(amos, 'Validation/analyze-read-depth'), bank, '-d', '-I', iid]
-    process = subprocess.Popen(cmd, stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE)
-    stdout, stderr = process.communicate()
-    stdsplit = stdout.strip().split()
-    #pdb.set_trace()
-    outfile.write("{0},{1},{2}\n".format(stdsplit[1], stdsplit[2], stdsplit[3]))
+    stdout, stderr = run(cmd)
+    return stdout.strip().split()[1:4]
+
+
+def get_coverage(amos, fullpath, bank, rebuild, loci):
+    """(re)build the bank of a taxon if need be, and return its row of
+    coverage results"""
+    if rebuild:
+        if os.path.exists(bank):
+            shutil.rmtree(bank)
+        create_bnk(amos, fullpath, bank)
+    row = [fullpath] + get_overall_cvg(amos, bank)
+    # for UCE loci, get the coverage of those loci, only:
+    if loci is not None:
+        nodenames = write_loci_list(loci, fullpath)
+        iid = get_iids_from_cvg_stat(get_cvg_stat(amos, bank), nodenames, fullpath)
+        row.extend(get_uce_cvg(amos, bank, iid))
+        message = "\t{0} distinct UCE loci".format(len(nodenames))
+    else:
+        row.extend(['', '', ''])
+        message = None
+    return row, message
+
+
+def is_current(bank, fullpath):
+    return os.path.exists(bank) and os.path.getmtime(bank) > os.path.getmtime(fullpath)
+
+
+def ask_to_rebuild(bank):
+    """ask whether to rebuild an existing bnk file, exiting if it should
+    not be used at all"""
+    answer = raw_input("\tBNK file exists, overwrite [Y/n]? ")
+    if answer == "Y":
+        return True
+    answer = raw_input("\tWould you like to proceed" \
+        + " with the existing BNK file [Y/n]? ")
+    if answer != "Y":
+        sys.exit()
+    return False
 
 
 def main():
     args = get_args()
-    amos = "/Users/bcf/Source/amos-3.0.0/src/"
-    args.outfile.write("filename,contigs,bp-in-contigs,contig-coverage,uce-contigs,bp-in-uce-contigs,uce-coverage\n")
+    loci = get_loci(args.db) if args.db else None
+    jobs = []
     for root, dirs, infiles in os.walk(args.contigs):
         for infile in infiles:
             fullpath = os.path.join(root, infile)
             if infile == "velvet_asm.afg":
-                print "Working on {}".format(fullpath)
                 if not args.output:
-                    outdir = root
+                    bank = os.path.join(root, "velvet_asm.bnk")
                 else:
-                    outdir = args.output
-                bank = os.path.join(outdir, "velvet_asm.bnk")
+                    # taxa share the output dir, so need their own banks
+                    bank = os.path.join(args.output, "{}.velvet_asm.bnk".format(get_taxon(fullpath)))
                 # make sure we don't overwrite bnk files when we don't need to
-                if os.path.exists(bank):
-                    answer = raw_input("\tBNK file exists, overwrite [Y/n]? ")
-                    if answer == "Y":
-                        shutil.rmtree(bank)
-                        create_bnk(amos, fullpath, bank)
-                    else:
-                        answer = raw_input("\tWould you like to proceed" \
-                            + " with the existing BNK file [Y/n]? ")
-                        if answer != "Y":
-                            sys.exit()
-                else:
-                    create_bnk(amos, fullpath, bank)
-                # get the coverage
-                get_overall_cvg(amos, fullpath, bank, args.outfile)
-                # for UCE loci, get the coverage of those loci, only:
-                if args.db:
-                    cvg = get_cvg_stat(amos, fullpath, bank)
-                    nodenames = get_loci_list(args.db, fullpath)
-                    iid = get_iids_from_cvg_stat(cvg, nodenames, fullpath)
-                    uce_cvg = get_uce_cvg(amos, infile, bank, iid, args.outfile)                  
+                if not os.path.exists(bank):
+                    rebuild = True
+                elif args.batch:
+                    rebuild = not is_current(bank, fullpath)
                 else:
-                    pass
+                    print "{}".format(fullpath)
+                    rebuild = ask_to_rebuild(bank)
+                taxon_loci = loci.get(get_taxon(fullpath), []) if loci is not None else None
+                jobs.append(Job(len(jobs), get_coverage, (args.amos, fullpath, bank, rebuild, taxon_loci),
+                        size=os.path.getsize(fullpath)))
+    rows = {}
+    for job, result, error in run_jobs(jobs, args.cores, threads=True):
+        if error:
+            print "Failed {}\n{}".format(job.args[1], error)
+            continue
+        row, message = result
+        print "Finished {}".format(row[0])
+        if message:
+            print message
+        rows[job.name] = row
+    args.outfile.write("filename,contigs,bp-in-contigs,contig-coverage,uce-contigs,bp-in-uce-contigs,uce-coverage\n")
+    for index in sorted(rows):
+        args.outfile.write("{}\n".format(','.join(rows[index])))
     args.outfile.close()
 
 if __name__ == '__main__':
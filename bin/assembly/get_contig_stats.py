@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+File: get_contig_stats.py
+Author: Brant Faircloth
+
+Copyright (c) 2012 Brant C. Faircloth. All rights reserved.
+
+Description: Summarize the coverage and length of the contigs of every
+taxon in an assembly directory (output by assemblo.py, in this package):
+
+assemblies/
+    contigs/
+        genus-species-1.contigs.fasta
+        genus-species-2.contigs.fasta
+
+For each taxon, gives the distribution of contig length and of coverage
+for all contigs, for contigs matching UCE loci, and for contigs matching
+UCE loci shared by all taxa, from the match database of
+match_contigs_to_probes.py.  Each contig file is read once, as headers and
+sequence lengths only, and taxa are read in parallel with --cores.
+
+Velvet reports k-mer coverage (cov_ in headers).  Given the mean read
+length (--read-length, or the n-less length stats of process_reads.py in
+--stats), this is converted to read coverage, using the k-mer length of
+the auto_data_<kmer> directory of each assembly (or --kmer).
+
+Execution:
+
+    python get_contig_stats.py assemblies/ probe.matches.sqlite
+        --stats reads/stats --cores 8 --output contig-stats.csv
+
+"""
+
+import os
+import re
+import sys
+import glob
+import sqlite3
+import argparse
+from phyluce.helpers import is_dir, is_file
+from phyluce.scheduler import get_chunks, map_chunks
+from phyluce.contigs import fasta_lengths, get_node, get_coverage, ContigStats, COVERAGE_LIMITS
+
+import pdb
+
+
+KMER = re.compile('auto_data_(\d+)')
+GROUPS = ['all', 'uce', 'shared']
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description="""Summarize contig coverage and
+            length, by taxon, for all, UCE, and shared UCE contigs""")
+    parser.add_argument('assemblies', type=is_dir,
+            help='The assembly directory (or a directory of *.contigs.fasta files)')
+    parser.add_argument('db', type=is_file,
+            help='The database containing match information')
+    parser.add_argument('--output', type=argparse.FileType('w'), default=sys.stdout,
+            help='The output file (CSV)')
+    parser.add_argument('--stats', type=is_dir, default=None,
+            help='The stats directory of process_reads.py, holding n-less read lengths')
+    parser.add_argument('--read-length', dest='read_length', type=float, default=None,
+            help='The mean read length, for taxa without read length stats')
+    parser.add_argument('--kmer', type=int, default=None,
+            help='The k-mer length, for assemblies not in auto_data_<kmer> directories')
+    parser.add_argument('--cores', type=int, default=1,
+            help='The number of cores to use')
+    return parser.parse_args()
+
+
+def get_contig_files(assemblies):
+    """return the contig files of an assembly directory, by taxon (as a
+    match_map column)"""
+    contig_dir = os.path.join(assemblies, 'contigs')
+    if not os.path.isdir(contig_dir):
+        contig_dir = assemblies
+    files = {}
+    for fasta in sorted(glob.glob(os.path.join(contig_dir, '*.contigs.fa*'))):
+        taxon = os.path.basename(fasta).split('.contigs.fa')[0]
+        files[taxon.replace('-', '_')] = fasta
+    return files
+
+
+def get_kmer(fasta):
+    """return the k-mer length of the assembly a contig file links to"""
+    result = KMER.search(os.path.realpath(fasta))
+    if result:
+        return int(result.group(1))
+    return None
+
+
+def get_read_length(stats, fasta, default=None):
+    """return the mean n-less read length of a taxon, from its stats file"""
+    if stats is not None:
+        name = os.path.basename(fasta).split('.')[0].capitalize()
+        try:
+            with open(os.path.join(stats, "{0}.fastq.n-less.lengths".format(name)), 'rU') as infile:
+                line = infile.readline().strip().split(',')
+            if line[0] == 'length':
+                return float(line[1])
+        except (IOError, IndexError, ValueError):
+            pass
+    return default
+
+
+def get_nodes(db, taxa):
+    """return the UCE-matching nodes of each taxon and the subset of those
+    at loci shared by all taxa in the database, reading match_map once"""
+    conn = sqlite3.connect(db)
+    cur = conn.cursor()
+    cur.execute("SELECT * FROM match_map")
+    columns = [column[0] for column in cur.description]
+    present = [taxon for taxon in taxa if taxon in columns]
+    indices = [columns.index(taxon) for taxon in present]
+    nodes = dict([(taxon, set()) for taxon in taxa])
+    shared = dict([(taxon, set()) for taxon in taxa])
+    for row in cur:
+        matches = [row[index] for index in indices]
+        for taxon, match in zip(present, matches):
+            if match is not None:
+                nodes[taxon].add(match.lower().split('(')[0])
+                if None not in matches:
+                    shared[taxon].add(match.lower().split('(')[0])
+    conn.close()
+    return nodes, shared, [taxon for taxon in taxa if taxon not in columns]
+
+
+def get_contig_stats(fasta, nodes, shared):
+    """return the ContigStats of all, UCE, and shared UCE contigs in a
+    contig file"""
+    stats = dict([(group, ContigStats()) for group in GROUPS])
+    with open(fasta, 'rb') as infile:
+        for header, length in fasta_lengths(infile):
+            coverage = get_coverage(header)
+            stats['all'].add(length, coverage)
+            node = get_node(header)
+            if node in nodes:
+                stats['uce'].add(length, coverage)
+                if node in shared:
+                    stats['shared'].add(length, coverage)
+    return stats
+
+
+def worker(work):
+    rows = []
+    for taxon, fasta, nodes, shared, kmer, read_length in work:
+        stats = get_contig_stats(fasta, nodes, shared)
+        # convert k-mer coverage to read coverage
+        if kmer is not None and read_length is not None:
+            scale = read_length / (read_length - kmer + 1)
+        else:
+            scale = 1.
+        row = [taxon, kmer if kmer is not None else '', read_length if read_length is not None else '']
+        for group in GROUPS:
+            row.extend(stats[group].length_summary())
+            row.extend(stats[group].coverage_summary(scale))
+        rows.append(row)
+    return rows
+
+
+def get_header():
+    header = ['taxon', 'kmer', 'read_length']
+    for group in GROUPS:
+        header.extend(["{0}_{1}".format(group, stat) for stat in
+                ['contigs', 'bp', 'len_mean', 'len_95ci', 'len_min', 'len_max', 'len_median',
+                'cov_mean', 'cov_95ci', 'cov_min', 'cov_max', 'cov_median']])
+        header.extend(["{0}_cov_lt_{1}x".format(group, limit) for limit in COVERAGE_LIMITS])
+    return header
+
+
+def main():
+    args = get_args()
+    files = get_contig_files(args.assemblies)
+    if not files:
+        sys.exit("No *.contigs.fasta files in {0}".format(args.assemblies))
+    nodes, shared, missing = get_nodes(args.db, sorted(files))
+    for taxon in missing:
+        sys.stderr.write("{0} is not in the match database\n".format(taxon))
+    work = []
+    for taxon, fasta in sorted(files.iteritems()):
+        kmer = args.kmer if args.kmer is not None else get_kmer(fasta)
+        read_length = get_read_length(args.stats, fasta, args.read_length)
+        work.append((taxon, fasta, nodes[taxon], shared[taxon], kmer, read_length))
+    args.output.write("{0}\n".format(','.join(get_header())))
+    for rows in map_chunks(worker, get_chunks(work, args.cores), args.cores):
+        for row in rows:
+            args.output.write("{0}\n".format(','.join([str(item) for item in row])))
+    args.output.close()
+
+
+if __name__ == '__main__':
+    main()
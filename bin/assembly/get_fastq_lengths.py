@@ -7,16 +7,17 @@ Author: Brant Faircloth
 Created by Brant Faircloth on 21 July 2012 12:07 PDT (-0700)
 Copyright (c) 2012 Brant C. Faircloth. All rights reserved.
 
-Description: 
+Description: Summarize the lengths of the reads in a directory of
+fastq files.  Each file is read in-process (and in parallel with --cores)
+into a histogram of read lengths, from which the summary is computed, so
+memory use does not grow with the number of reads.
 
 """
 import os
-import gzip
 import glob
-import numpy
-import tempfile
 import argparse
-import subprocess
+from phyluce.reads import open_fastq, fastq_lengths, LengthHistogram
+from phyluce.scheduler import map_chunks
 from phyluce.helpers import is_dir, FullPaths
 
 import pdb
@@ -38,47 +39,48 @@ def get_args():
             default=False,
             help="""Give output in CSV"""
         )
+    parser.add_argument(
+            "--cores",
+            type=int,
+            default=1,
+            help="""The number of cores to use.""",
+        )
     return parser.parse_args()
 
 
+def get_lengths(f):
+    fastq = open_fastq(f)
+    histogram = fastq_lengths(fastq)
+    fastq.close()
+    return histogram
+
+
+def get_csv_row(name, lengths):
+    if lengths.reads:
+        return "{},{},{},{},{},{},{},{}".format(name, lengths.reads, lengths.bp, lengths.mean,
+                lengths.std_error, lengths.min, lengths.max, lengths.median)
+    else:
+        return "{},{},{},{},{},{}".format(name, lengths.reads, "Div/0", "Div/0", "Div/0", "Div/0")
+
+
 def main():
     args = get_args()
-    fd, templen = tempfile.mkstemp(suffix='.fqcount')
-    os.close(fd)
-    templen_stdout = open(templen, 'w')
-    for f in glob.glob(os.path.join(args.input, '*.fastq*')):
-        if f.endswith('.gz'):
-            # not secure
-            cmd = "gunzip -c {} | awk '{{if(NR%4==2) print length($1)}}'".format(f)
-        else:
-            # not secure
-            cmd = "cat {} | awk '{{if(NR%4==2) print length($1)}}'".format(f)
-        proc = subprocess.Popen(
-            cmd,
-            stdout=templen_stdout,
-            stderr=subprocess.PIPE,
-            shell=True
-        )
-        stdout, stderr = proc.communicate()
-    templen_stdout.close()
-    if stderr == '':
-        lengths = [int(l.strip()) for l in open(templen, 'rU')]
-    os.remove(templen)
-    lengths = numpy.array(lengths)
-    std_error = numpy.std(lengths, ddof=1) / numpy.sqrt(len(lengths))
+    files = sorted(glob.glob(os.path.join(args.input, '*.fastq*')))
+    lengths = LengthHistogram()
+    for f, histogram in zip(files, map_chunks(get_lengths, files, args.cores)):
+        lengths.merge(histogram)
+        if args.csv:
+            print get_csv_row(os.path.basename(f), histogram)
     if not args.csv:
-        print "Reads:\t\t{:,}".format(len(lengths))
-        print "Bp:\t\t{:,}".format(sum(lengths))
-        print "Avg. len:\t{:,}".format(numpy.average(lengths))
-        print "STDERR len:\t{:,}".format(std_error)
-        print "Min. len:\t{:,}".format(min(lengths))
-        print "Max. len:\t{:,}".format(max(lengths))
-        print "Median len:\t{:,}".format(numpy.median(lengths))
+        print "Reads:\t\t{:,}".format(lengths.reads)
+        print "Bp:\t\t{:,}".format(lengths.bp)
+        print "Avg. len:\t{:,}".format(lengths.mean)
+        print "STDERR len:\t{:,}".format(lengths.std_error)
+        print "Min. len:\t{:,}".format(lengths.min)
+        print "Max. len:\t{:,}".format(lengths.max)
+        print "Median len:\t{:,}".format(lengths.median)
     else:
-        try:
-            print "All files in dir with {},{},{},{},{},{},{},{}".format(os.path.basename(f), len(lengths), sum(lengths), numpy.average(lengths), std_error, min(lengths), max(lengths), numpy.median(lengths))
-        except:
-            print "All files in dir with {},{},{},{},{},{}".format(os.path.basename(f), len(lengths), "Div/0", "Div/0", "Div/0","Div/0")
+        print get_csv_row("All files in dir with {}".format(os.path.basename(files[-1])), lengths)
 
 
 if __name__ == '__main__':
@@ -12,7 +12,8 @@ DESCRIPTION
 
 Pre-process Illumina reads for assembly by renaming, removing adapter
 contamination, quality trimming, removing N-bases, giving some summary
-info on tags, and zipping everything up.
+info on tags, and zipping everything up.  Reads are zipped as BGZF (see
+phyluce.bgzf), using spare cores to compress blocks in parallel.
 
 Assumes that Bin_005.zip has been extracted into a dir of the same name e,g.:
 
@@ -24,6 +25,16 @@ Bin_005/s_7_sequence.txt
 Based on contents of SampleDirectories.csv, it will rename the input files
 w/ their respective "names" as given in SampleDirectories.csv.
 
+With --stream, each sample is run through a single pipeline - raw reads
+are counted and fed to scythe, scythe feeds sickle through a named pipe,
+and sickle's output is N-filtered, measured, and gzipped in-process - so
+that only the zipped reads, stats, and logs are written to disk.  Samples
+are run in parallel within the --cores budget.
+
+Read lengths are kept as histograms and tags as counts, so stats take
+constant memory per sample; both are merged across samples into
+stats/summary.json.
+
 REQUIRES
 ========
 
@@ -37,28 +48,42 @@ USAGE
 
 python process_reads.py --sample-map SamplesDirectories.csv Bin_005
 
+python process_reads.py --sample-map SamplesDirectories.csv --adapters \
+    adapters.fasta --stream --cores 12 Bin_005
+
 """
 
 import os
 import sys
 import glob
-import gzip
-import math
-import numpy
+import time
+import json
 import shutil
 import argparse
-import multiprocessing
+import tempfile
+import threading
+import subprocess
 from collections import Counter
+from phyluce import bgzf
+from phyluce.scheduler import Job, run_jobs
+from phyluce.reads import open_fastq, fastq_blocks, fastq_lengths, prefetch, LengthHistogram
 from seqtools.sequence import fastq
 from seqtools.sequence import transform
 
 import pdb
 
+# names of the samples that failed a step
+FAILED = set()
+
 def get_args():
     parser = argparse.ArgumentParser(description='Parse fastq files and drop reads containing Ns.')
     parser.add_argument('input', help='the input directory containing the reads')
     parser.add_argument('--sample-map', required = True, dest = 'sample_map')
     parser.add_argument('--adapters')
+    parser.add_argument('--stream', action='store_true', default=False,
+        help='Run each sample as a single pipeline, without intermediate files')
+    parser.add_argument('--cores', type=int, default=6,
+        help='The number of cores to share among samples, largest first')
     return parser.parse_args()
 
 def get_tag_names_from_sample_file(sample_directories):
@@ -83,6 +108,24 @@ def make_dirs_and_rename_files(sample_map, tld):
         #pdb.set_trace()
         shutil.move(name, os.path.join(temp_bin, 'raw', real_name))
 
+def schedule(runner, tld, reads, cores, extra = [], job_cores = 1):
+    """run runner over each fastq in tld/reads, largest first, within a
+    budget of cores - returning the results in the order of the files.
+    Samples that fail are reported, recorded in FAILED, and left out of the
+    results"""
+    jobs = []
+    for f in glob.glob(os.path.join(tld, reads,'*.fastq')):
+        name = os.path.basename(f)
+        jobs.append(Job(name, runner, ([tld, name] + extra,), job_cores, size=os.path.getsize(f)))
+    results = {}
+    for job, result, error in run_jobs(jobs, cores):
+        if error:
+            sys.stderr.write("\n{0} failed:\n{1}".format(job.name, error))
+            FAILED.add(job.name)
+        else:
+            results[job.name] = result
+    return [results[job.name] for job in jobs if job.name in results]
+
 def scythe_runner(reads):
     tld, filename, adapters = reads
     inpt = os.path.join(tld, "raw", filename)
@@ -93,11 +136,10 @@ def scythe_runner(reads):
     sys.stdout.flush()
     return
 
-def trim_adapter_sequences(pool, tld, adapters, reads = 'raw'):
+def trim_adapter_sequences(cores, tld, adapters, reads = 'raw'):
     sys.stdout.write("\nTrimming adapter contamination")
     sys.stdout.flush()
-    fastqs = [[tld, os.path.basename(f), adapters] for f in glob.glob(os.path.join(tld, reads,'*.fastq'))]
-    pool.map(scythe_runner, fastqs)
+    schedule(scythe_runner, tld, reads, cores, [adapters])
     return
 
 def sickle_runner(reads):
@@ -110,11 +152,10 @@ def sickle_runner(reads):
     sys.stdout.flush()
     return
 
-def trim_low_qual_reads(pool, tld, reads = 'adapt-trim'):
+def trim_low_qual_reads(cores, tld, reads = 'adapt-trim'):
     sys.stdout.write("\nTrimming low quality reads")
     sys.stdout.flush()
-    fastqs = [[tld, os.path.basename(f)] for f in glob.glob(os.path.join(tld, reads,'*.fastq'))]
-    pool.map(sickle_runner, fastqs)
+    schedule(sickle_runner, tld, reads, cores)
     return
 
 def drop_n_reads_runner(reads):
@@ -133,97 +174,259 @@ def drop_n_reads_runner(reads):
     sys.stdout.flush()
     return
 
-def drop_n_reads(pool, tld, reads = 'qual-trim'):
+def drop_n_reads(cores, tld, reads = 'qual-trim'):
     sys.stdout.write("\nDropping reads containing n-bases")
     sys.stdout.flush()
-    fastqs = [[tld, os.path.basename(f)] for f in glob.glob(os.path.join(tld, reads,'*.fastq'))]
-    pool.map(drop_n_reads_runner, fastqs)
+    schedule(drop_n_reads_runner, tld, reads, cores)
     return
 
-def get_sequence_tags_runner(reads):
-    tld, filename = reads
-    inpt = os.path.join(tld, "raw", filename)
-    outp = open(os.path.join(tld, "stats", filename), 'w')
-    log = open(os.path.join(tld, "stats", "{0}.raw.lengths".format(filename)), 'w')
-    cnt = Counter()
-    lengths = []
-    for read in fastq.FastqReader(inpt):
-        cnt[read.identifier.split('#')[-1].split('/')[0]] += 1
-        lengths.append(len(read.sequence))
+def write_tag_counts(cnt, outf):
+    outp = open(outf, 'w')
     for tag in cnt.keys():
         outp.write("{0},{1},{2}\n".format(tag, cnt[tag], transform.DNA_reverse_complement(tag)))
     outp.close()
-    l = numpy.array(lengths)
-    mean = numpy.mean(l)
-    ci = 1.96 * (numpy.std(l, ddof=1)/math.sqrt(len(l)))
-    log.write("length,{0}\nci,{1}".format(mean, ci))
+
+def write_length_stats(lengths, outf):
+    log = open(outf, 'w')
+    log.write("length,{0}\nci,{1}".format(lengths.mean, lengths.ci))
     log.close()
+
+def count_tags_and_lengths(blocks, cnt, lengths):
+    """count the tags and lengths of blocks of reads, yielding each block"""
+    for block in blocks:
+        ends = block.line_ends()
+        cnt.update(block.tags(ends))
+        lengths.update(block.lengths(ends))
+        yield block
+
+def get_sequence_tags_runner(reads):
+    tld, filename = reads
+    inpt = open_fastq(os.path.join(tld, "raw", filename))
+    cnt = Counter()
+    lengths = LengthHistogram()
+    for block in count_tags_and_lengths(prefetch(fastq_blocks(inpt)), cnt, lengths):
+        pass
+    inpt.close()
+    write_tag_counts(cnt, os.path.join(tld, "stats", filename))
+    write_length_stats(lengths, os.path.join(tld, "stats", "{0}.raw.lengths".format(filename)))
     sys.stdout.write(".")
     sys.stdout.flush()
-    return
+    return filename, cnt, lengths
 
-def get_sequence_tags(pool, tld, reads = 'raw'):
+def get_sequence_tags(cores, tld, reads = 'raw'):
     sys.stdout.write("\nGetting sequence tag counts")
     sys.stdout.flush()
-    fastqs = [[tld, os.path.basename(f)] for f in glob.glob(os.path.join(tld, reads,'*.fastq'))]
-    pool.map(get_sequence_tags_runner, fastqs)
-    return
+    return schedule(get_sequence_tags_runner, tld, reads, cores)
 
 def zip_shit_up_runner(reads):
-    tld, filename = reads
+    tld, filename, threads = reads
     inpt = os.path.join(tld, "n-less", filename)
-    z = gzip.open(os.path.join(tld, "n-less", filename + '.gz'), 'wb')
-    z.writelines(open(inpt, 'rb'))
+    z = bgzf.open(os.path.join(tld, "n-less", filename + '.gz'), 'wb', threads)
+    infile = open(inpt, 'rb')
+    for chunk in iter(lambda: infile.read(bgzf.BLOCK_SIZE * 16), ''):
+        z.write(chunk)
+    infile.close()
     z.close()
     sys.stdout.write(".")
     sys.stdout.flush()
     return
 
-def zip_shit_up(pool, tld, reads = 'n-less'):
+def zip_shit_up(cores, tld, reads = 'n-less'):
     sys.stdout.write("\nZipping shit up")
     sys.stdout.flush()
-    fastqs = [[tld, os.path.basename(f)] for f in glob.glob(os.path.join(tld, reads,'*.fastq'))]
-    pool.map(zip_shit_up_runner, fastqs)
+    fastqs = glob.glob(os.path.join(tld, reads,'*.fastq'))
+    # with fewer files than cores, spare cores compress blocks of each file
+    threads = max(1, cores // max(1, len(fastqs)))
+    schedule(zip_shit_up_runner, tld, reads, cores, [threads], threads)
     return
 
 def get_read_length_stats_runner(reads):
     tld, filename = reads
-    inpt = os.path.join(tld, "n-less", filename)
-    log = open(os.path.join(tld, "stats", "{0}.n-less.lengths".format(filename)), 'w')
-    lengths = []
-    for read in fastq.FastqReader(inpt):
-        lengths.append(len(read.sequence))
-    l = numpy.array(lengths)
-    mean = numpy.mean(l)
-    ci = 1.96 * (numpy.std(l, ddof=1)/math.sqrt(len(l)))
-    log.write("length,{0}\nci,{1}".format(mean, ci))
-    log.close()
+    inpt = open_fastq(os.path.join(tld, "n-less", filename))
+    lengths = fastq_lengths(inpt)
+    inpt.close()
+    write_length_stats(lengths, os.path.join(tld, "stats", "{0}.n-less.lengths".format(filename)))
     sys.stdout.write(".")
     sys.stdout.flush()
-    return
+    return filename, lengths
 
-def get_read_length_stats(pool, tld, reads = 'n-less'):
+def get_read_length_stats(cores, tld, reads = 'n-less'):
     sys.stdout.write("\nGetting trimmed read stats")
     sys.stdout.flush()
-    fastqs = [[tld, os.path.basename(f)] for f in glob.glob(os.path.join(tld, reads,'*.fastq'))]
-    pool.map(get_read_length_stats_runner, fastqs)
-    return
+    return schedule(get_read_length_stats_runner, tld, reads, cores)
+
+def write_summary(tags, n_less, outf):
+    """merge the tag counts and length histograms of samples, writing them
+    and each sample's to a json file"""
+    summary = {'samples': {}}
+    all_tags, all_raw, all_n_less = Counter(), LengthHistogram(), LengthHistogram()
+    for filename, cnt, raw in tags:
+        summary['samples'][filename] = {'tags': dict(cnt), 'raw': raw.summary()}
+        all_tags.update(cnt)
+        all_raw.merge(raw)
+    for filename, lengths in n_less:
+        summary['samples'].setdefault(filename, {})['n-less'] = lengths.summary()
+        all_n_less.merge(lengths)
+    summary.update({'tags': dict(all_tags), 'raw': all_raw.summary(), 'n-less': all_n_less.summary()})
+    with open(outf, 'w') as outfile:
+        json.dump(summary, outfile, indent=2, sort_keys=True)
+
+def feed_raw_reads(inpt, stdin, cnt, lengths, errors):
+    """count tags and lengths of the raw reads while writing them to stdin"""
+    try:
+        infile = open_fastq(inpt)
+        for block in count_tags_and_lengths(fastq_blocks(infile), cnt, lengths):
+            stdin.write(block.data)
+        infile.close()
+    except IOError, e:
+        errors.append(e)
+    finally:
+        stdin.close()
+
+def watch(procs):
+    """reap procs, killing the rest as soon as any one of them fails"""
+    while any([proc.poll() is None for proc in procs]):
+        if any([proc.returncode for proc in procs]):
+            for proc in procs:
+                if proc.returncode is None:
+                    proc.kill()
+        time.sleep(0.1)
+
+def open_fifo(path, writer):
+    """open the read end of a named pipe, without hanging if `writer`
+    exits before opening the other end"""
+    opened = []
+    opener = threading.Thread(target=lambda: opened.append(open(path, 'rb')))
+    opener.daemon = True
+    opener.start()
+    while opener.is_alive():
+        opener.join(0.1)
+        if opener.is_alive() and writer.returncode is not None:
+            try:
+                # release the open with a writer of our own, leaving the
+                # pipe empty
+                os.close(os.open(path, os.O_WRONLY | os.O_NONBLOCK))
+            except OSError:
+                # the opener has yet to reach open()
+                continue
+    return opened[0]
+
+def check_trimmers(trimmers):
+    """raise CalledProcessError for the first of the (proc, cmd) that failed,
+    not the one the watcher killed after it"""
+    failed = [(proc.returncode, ' '.join(cmd)) for proc, cmd in trimmers
+            if proc.returncode != 0]
+    if failed:
+        raise subprocess.CalledProcessError(*max(failed))
+
+def stream_runner(reads):
+    tld, filename, adapters = reads
+    inpt = os.path.join(tld, "raw", filename)
+    outp = os.path.join(tld, "n-less", filename + '.gz')
+    # the trimmers talk through named pipes, so their summaries
+    # (written to stdout) stay out of the reads
+    tmp = tempfile.mkdtemp(dir=os.path.join(tld, "n-less"))
+    adapt_trim = os.path.join(tmp, "adapt-trim.fastq")
+    qual_trim = os.path.join(tmp, "qual-trim.fastq")
+    os.mkfifo(adapt_trim)
+    os.mkfifo(qual_trim)
+    # written beside the pipes, and moved into place only once complete
+    partial = os.path.join(tmp, filename + '.gz')
+    scythe_log = open(os.path.join(tld, "adapt-trim", "{0}.log".format(filename)), 'a')
+    sickle_log = open(os.path.join(tld, "qual-trim", "{0}.log".format(filename)), 'w')
+    scythe = sickle = watcher = feeder = z = None
+    try:
+        scythe_cmd = ['scythe', '-a', adapters, '-o', adapt_trim, '/dev/stdin']
+        scythe = subprocess.Popen(scythe_cmd, stdin=subprocess.PIPE, stdout=scythe_log)
+        sickle_cmd = ['sickle', 'se', '-f', adapt_trim, '-t', 'illumina', '-o', qual_trim,
+                '-q', '20', '-l', '40']
+        sickle = subprocess.Popen(sickle_cmd, stdout=sickle_log, stderr=subprocess.STDOUT)
+        watcher = threading.Thread(target=watch, args=([scythe, sickle],))
+        watcher.start()
+        cnt = Counter()
+        raw_lengths, errors = LengthHistogram(), []
+        feeder = threading.Thread(target=feed_raw_reads,
+                args=(inpt, scythe.stdin, cnt, raw_lengths, errors))
+        feeder.start()
+        lengths = LengthHistogram()
+        z = bgzf.open(partial, 'wb')
+        try:
+            trimmed = open_fifo(qual_trim, sickle)
+            for block in fastq_blocks(trimmed):
+                ends = block.line_ends()
+                keep = ~block.containing('N', ends)
+                z.write(block.records(keep))
+                lengths.update(block.lengths(ends)[keep])
+            trimmed.close()
+        except IOError:
+            # a trimmer that died mid-stream leaves truncated reads; report
+            # the trimmer, and the reads only if both trimmers succeeded
+            watcher.join()
+            check_trimmers(((scythe, scythe_cmd), (sickle, sickle_cmd)))
+            raise
+        z.close()
+        watcher.join()
+        check_trimmers(((scythe, scythe_cmd), (sickle, sickle_cmd)))
+        feeder.join()
+        if errors:
+            raise errors[0]
+        os.rename(partial, outp)
+    finally:
+        # stop whatever is left running, which frees the feeder
+        for proc in (scythe, sickle):
+            if proc is not None and proc.returncode is None:
+                try:
+                    proc.kill()
+                except OSError:
+                    # already reaped by the watcher
+                    pass
+        if watcher is not None:
+            watcher.join()
+        elif scythe is not None:
+            scythe.wait()
+        if feeder is not None:
+            feeder.join()
+        if z is not None:
+            z.close()
+        scythe_log.close()
+        sickle_log.close()
+        shutil.rmtree(tmp)
+    write_tag_counts(cnt, os.path.join(tld, "stats", filename))
+    write_length_stats(raw_lengths, os.path.join(tld, "stats", "{0}.raw.lengths".format(filename)))
+    write_length_stats(lengths, os.path.join(tld, "stats", "{0}.n-less.lengths".format(filename)))
+    sys.stdout.write(".")
+    sys.stdout.flush()
+    return filename, cnt, raw_lengths, lengths
+
+def stream_reads(tld, adapters, cores, reads = 'raw'):
+    sys.stdout.write("\nStreaming reads through trimming, filtering, and zipping")
+    sys.stdout.flush()
+    for d in ['adapt-trim', 'qual-trim', 'n-less', 'stats']:
+        if not os.path.isdir(os.path.join(tld, d)):
+            os.makedirs(os.path.join(tld, d))
+    # each sample keeps scythe, sickle, and python busy
+    results = schedule(stream_runner, tld, reads, cores, [adapters], 3)
+    return [r[:3] for r in results], [(r[0], r[3]) for r in results]
 
 def main():
     args = get_args()
-    # careful here w/ number of procs - zlib/gzip calls eat RAM
-    # because file is read into RAM
-    pool = multiprocessing.Pool(6)
     sample_map = get_tag_names_from_sample_file(args.sample_map)
     #pdb.set_trace()
     #make_dirs_and_rename_files(sample_map, args.input)
-    get_sequence_tags(pool, args.input)
-    trim_adapter_sequences(pool, args.input, args.adapters)
-    trim_low_qual_reads(pool, args.input)
-    drop_n_reads(pool, args.input)
-    zip_shit_up(pool, args.input)
-    get_read_length_stats(pool, args.input)
+    if args.stream:
+        tags, n_less = stream_reads(args.input, args.adapters, args.cores)
+    else:
+        tags = get_sequence_tags(args.cores, args.input)
+        trim_adapter_sequences(args.cores, args.input, args.adapters)
+        trim_low_qual_reads(args.cores, args.input)
+        drop_n_reads(args.cores, args.input)
+        zip_shit_up(args.cores, args.input)
+        n_less = get_read_length_stats(args.cores, args.input)
+    write_summary(tags, n_less, os.path.join(args.input, "stats", "summary.json"))
     print ""
+    if FAILED:
+        sys.stderr.write("{0} sample(s) failed: {1}\n".format(len(FAILED), ', '.join(sorted(FAILED))))
+        sys.exit(1)
     
 if __name__ == '__main__':
     main()
@@ -7,7 +7,11 @@ Author: Brant Faircloth
 Created by Brant Faircloth on 29 March 2012 15:03 PDT (-0700)
 Copyright (c) 2012 Brant C. Faircloth. All rights reserved.
 
-Description: 
+Description: Assemble fake (velvet) contigs from the slices of genomes
+matching UCE probes.  Loci are trimmed and, where several slices match a
+locus, aligned with MUSCLE and reduced to their consensus, in parallel with
+--cores; a single writer then emits the contigs of each taxon, and stores
+their matches and names in the database in one transaction per taxon.
 
 """
 
@@ -22,6 +26,8 @@ import argparse
 from phyluce import lastz
 from operator import itemgetter
 from phyluce.muscle import Align
+from phyluce.alignment import Alignment
+from phyluce.scheduler import get_chunks, map_chunks
 from collections import defaultdict
 from seqtools.sequence import fasta
 from phyluce.helpers import FullPaths, is_dir, is_file, run_checks, snip_if_many_N_bases, get_name
@@ -30,6 +36,9 @@ from phyluce.helpers import FullPaths, is_dir, is_file, run_checks, snip_if_many
 import pdb
 
 
+MANYN = re.compile("[N,n]{20,}")
+
+
 def get_args():
     """Get arguments from CLI"""
     parser = argparse.ArgumentParser(
@@ -89,6 +98,12 @@ def get_args():
             type=is_file,
             help='The path to a lastz file of lastz-against-self results'
         )
+    parser.add_argument(
+            "--cores",
+            type=int,
+            default=1,
+            help="""The number of cores to use.""",
+        )
     return parser.parse_args()
 
 
@@ -266,6 +281,80 @@ def trim_uce_reads(record, flank):
     return record
 
 
+def clean_record(record, locus, flank):
+    """trim a slice to its flanks, and of runs of N, returning it and its
+    name once trimmed to its flanks"""
+    if flank:
+        record = trim_uce_reads(record, flank)
+    name = record.identifier
+    record.sequence = record.sequence.strip('N')
+    # trim many ambiguous bases within contig
+    result = MANYN.search(record.sequence)
+    if result:
+        uce_start, uce_end = get_probe_positions(record)
+        uce = record.sequence[uce_start:uce_end]
+        record.sequence = snip_if_many_N_bases(MANYN, locus, record.sequence, uce, verbose=False)
+    return record, name
+
+
+def assemble_locus(locus, records, strands, flank):
+    """return the (names of slices, orientation, sequence) of the contig of
+    a locus - aligning its slices and taking their consensus when there are
+    several - or None if its slices match in mixed orientation"""
+    if len(records) == 1:
+        record, name = clean_record(records[0], locus, flank)
+        return [name], strands[0], record.sequence
+    orient = list(set(strands))
+    # skip any loci having matches of mixed orientation
+    if len(orient) != 1:
+        return None
+    fd, temp = tempfile.mkstemp(suffix='.fasta')
+    os.close(fd)
+    temp_out = fasta.FastaWriter(temp)
+    names = []
+    for record in records:
+        record, name = clean_record(record, locus, flank)
+        names.append(name)
+        temp_out.write(record)
+    temp_out.close()
+    # assemble - this also removes the tempfile
+    aln = Align(temp)
+    aln.run_alignment()
+    return names, orient[0], Alignment.from_biopython(aln.alignment).consensus()
+
+
+def worker(work):
+    loci, flank = work
+    return [(count, locus, assemble_locus(locus, records, strands, flank))
+            for count, locus, records, strands in loci]
+
+
+def write_loci(results, taxon, fout, conn):
+    """write the contigs of a taxon, in order, storing their matches and
+    names in one transaction.  Returns the number of loci kept."""
+    matches, match_map, contig_map = [], [], []
+    for count, locus, result in results:
+        if count % 1000 == 0:
+            sys.stdout.write('.')
+            sys.stdout.flush()
+        if result is None:
+            continue
+        names, orient, sequence = result
+        record = fasta.FastaSequence()
+        record.sequence = sequence
+        record.identifier = ">Node_{0}_length_{1}_cov_1000".format(count, len(sequence))
+        fout.write(record)
+        matches.append((locus,))
+        match_map.append(("node_{0}({1})".format(count, orient), locus))
+        # keep track of new name :: old name mapping
+        contig_map.extend([(taxon, locus, name, record.identifier) for name in names])
+    with conn:
+        conn.executemany("UPDATE matches SET {0} = 1 WHERE uce = ?".format(taxon), matches)
+        conn.executemany("UPDATE match_map SET {0} = ? WHERE uce = ?".format(taxon), match_map)
+        conn.executemany("INSERT INTO contig_map VALUES (?, ?, ?, ?)", contig_map)
+    return len(matches)
+
+
 def create_probe_database(db, organisms, uces, genome=False):
     """docstring for create_probe_database"""
     conn = sqlite3.connect(db)
@@ -319,7 +408,6 @@ def main():
     args = get_args()
     # compile some regular expressions we'll use later
     stripnum = re.compile("s_[0-9]+$")
-    manyn = re.compile("[N,n]{20,}")
     # get names of loci and taxa
     uces = get_uce_names_from_probes(args.probes)
     taxa = get_taxa_names_from_fastas(args.fasta)
@@ -382,93 +470,16 @@ def main():
         fout_name = os.path.join(args.output, output_name)
         print "\tOutput filename is {}".format(output_name)
         fout = fasta.FastaWriter(fout_name)
-        # this tracks "fake" contig number
-        count = 0
-        # this tracks loci kept
-        kept = 0
+        # number the "fake" contigs of loci, and group loci into chunks
+        loci = [(count, k, v, [m[1] for m in matches[k]])
+                for count, (k, v) in enumerate(seqdict.iteritems())]
+        work = [(chunk, args.flank) for chunk in get_chunks(loci, args.cores)]
         # when > 1 contig, assemble contigs across matches
         sys.stdout.write("\tWriting and Aligning/Assembling UCE loci with multiple probes (dot/1000 loci)")
-        for k, v in seqdict.iteritems():
-            bad = False
-            contig_names = []
-            if count % 1000 == 0:
-                sys.stdout.write('.')
-                sys.stdout.flush()
-            if len(v) == 1:
-                # trim ambiguous bases on flanks
-                record = v[0]
-                orient = [matches[k][0][1]]
-                if args.flank:
-                    record = trim_uce_reads(record, args.flank)
-                contig_names.append(record.identifier)
-                record.sequence = record.sequence.strip('N')
-                # trim many ambiguous bases within contig
-                result = manyn.search(record.sequence)
-                if result:
-                    uce_start, uce_end = get_probe_positions(record)
-                    uce = record.sequence[uce_start:uce_end]
-                    record.sequence = snip_if_many_N_bases(manyn, k, record.sequence, uce, verbose=False)
-                # change header
-                record.identifier = ">Node_{0}_length_{1}_cov_1000".format(
-                        count,
-                        len(record.sequence)
-                    )
-                fout.write(v[0])
-            else:
-                orient = list(set([m[1] for m in matches[k]]))
-                # skip any loci having matches of mixed orientation
-                # ['+', '-']
-                if len(orient) == 1:
-                    # create tempfile for the reads
-                    fd, temp = tempfile.mkstemp(suffix='.fasta')
-                    os.close(fd)
-                    temp_out = fasta.FastaWriter(temp)
-                    # write all slices to outfile, trimming if we want
-                    #pdb.set_trace()
-                    for record in v:
-                        if args.flank:
-                            record = trim_uce_reads(record, args.flank)
-                        # keep names of contigs we assembled to store in db assoc
-                        # w/ resulting assembled contig name
-                        contig_names.append(record.identifier)
-                        record.sequence = record.sequence.strip('N')
-                        # trim many ambiguous bases within contig
-                        result = manyn.search(record.sequence)
-                        if result:
-                            uce_start, uce_end = get_probe_positions(record)
-                            uce = record.sequence[uce_start:uce_end]
-                            record.sequence = snip_if_many_N_bases(manyn, k, record.sequence, uce, verbose=False)
-                        temp_out.write(record)
-                    # make sure to close the file
-                    temp_out.close()
-                    # assemble
-                    aln = Align(temp)
-                    aln.run_alignment()
-                    record = fasta.FastaSequence()
-                    record.sequence = aln.alignment_consensus.tostring()
-                    record.identifier = ">Node_{0}_length_{1}_cov_1000".format(
-                            count,
-                            len(record.sequence)
-                        )
-                    fout.write(record)
-                else:
-                    bad = True
-            if not bad:
-                # track contig assembly and renaming data in db
-                q = "UPDATE matches SET {0} = 1 WHERE uce = '{1}'".format(taxon, k)
-                c.execute(q)
-                # generate db match and match map tables for data
-                orient_key = "node_{0}({1})".format(count, orient[0])
-                q = "UPDATE match_map SET {0} = '{1}' WHERE uce = '{2}'".format(taxon, orient_key, k)
-                c.execute(q)
-                # keep track of new name :: old name mapping
-                for old_name in contig_names:
-                    q = "INSERT INTO contig_map VALUES ('{0}', '{1}', '{2}', '{3}')".format(taxon, k, old_name, record.identifier)
-                    c.execute(q)
-                kept += 1
-            # tracking "fake" contig number
-            count += 1
-        conn.commit()
+        results = (result for chunk in map_chunks(worker, work, args.cores) for result in chunk)
+        kept = write_loci(results, taxon, fout, conn)
+        fout.close()
+        count = len(loci)
         print "\n\t{0} loci of {1} matched ({2:.0f}%), {3} dupes dropped ({4:.0f}%), {5} ({6:.0f}%) kept".format(
             count,
             len(uces),
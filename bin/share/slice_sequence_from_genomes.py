@@ -7,18 +7,25 @@ Author: Brant Faircloth
 Created by Brant Faircloth on 02 April 2012 11:04 PDT (-0700)
 Copyright (c) 2012 Brant C. Faircloth. All rights reserved.
 
-Description: 
+Description: Slice the matches in LASTZ results, with flanks, from their
+genomes.  The matches of each genome are grouped by chromosome and sorted
+by position, and overlapping windows are merged, so that each region of a
+chromosome is decoded from the 2bit file once, in order.  Genomes are
+sliced in parallel with --cores, largest first.
 
 """
 
 import os
 import argparse
 import ConfigParser
+from itertools import izip
+from collections import defaultdict
 
 from phyluce import lastz
 from bx.seq import twobit
 from seqtools.sequence import fasta
 from phyluce.helpers import FullPaths, is_dir, is_file
+from phyluce.scheduler import Job, get_size, run_jobs
 
 #import pdb
 
@@ -65,6 +72,12 @@ def get_args():
             default=None,
             help="""Species to exclude from genome slicing""",
         )
+    parser.add_argument(
+            "--cores",
+            type=int,
+            default=1,
+            help="""The number of cores to use.""",
+        )
     return parser.parse_args()
 
 
@@ -81,16 +94,54 @@ def get_all_files_from_conf(conf, pattern=None):
     return files
 
 
-def slice_and_return_fasta(tb, lz, flank=500):
+def get_windows(rows, lengths, flank=500):
+    """return the flanked (start, end) window of each lastz row, clipped to
+    the length of its chromosome"""
+    return [(max(0, row.zstart1 - flank), min(lengths[row.name1], row.end1 + flank))
+            for row in rows]
+
+
+def get_regions(names, windows):
+    """group windows by chromosome and sort them by position, merging those
+    that overlap into regions.  Returns {chromosome: [[start, end, [indices
+    of windows]], ...]}"""
+    hits = defaultdict(list)
+    for index, (name, window) in enumerate(izip(names, windows)):
+        hits[name].append((window[0], window[1], index))
+    regions = {}
+    for name, chromo_hits in hits.iteritems():
+        merged = []
+        for start, end, index in sorted(chromo_hits):
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+                merged[-1][2].append(index)
+            else:
+                merged.append([start, end, [index]])
+        regions[name] = merged
+    return regions
+
+
+def slice_rows(tb, rows, flank=500):
+    """return the windows and flanked sequences of lastz rows, in order.
+    Chromosome lengths are looked up once, and each merged region is decoded
+    once, in chromosome and position order."""
+    names = [row.name1 for row in rows]
+    lengths = dict([(name, len(tb[name])) for name in set(names)])
+    windows = get_windows(rows, lengths, flank)
+    sequences = [None] * len(rows)
+    regions = get_regions(names, windows)
+    for name in sorted(regions):
+        chromo = tb[name]
+        for start, end, indices in regions[name]:
+            region = chromo[start:end]
+            for index in indices:
+                ss, se = windows[index]
+                sequences[index] = region[ss - start:se - start]
+    return windows, sequences
+
+
+def get_fasta_record(lz, ss, se, sequence):
     record = fasta.FastaSequence()
-    if lz.zstart1 - flank > 0:
-        ss = lz.zstart1 - flank
-    else:
-        ss = 0
-    if lz.end1 + flank < len(tb[lz.name1]):
-        se = lz.end1 + flank
-    else:
-        se = len(tb[lz.name1])
     record.identifier = "{0}|{1}|{2}-{3}|{4}-{5}||{6}|{7}|{8}-{9}".format(
             lz.name1,
             lz.strand1,
@@ -103,31 +154,42 @@ def slice_and_return_fasta(tb, lz, flank=500):
             lz.zstart2,
             lz.end2
         )
-    record.sequence = tb[lz.name1][ss:se]
+    record.sequence = sequence
     return record
 
 
+def slice_genome(twobit_name, lz, out_file, flank=500):
+    """write the flanked slices of a genome matching the rows of a lastz
+    file, in the order of the file, returning the number written"""
+    tb = twobit.TwoBitFile(file(twobit_name))
+    rows = list(lastz.Reader(lz, long_format=True))
+    windows, sequences = slice_rows(tb, rows, flank)
+    out = fasta.FastaWriter(out_file)
+    for row, (ss, se), sequence in izip(rows, windows, sequences):
+        out.write(get_fasta_record(row, ss, se, sequence))
+    out.close()
+    return len(rows)
+
+
 def main():
     args = get_args()
     conf = ConfigParser.ConfigParser()
     conf.optionxform = str
     conf.read(args.conf)
     all_files = get_all_files_from_conf(conf, args.pattern)
-    #pdb.set_trace()
+    jobs = []
     for genome in all_files:
         short_name, long_name, twobit_name = genome
         if not args.exclude or (short_name not in args.exclude):
             out_file = os.path.join(args.output, short_name) + ".fasta"
-            out = fasta.FastaWriter(out_file)
-            tb = twobit.TwoBitFile(file(twobit_name))
             lz = os.path.join(args.lastz, long_name)
-            count = 0
-            for row in lastz.Reader(lz, long_format=True):
-                sequence = slice_and_return_fasta(tb, row, args.flank)
-                out.write(sequence)
-                count += 1
-            print "\t{} sequences written to {}".format(count, out_file)
-            out.close()
+            jobs.append(Job(out_file, slice_genome, (twobit_name, lz, out_file, args.flank),
+                    size=get_size([twobit_name])))
+    for job, count, error in run_jobs(jobs, args.cores):
+        if error:
+            print "\tFailed to write {}\n{}".format(job.name, error)
+        else:
+            print "\t{} sequences written to {}".format(count, job.name)
 
 if __name__ == '__main__':
     main()
@@ -6,14 +6,17 @@ Created by Brant Faircloth on 03 March 2012 14:03 PST (-0800)
 Copyright (c) 2012 Brant C. Faircloth. All rights reserved.
 
 Description:  Given two fastq files of reads, merge those two files
-into a single "shuffled" or "interleaved" file of reads.
+into a single "shuffled" or "interleaved" file of reads.  Reads are
+handled in large blocks of records, which are read (and decompressed) on
+their own threads while pairs are checked and interleaved in bulk.
+Gzipped output is written as BGZF, compressed (and BGZF input
+decompressed) across --cores threads.
 
 """
 
 import sys
 import argparse
-from itertools import izip
-from seqtools.sequence import fastq
+from phyluce.reads import open_fastq, fastq_blocks, prefetch, interleave_blocks
 
 def get_args():
     parser = argparse.ArgumentParser(description="Interleave two split, " + \
@@ -21,26 +24,24 @@ def get_args():
     parser.add_argument("read1", help="The output read1 FASTQ file name")
     parser.add_argument("read2", help="The output read2 FASTQ file name")
     parser.add_argument("output", help="The output fastq file")
+    parser.add_argument("--cores", type=int, default=1, help="The number of cores to use")
     args = parser.parse_args()
     return args
 
 
 def main():
     args = get_args()
-    outfile = fastq.FasterFastqWriter(args.output)
-    read1 = fastq.FasterFastqReader(args.read1)
-    read2 = fastq.FasterFastqReader(args.read2)
+    outfile = open_fastq(args.output, 'wb', args.cores)
+    read1 = open_fastq(args.read1, 'rb', args.cores)
+    read2 = open_fastq(args.read2, 'rb', args.cores)
     rc = 0
     sys.stdout.write("Interleaving reads (1 dot = 10,000 pairs): ")
-    for r1, r2 in izip(read1, read2):
-        assert r1[0].split(" ")[0] == r2[0].split(" ")[0], \
-                "Read FASTQ headers mismatch."
-        outfile.write(r1)
-        outfile.write(r2)
-        if rc != 0 and rc % 10000 == 0:
-            sys.stdout.write(".")
-            sys.stdout.flush()
-        rc += 1
+    blocks = interleave_blocks(prefetch(fastq_blocks(read1)), prefetch(fastq_blocks(read2)))
+    for data, pairs in blocks:
+        outfile.write(data)
+        sys.stdout.write("." * ((rc + pairs) // 10000 - rc // 10000))
+        sys.stdout.flush()
+        rc += pairs
     outfile.close()
     read1.close()
     read2.close()
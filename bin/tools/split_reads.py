@@ -6,7 +6,10 @@ Created by Brant Faircloth on 01 March 2012 22:03 PST (-0800)
 Copyright (c) 2012 Brant C. Faircloth. All rights reserved.
 
 Description:  Split an interleaved fastq file into component read1
-and read 2 parts.
+and read 2 parts.  Reads are handled in large blocks of records, which are
+read (and decompressed) on one thread while pairs are checked and split in
+bulk on another.  Gzipped output is written as BGZF, compressed (and BGZF
+input decompressed) across --cores threads.
 
 Usage:
 
@@ -16,35 +19,30 @@ Usage:
 
 import sys
 import argparse
-from seqtools.sequence import fastq
+from phyluce.reads import open_fastq, fastq_blocks, prefetch, split_blocks
 
 def get_args():
     parser = argparse.ArgumentParser(description='Split an interleaved, paired-end fastq file into two files')
     parser.add_argument('input', help='The input fastq file')
     parser.add_argument('read1', help='The output read1 fastq file name')
     parser.add_argument('read2', help='The output read2 fastq file name')
+    parser.add_argument('--cores', type=int, default=1, help='The number of cores to use')
     args = parser.parse_args()
     return args
 
 def main():
     args = get_args()
-    r1 = fastq.FasterFastqWriter(args.read1)
-    r2 = fastq.FasterFastqWriter(args.read2)
-    # read all of our files into fastq iterators
+    r1 = open_fastq(args.read1, 'wb', args.cores)
+    r2 = open_fastq(args.read2, 'wb', args.cores)
     rc = 0
-    reads = fastq.FasterFastqReader(args.input)
+    reads = open_fastq(args.input, 'rb', args.cores)
     sys.stdout.write("Splitting reads (1 dot = 10,000 pairs): ")
-    for read in reads:
-        if read[0].split(' ')[1].split(':')[0] == '1':
-            r1.write(read)
-            first = read[0].split(' ')[0]
-        else:
-            assert first == read[0].split(' ')[0], "File does not appear interleaved."
-            r2.write(read)
-            if rc != 0 and rc % 10000 == 0:
-                sys.stdout.write('.')
-                sys.stdout.flush()
-            rc += 1
+    for read1, read2, pairs in split_blocks(prefetch(fastq_blocks(reads, multiple=2))):
+        r1.write(read1)
+        r2.write(read2)
+        sys.stdout.write('.' * ((rc + pairs) // 10000 - rc // 10000))
+        sys.stdout.flush()
+        rc += pairs
     print ""
     reads.close()
     r1.close()
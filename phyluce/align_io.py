@@ -0,0 +1,380 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+File: align_io.py
+Author: Brant Faircloth
+
+Copyright (c) 2012 Brant C. Faircloth. All rights reserved.
+
+Description: Native readers and writers for FASTA, NEXUS, and PHYLIP
+alignments.  Files are parsed from their raw bytes straight into the
+array-backed phyluce.alignment.Alignment, and written back out in the same
+layout as BioPython's AlignIO.  Other formats (clustal, emboss, stockholm),
+and the odd NEXUS construct we do not handle natively, are passed through
+BioPython.
+
+"""
+
+import os
+import re
+from Bio import AlignIO
+
+from phyluce.alignment import Alignment
+from phyluce.helpers import get_file_extensions
+
+
+# the formats listed in helpers.get_file_extensions
+FORMATS = ('fasta', 'nexus', 'phylip', 'clustal', 'emboss', 'stockholm')
+
+NEXUS_PUNCTUATION = '()[]{}/\\,;:=*\'"`+-<>'
+NEXUS_WHITESPACE = ' \t\n'
+
+NEXUS_COMMENT = re.compile(r"\[[^\]]*\]")
+NEXUS_BLOCK = re.compile(r"begin\s+(?:data|characters)\s*;(.*?)\bend(?:block)?\s*;", re.I | re.S)
+NEXUS_TAXA = re.compile(r"begin\s+taxa\s*;(.*?)\bend(?:block)?\s*;", re.I | re.S)
+NEXUS_MATRIX = re.compile(r"\bmatrix\b(.*?);", re.I | re.S)
+NEXUS_NTAX = re.compile(r"\bntax\s*=\s*(\d+)", re.I)
+NEXUS_NCHAR = re.compile(r"\bnchar\s*=\s*(\d+)", re.I)
+NEXUS_INTERLEAVE = re.compile(r"\binterleave(?:\s*=\s*(\w+))?", re.I)
+NEXUS_MATCHCHAR = re.compile(r"\bmatchchar\s*=\s*(\S)", re.I)
+
+PHYLIP_HEADER = re.compile(r"^\s*\d+\s+\d+\s*$")
+
+
+class NativeFormatError(Exception):
+    """Raised for input the native parsers leave to BioPython"""
+    pass
+
+
+def _no_records():
+    # use the same message as AlignIO, which the scripts check for
+    return ValueError('No records found in handle')
+
+
+def _parse_fasta(data):
+    if data.startswith('>'):
+        start = 0
+    else:
+        start = data.find('\n>') + 1
+        if start == 0:
+            raise _no_records()
+    names, sequences = [], []
+    for record in data[start + 1:].split('\n>'):
+        title, _, sequence = record.partition('\n')
+        words = title.split(None, 1)
+        names.append(words[0] if words else '')
+        sequences.append(sequence.replace('\n', '').replace('\r', '').replace(' ', ''))
+    return Alignment.from_sequences(names, sequences)
+
+
+def _nexus_word(line):
+    """return the first NEXUS word from a line, stripped of quotes, and the
+    remainder of the line"""
+    first = line[0]
+    if first in "'\"":
+        word, idx = [first], 1
+        while idx < len(line):
+            c = line[idx]
+            idx += 1
+            word.append(c)
+            if c == first:
+                if line[idx:idx + 1] == first:
+                    # doubled quote
+                    idx += 1
+                else:
+                    break
+        word = ''.join(word)
+    elif first in NEXUS_PUNCTUATION:
+        word, idx = first, 1
+    else:
+        idx = 1
+        while idx < len(line) and line[idx] not in NEXUS_PUNCTUATION \
+                and line[idx] not in NEXUS_WHITESPACE:
+            idx += 1
+        word = line[:idx]
+    while (word.startswith("'") and word.endswith("'")) or \
+            (word.startswith('"') and word.endswith('"')):
+        word = word[1:-1]
+    return word, line[idx:]
+
+
+def _nexus_unique_label(labels, label):
+    """rename duplicated taxon labels in the same way as Bio.Nexus"""
+    while label in labels:
+        label_split = label.split('.')
+        if label_split[-1].startswith('copy'):
+            copy_num = 1
+            if label_split[-1] != "copy":
+                copy_num = int(label_split[-1][4:]) + 1
+            label = "%s.copy%s" % ('.'.join(label_split[:-1]), copy_num)
+        else:
+            label += '.copy'
+    return label
+
+
+def _parse_nexus(data):
+    data = NEXUS_COMMENT.sub('', data)
+    block = NEXUS_BLOCK.search(data)
+    if not block:
+        raise _no_records()
+    block = block.group(1)
+    matrix = NEXUS_MATRIX.search(block)
+    if not matrix:
+        raise _no_records()
+    ntax, nchar = NEXUS_NTAX.search(block), NEXUS_NCHAR.search(block)
+    if not ntax:
+        # a characters block takes ntax from the taxa block
+        taxa = NEXUS_TAXA.search(data)
+        ntax = taxa and NEXUS_NTAX.search(taxa.group(1))
+    if not ntax or not nchar:
+        raise NativeFormatError("Missing ntax or nchar")
+    ntax, nchar = int(ntax.group(1)), int(nchar.group(1))
+    interleave = NEXUS_INTERLEAVE.search(block[:matrix.start()])
+    interleave = interleave and (interleave.group(1) or 'yes').lower() != 'no'
+    matchchar = NEXUS_MATCHCHAR.search(block[:matrix.start()])
+    lines = [line.strip() for line in matrix.group(1).splitlines() if line.strip()]
+    names, sequences = [], []
+    lines = iter(lines)
+    taxon = 0
+    for line in lines:
+        name, rest = _nexus_word(line)
+        rest = rest.strip()
+        if interleave:
+            chars = ''.join((rest or next(lines)).split())
+        else:
+            chars = ''.join(rest.split())
+            while len(chars) < nchar:
+                chars += ''.join(next(lines).split())
+        if '(' in chars or '{' in chars:
+            # parenthesized ambiguities
+            raise NativeFormatError("Parenthesized ambiguities")
+        if len(names) < ntax:
+            names.append(_nexus_unique_label(names, name))
+            sequences.append([chars])
+        elif interleave:
+            taxon = taxon % ntax
+            if _nexus_unique_label(names[:taxon], name) != names[taxon]:
+                raise ValueError("Taxon {0} not in first block of interleaved matrix".format(name))
+            sequences[taxon].append(chars)
+            taxon += 1
+        else:
+            raise ValueError("Too many taxa in matrix - should matrix be interleaved?")
+    if len(names) < ntax:
+        raise ValueError("Not enough taxa in matrix.")
+    alignment = Alignment.from_sequences(names, [''.join(seq) for seq in sequences])
+    if matchchar and len(alignment) > 1:
+        # the first taxon holds the reference sequence
+        matches = alignment.matrix[1:] == ord(matchchar.group(1))
+        alignment.matrix[1:][matches] = (alignment.matrix[0] * matches)[matches]
+    return alignment
+
+
+def _parse_phylip(data, relaxed=False):
+    lines = iter(data.splitlines())
+    header = next(lines, '').split()
+    if not header:
+        raise _no_records()
+    if len(header) != 2 or not header[0].isdigit() or not header[1].isdigit():
+        raise ValueError("First line should have two integers")
+    ntax = int(header[0])
+    names, sequences = [], []
+    for idx in xrange(ntax):
+        line = next(lines).rstrip()
+        if relaxed:
+            name, sequence = line.split(None, 1)
+        else:
+            name, sequence = line[:10], line[10:]
+        names.append(name.strip())
+        sequences.append([sequence.strip().replace(' ', '')])
+    # further interleaved blocks
+    taxon = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        if PHYLIP_HEADER.match(line):
+            # the start of a concatenated alignment
+            break
+        sequences[taxon].append(line.strip().replace(' ', ''))
+        taxon = (taxon + 1) % ntax
+    if taxon != 0:
+        raise ValueError("End of file mid-block")
+    sequences = [''.join(seq) for seq in sequences]
+    if '.' in ''.join(sequences):
+        raise ValueError("PHYLIP format no longer allows dots in sequence")
+    return Alignment.from_sequences(names, sequences)
+
+
+READERS = {
+    'fasta': _parse_fasta,
+    'nexus': _parse_nexus,
+    'phylip': _parse_phylip,
+    'phylip-relaxed': lambda data: _parse_phylip(data, relaxed=True),
+}
+
+
+def _check_writable(alignment):
+    if len(alignment) == 0:
+        raise ValueError("Must have at least one sequence")
+    if alignment.get_alignment_length() == 0:
+        raise ValueError("Non-empty sequences are required")
+
+
+def fasta_record(name, sequence, wrap=60):
+    """return a FASTA record with the sequence wrapped at `wrap` characters,
+    which also suits unaligned sequences"""
+    lines = [">{0}".format(name)]
+    lines.extend([sequence[i:i + wrap] for i in xrange(0, len(sequence), wrap)])
+    return '\n'.join(lines) + '\n'
+
+
+def _format_fasta(alignment):
+    return ''.join([fasta_record(name, sequence) for name, sequence in alignment])
+
+
+def nexus_safename(name):
+    """quote taxon names with punctuation or whitespace, and double single
+    quotes, according to the NEXUS standard"""
+    safe = name.replace("'", "''")
+    if set(safe).intersection(set(NEXUS_WHITESPACE + NEXUS_PUNCTUATION)):
+        safe = "'" + safe + "'"
+    return safe
+
+
+def _format_nexus(alignment, datatype='dna', interleave=None, blocksize=70):
+    _check_writable(alignment)
+    ntax, nchar = len(alignment), alignment.get_alignment_length()
+    if interleave is None:
+        # as AlignIO does, interleave long alignments, which MrBayes needs
+        interleave = nchar > 1000
+    names = []
+    for name in alignment.names:
+        # duplicate names are renamed as they are when reading
+        names.append(_nexus_unique_label(names, name))
+    names = [nexus_safename(name) for name in names]
+    width = max([len(name) for name in names]) + 1
+    lines = [
+        '#NEXUS',
+        'begin data;',
+        '\tdimensions ntax={0} nchar={1};'.format(ntax, nchar),
+        '\tformat datatype={0} missing=? gap=-{1};'.format(
+                datatype,
+                ' interleave' if interleave else ''
+            ),
+        'matrix'
+    ]
+    if interleave:
+        for seek in xrange(0, nchar, blocksize):
+            for idx, name in enumerate(names):
+                lines.append(name.ljust(width) + alignment.matrix[idx, seek:seek + blocksize].tostring())
+            lines.append('')
+    else:
+        for idx, name in enumerate(names):
+            lines.append(name.ljust(width) + alignment.sequence(idx))
+    lines.extend([';', 'end;'])
+    return '\n'.join(lines) + '\n'
+
+
+def _format_phylip(alignment, relaxed=False):
+    _check_writable(alignment)
+    names = []
+    for name in alignment.names:
+        name = name.strip()
+        if relaxed and len(name.split()) > 1:
+            raise ValueError("Whitespace not allowed in identifier: {0}".format(name))
+        for char in "[](),":
+            name = name.replace(char, "")
+        for char in ":;":
+            name = name.replace(char, "|")
+        names.append(name)
+    if relaxed:
+        width = max([len(name) for name in alignment.names]) + 1
+    else:
+        width = 10
+    names = [name[:width] for name in names]
+    if len(set(names)) != len(names):
+        raise ValueError("Repeated names, possibly due to truncation")
+    if (alignment.matrix == ord('.')).any():
+        raise ValueError("PHYLIP format no longer allows dots in sequence")
+    ntax, nchar = len(alignment), alignment.get_alignment_length()
+    sequences = [sequence for name, sequence in alignment]
+    lines = [" {0} {1}".format(ntax, nchar)]
+    block = 0
+    while True:
+        # five chunks of ten characters per line
+        chunks = range(block * 50, min(block * 50 + 50, nchar + 1), 10)
+        for name, sequence in zip(names, sequences):
+            line = name.ljust(width) if block == 0 else " " * width
+            lines.append(line + ''.join([" " + sequence[i:i + 10] for i in chunks]))
+        block += 1
+        if block * 50 > nchar:
+            break
+        lines.append('')
+    return '\n'.join(lines) + '\n'
+
+
+WRITERS = {
+    'fasta': _format_fasta,
+    'nexus': _format_nexus,
+    'phylip': _format_phylip,
+    'phylip-relaxed': lambda alignment, **kwargs: _format_phylip(alignment, relaxed=True),
+}
+
+
+def detect_format(filename):
+    """guess the format of an alignment file from its first bytes, falling
+    back to its extension"""
+    with open(filename, 'rb') as infile:
+        head = infile.read(512).lstrip()
+    upper = head.upper()
+    if upper.startswith('#NEXUS'):
+        return 'nexus'
+    elif head.startswith('>'):
+        return 'fasta'
+    elif upper.startswith('CLUSTAL') or upper.startswith('MUSCLE'):
+        return 'clustal'
+    elif upper.startswith('# STOCKHOLM'):
+        return 'stockholm'
+    elif head.startswith('####'):
+        return 'emboss'
+    elif PHYLIP_HEADER.match(head.split('\n', 1)[0]):
+        return 'phylip'
+    extension = os.path.splitext(filename)[1].lower()
+    for ftype in FORMATS:
+        extensions = get_file_extensions(ftype)
+        if isinstance(extensions, basestring):
+            extensions = (extensions,)
+        if extension in extensions:
+            return ftype
+    raise ValueError("Cannot determine the format of {0}".format(filename))
+
+
+def read(filename, format=None):
+    """read an alignment file into an Alignment, detecting the format when
+    `format` is None"""
+    if format is None:
+        format = detect_format(filename)
+    if format in READERS:
+        with open(filename, 'rb') as infile:
+            data = infile.read()
+        try:
+            return READERS[format](data)
+        except NativeFormatError:
+            pass
+    return Alignment.from_biopython(AlignIO.read(filename, format))
+
+
+def to_string(alignment, format, **kwargs):
+    """return an Alignment as a string in `format`.  Keyword arguments
+    (e.g. interleave for nexus) are passed to the native writer."""
+    if format in WRITERS:
+        return WRITERS[format](alignment, **kwargs)
+    return alignment.to_biopython().format(format)
+
+
+def write(alignment, handle, format, **kwargs):
+    """write an Alignment to a filename or an open handle in `format`"""
+    if isinstance(handle, basestring):
+        with open(handle, 'wb') as outfile:
+            outfile.write(to_string(alignment, format, **kwargs))
+    else:
+        handle.write(to_string(alignment, format, **kwargs))
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+File: align_screen.py
+Author: Brant Faircloth
+
+Copyright (c) 2012 Brant C. Faircloth. All rights reserved.
+
+Description: Screen alignments for problem bases - runs of 3 or more N
+and X-bases - by scanning their raw bytes with precompiled patterns.
+Every file is parsed, so that malformed alignments are reported, but only
+files in which a pattern matches are screened taxon by taxon, so screening
+a large set of clean alignments costs little more than reading them.
+
+"""
+
+import os
+import re
+import shutil
+
+from phyluce import align_io
+from phyluce.scheduler import get_chunks, map_chunks
+
+
+# may match across line breaks (and in taxon names), so a match only means
+# the file must be screened
+SCREEN_N = re.compile(r"N\s*N\s*N")
+# X-bases outside of fasta headers
+SCREEN_X = re.compile(r"^[^>\n]*[Xx]", re.M)
+NEXUS_MATRIX = re.compile(r"\bmatrix\b", re.I)
+
+
+def _sequence_start(data, input_format):
+    """return the position in the raw bytes of a file after which sequence
+    data may occur, or None if the file should be parsed regardless"""
+    if input_format == 'nexus':
+        matrix = NEXUS_MATRIX.search(data)
+        return matrix.end() if matrix else None
+    elif input_format == 'fasta':
+        return 0 if data.startswith('>') else None
+    elif input_format in ('phylip', 'phylip-relaxed'):
+        line_end = data.find('\n')
+        if line_end != -1 and align_io.PHYLIP_HEADER.match(data[:line_end]):
+            return line_end
+    return None
+
+
+def screen_alignment(aln):
+    """return lists of (taxon, [lengths of runs of 3 or more N]) and of
+    (taxon, number of X-bases) for the taxa of an alignment having them"""
+    rows, starts, lengths, terminal = aln.runs('N')
+    n_runs = {}
+    for row, length in zip(rows[lengths >= 3].tolist(), lengths[lengths >= 3].tolist()):
+        n_runs.setdefault(row, []).append(length)
+    x_bases = aln.is_in('Xx').sum(axis=1)
+    return (
+            [(aln.names[row], n_runs[row]) for row in sorted(n_runs)],
+            [(aln.names[row], int(x_bases[row])) for row in x_bases.nonzero()[0]]
+        )
+
+
+def screen_file(path, input_format=None):
+    """screen an alignment file, returning its N-runs and X-bases as
+    screen_alignment() does.  Files that cannot be parsed raise ValueError;
+    those in which neither pattern matches are not screened."""
+    if input_format is None:
+        input_format = align_io.detect_format(path)
+    with open(path, 'rb') as infile:
+        data = infile.read()
+    aln = None
+    if input_format in align_io.READERS:
+        try:
+            aln = align_io.READERS[input_format](data)
+        except align_io.NativeFormatError:
+            pass
+    if aln is None:
+        aln = align_io.read(path, input_format)
+    start = _sequence_start(data, input_format)
+    if start is not None and not SCREEN_N.search(data, start) and not SCREEN_X.search(data, start):
+        return [], []
+    return screen_alignment(aln)
+
+
+def _screen_worker(work):
+    paths, input_format = work
+    results = []
+    for path in paths:
+        try:
+            n_runs, x_bases = screen_file(path, input_format)
+            results.append((path, None, n_runs, x_bases))
+        except ValueError, e:
+            results.append((path, e.message, [], []))
+    return results
+
+
+def screen_files(paths, input_format=None, cores=1):
+    """yield (path, error, n_runs, x_bases) for each file, in order,
+    screening chunks of files across `cores` processes"""
+    work = [(chunk, input_format) for chunk in get_chunks(paths, cores)]
+    for results in map_chunks(_screen_worker, work, cores):
+        for result in results:
+            yield result
+
+
+def copy_file(src, output, link=False):
+    """copy a file into the output directory, or hardlink it there if
+    `link` (copying when it cannot be linked, e.g. across filesystems)"""
+    dst = os.path.join(output, os.path.basename(src))
+    if link:
+        try:
+            if os.path.exists(dst):
+                os.remove(dst)
+            os.link(src, dst)
+            return dst
+        except OSError:
+            pass
+    shutil.copy(src, dst)
+    return dst
@@ -0,0 +1,448 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+File: align_stats.py
+Author: Brant Faircloth
+
+Copyright (c) 2012 Brant C. Faircloth. All rights reserved.
+
+Description: Compute the statistics the alignment summary and screening
+programs need - lengths, taxon counts, informative and variable sites,
+base composition, missing data, runs of N, and X-bases - in a single pass
+over a directory of alignments.  Results for each alignment are kept in
+an AlignmentStats accumulator, which can be merged with the accumulators
+of other workers and stored in (or loaded from) a sqlite database so that
+programs can query it rather than reading the alignments again.  The
+database records the modification time and size of each file, so it is
+refreshed incrementally: only new or changed files are read again.  By
+default a directory's database is a catalog kept alongside its alignments.
+
+"""
+
+import os
+import re
+import numpy
+import sqlite3
+from collections import namedtuple, defaultdict, Counter
+
+from phyluce import align_io
+from phyluce.scheduler import get_chunks, map_chunks
+
+
+Locus = namedtuple('Locus', 'locus,path,length,taxa,empty_taxa,characters,' +
+        'informative,variable,gaps,missing,ambiguities,trimmed,n_runs,x_bases')
+Taxon = namedtuple('Taxon', 'locus,idx,taxon,bases,gaps,missing,ambiguities,' +
+        'trimmed,empty,n_runs,x_bases')
+
+# columns of Locus that are summed across alignments
+TOTALS = ('length', 'taxa', 'empty_taxa', 'characters', 'informative',
+        'variable', 'gaps', 'missing', 'ambiguities', 'trimmed', 'n_runs',
+        'x_bases')
+
+N_RUNS = re.compile("N{3,}")
+
+# the name of the sidecar database in an alignment directory
+CATALOG = '.alignment-stats.sqlite'
+
+
+def get_catalog(input_dir):
+    """return the path of the statistics catalog of an alignment directory"""
+    return os.path.join(input_dir, CATALOG)
+
+
+def get_signature(path):
+    """return the (modification time, size) of a file, which changes when
+    the file does"""
+    info = os.stat(path)
+    return (info.st_mtime, info.st_size)
+
+
+def get_informative_sites(counts):
+    # a site is informative when >= 2 characters each occur >= 2 times
+    return (counts >= 2).sum(axis=0) >= 2
+
+
+def get_differences(counts):
+    # a site differs when >= 2 characters occur
+    return (counts > 0).sum(axis=0) >= 2
+
+
+def compute_locus(path, input_format=None):
+    """return the Locus, Taxon rows, and base counts for an alignment file"""
+    aln = align_io.read(path, input_format)
+    name, length = os.path.basename(path), aln.get_alignment_length()
+    # count characters in every column, ignoring gaps, N, and ?
+    characters, counts = aln.character_counts(exclude='-N?')
+    gaps = (aln.matrix == ord('-')).sum(axis=1)
+    missing = (aln.matrix == ord('?')).sum(axis=1)
+    ambiguities = aln.is_in('Nn').sum(axis=1)
+    x_bases = aln.is_in('Xx').sum(axis=1)
+    empty = aln.rows_only('-') | aln.rows_only('?')
+    # leading and trailing gaps
+    start, end = aln.ends('-')
+    trimmed = start + (length - end)
+    taxa = []
+    for idx, (taxon, sequence) in enumerate(aln):
+        n_runs = ','.join([str(len(run)) for run in N_RUNS.findall(sequence)])
+        taxa.append(Taxon(
+                name,
+                idx,
+                taxon,
+                int(length - gaps[idx] - missing[idx]),
+                int(gaps[idx]),
+                int(missing[idx]),
+                int(ambiguities[idx]),
+                int(trimmed[idx]),
+                int(empty[idx]),
+                n_runs,
+                int(x_bases[idx])
+            ))
+    locus = Locus(
+            name,
+            path,
+            length,
+            len(aln),
+            int(empty.sum()),
+            # columns holding something other than ?, n, N, -
+            int((~aln.is_in('?nN-')).any(axis=0).sum()),
+            int(get_informative_sites(counts).sum()),
+            int(get_differences(counts).sum()),
+            int(gaps.sum()),
+            int(missing.sum()),
+            int(ambiguities.sum()),
+            int(trimmed.sum()),
+            sum([len(taxon.n_runs.split(',')) for taxon in taxa if taxon.n_runs]),
+            int(x_bases.sum())
+        )
+    base_counts = numpy.bincount(aln.upper().matrix.ravel(), minlength=256)
+    bases = dict([(chr(code), int(base_counts[code])) for code in numpy.flatnonzero(base_counts)])
+    return locus, taxa, bases
+
+
+class AlignmentStats(object):
+    """Per-alignment statistics, keyed by absolute path, along with their
+    running totals.  Accumulators built over different files merge with
+    merge()."""
+    def __init__(self):
+        self.loci = {}
+        self.taxa = {}
+        self.bases = {}
+        self.errors = {}
+        # path: signature of the file when it was read
+        self.signatures = {}
+        self.totals = Counter()
+        self.base_totals = Counter()
+
+    def __len__(self):
+        return len(self.loci) + len(self.errors)
+
+    def __contains__(self, path):
+        path = os.path.abspath(path)
+        return path in self.loci or path in self.errors
+
+    def add(self, locus, taxa, bases):
+        path = os.path.abspath(locus.path)
+        self.remove(path)
+        self.loci[path] = locus
+        self.taxa[path] = taxa
+        self.bases[path] = bases
+        self.totals.update(dict([(column, getattr(locus, column)) for column in TOTALS]))
+        self.totals['loci'] += 1
+        self.base_totals.update(bases)
+
+    def add_error(self, path, message):
+        path = os.path.abspath(path)
+        self.remove(path)
+        self.errors[path] = message
+
+    def add_file(self, path, input_format=None):
+        signature = get_signature(path)
+        try:
+            self.add(*compute_locus(path, input_format))
+        except ValueError, e:
+            self.add_error(path, e.message)
+        self.signatures[os.path.abspath(path)] = signature
+
+    def remove(self, path):
+        path = os.path.abspath(path)
+        if path in self.loci:
+            locus = self.loci.pop(path)
+            self.totals.subtract(dict([(column, getattr(locus, column)) for column in TOTALS]))
+            self.totals['loci'] -= 1
+            self.base_totals.subtract(self.bases.pop(path))
+            del self.taxa[path]
+        self.errors.pop(path, None)
+        self.signatures.pop(path, None)
+
+    def merge(self, other):
+        """fold the results of another accumulator into this one"""
+        for path in other.loci.keys() + other.errors.keys():
+            if path in self:
+                self.remove(path)
+        self.loci.update(other.loci)
+        self.taxa.update(other.taxa)
+        self.bases.update(other.bases)
+        self.errors.update(other.errors)
+        self.signatures.update(other.signatures)
+        self.totals.update(other.totals)
+        self.base_totals.update(other.base_totals)
+        return self
+
+    def get_locus(self, path):
+        return self.loci[os.path.abspath(path)]
+
+    def get_taxa(self, path):
+        return self.taxa[os.path.abspath(path)]
+
+    def get_bases(self, path):
+        return self.bases[os.path.abspath(path)]
+
+    def get_error(self, path):
+        return self.errors.get(os.path.abspath(path))
+
+    def save(self, db):
+        """write the statistics to a sqlite database, replacing any results
+        for the same files"""
+        conn = sqlite3.connect(db)
+        c = conn.cursor()
+        create_stats_tables(c)
+        delete_rows(c, self.loci.keys() + self.errors.keys())
+        c.executemany(
+                "INSERT INTO loci VALUES ({0})".format(','.join('?' * len(Locus._fields))),
+                [tuple(locus._replace(path=path)) for path, locus in self.loci.iteritems()]
+            )
+        c.executemany(
+                "INSERT INTO taxa VALUES (?,{0})".format(','.join('?' * len(Taxon._fields))),
+                [(path,) + tuple(taxon) for path, taxa in self.taxa.iteritems() for taxon in taxa]
+            )
+        c.executemany(
+                "INSERT INTO bases VALUES (?,?,?)",
+                [(path, base, count) for path, bases in self.bases.iteritems()
+                    for base, count in bases.iteritems()]
+            )
+        c.executemany("INSERT INTO errors VALUES (?,?)", self.errors.items())
+        c.executemany(
+                "INSERT INTO files VALUES (?,?,?)",
+                [(path,) + signature for path, signature in self.signatures.iteritems()]
+            )
+        conn.commit()
+        conn.close()
+
+    @classmethod
+    def load(cls, db, paths=None):
+        """read statistics from a sqlite database, optionally only those
+        for the files in `paths`"""
+        stats = cls()
+        if not os.path.exists(db):
+            return stats
+        conn = sqlite3.connect(db)
+        conn.text_factory = str
+        c = conn.cursor()
+        create_stats_tables(c)
+        # select the files wanted with a join, rather than a query per file
+        c.execute("CREATE TEMP TABLE wanted (path text PRIMARY KEY)")
+        if paths is None:
+            c.execute("INSERT INTO wanted SELECT path FROM loci UNION SELECT path FROM errors")
+        else:
+            c.executemany("INSERT OR IGNORE INTO wanted VALUES (?)",
+                    [(os.path.abspath(path),) for path in paths])
+        taxa, bases = defaultdict(list), defaultdict(dict)
+        for row in c.execute("SELECT taxa.* FROM taxa JOIN wanted USING (path) ORDER BY path, idx"):
+            taxa[row[0]].append(Taxon(*row[1:]))
+        for path, base, count in c.execute("SELECT bases.* FROM bases JOIN wanted USING (path)"):
+            bases[path][base] = count
+        for locus in c.execute("SELECT loci.* FROM loci JOIN wanted USING (path)").fetchall():
+            locus = Locus(*locus)
+            stats.add(locus, taxa[locus.path], bases[locus.path])
+        for path, message in c.execute("SELECT errors.* FROM errors JOIN wanted USING (path)").fetchall():
+            stats.add_error(path, message)
+        conn.close()
+        return stats
+
+    @staticmethod
+    def stored_paths(db):
+        """return the set of files with statistics in a sqlite database"""
+        if not os.path.exists(db):
+            return set()
+        conn = sqlite3.connect(db)
+        c = conn.cursor()
+        create_stats_tables(c)
+        paths = set([row[0] for row in c.execute("SELECT path FROM loci UNION SELECT path FROM errors")])
+        conn.close()
+        return paths
+
+    @staticmethod
+    def stored_signatures(db):
+        """return a dict of the files with statistics in a sqlite database
+        and their signatures when they were read"""
+        if not os.path.exists(db):
+            return {}
+        conn = sqlite3.connect(db)
+        c = conn.cursor()
+        create_stats_tables(c)
+        signatures = dict([(path, (mtime, size)) for path, mtime, size in
+                c.execute("SELECT path, mtime, size FROM files")])
+        conn.close()
+        return signatures
+
+    @staticmethod
+    def delete(db, paths):
+        """remove the statistics for `paths` from a sqlite database"""
+        conn = sqlite3.connect(db)
+        c = conn.cursor()
+        create_stats_tables(c)
+        delete_rows(c, paths)
+        conn.commit()
+        conn.close()
+
+
+class RunningStats(object):
+    """Count, sum, sum of squares, minimum, and maximum (and, optionally, a
+    histogram) of a stream of values, kept in constant memory.  Partial
+    results from different workers combine with merge()."""
+    def __init__(self, histogram=False):
+        self.n = 0
+        self.total = 0
+        self.sumsq = 0
+        self.min = None
+        self.max = None
+        self.histogram = Counter() if histogram else None
+
+    def add(self, value):
+        self.n += 1
+        self.total += value
+        self.sumsq += value * value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        if self.histogram is not None:
+            self.histogram[value] += 1
+
+    def merge(self, other):
+        if other.n:
+            self.n += other.n
+            self.total += other.total
+            self.sumsq += other.sumsq
+            if self.min is None or other.min < self.min:
+                self.min = other.min
+            if self.max is None or other.max > self.max:
+                self.max = other.max
+        if self.histogram is not None and other.histogram is not None:
+            self.histogram.update(other.histogram)
+        return self
+
+    def mean(self):
+        if not self.n:
+            return float('nan')
+        return self.total / float(self.n)
+
+    def std(self, ddof=0):
+        # nan, as numpy.std gives, without enough values
+        if self.n <= ddof:
+            return float('nan')
+        # exact for integer values, whose sums do not lose precision
+        variance = (self.n * self.sumsq - self.total * self.total) / \
+                float(self.n * (self.n - ddof))
+        return numpy.sqrt(max(variance, 0.))
+
+
+def create_stats_tables(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS loci (
+            locus text,
+            path text PRIMARY KEY,
+            length int,
+            taxa int,
+            empty_taxa int,
+            characters int,
+            informative int,
+            variable int,
+            gaps int,
+            missing int,
+            ambiguities int,
+            trimmed int,
+            n_runs int,
+            x_bases int
+        )'''
+    )
+    c.execute('''CREATE TABLE IF NOT EXISTS taxa (
+            path text,
+            locus text,
+            idx int,
+            taxon text,
+            bases int,
+            gaps int,
+            missing int,
+            ambiguities int,
+            trimmed int,
+            empty int,
+            n_runs text,
+            x_bases int
+        )'''
+    )
+    c.execute('''CREATE TABLE IF NOT EXISTS bases (
+            path text,
+            base text,
+            count int
+        )'''
+    )
+    c.execute('''CREATE TABLE IF NOT EXISTS errors (
+            path text PRIMARY KEY,
+            message text
+        )'''
+    )
+    c.execute('''CREATE TABLE IF NOT EXISTS files (
+            path text PRIMARY KEY,
+            mtime real,
+            size int
+        )'''
+    )
+    c.execute("CREATE INDEX IF NOT EXISTS taxa_path_idx ON taxa(path)")
+    c.execute("CREATE INDEX IF NOT EXISTS bases_path_idx ON bases(path)")
+
+
+def delete_rows(c, paths):
+    paths = [(os.path.abspath(path),) for path in paths]
+    for table in ['loci', 'taxa', 'bases', 'errors', 'files']:
+        c.executemany("DELETE FROM {0} WHERE path = ?".format(table), paths)
+
+
+def _stats_worker(work):
+    paths, input_format = work
+    stats = AlignmentStats()
+    for path in paths:
+        stats.add_file(path, input_format)
+    return stats
+
+
+def compute_stats(paths, input_format=None, cores=1):
+    """compute statistics for alignment files, in chunks of files across
+    `cores` processes, merging the results of each chunk"""
+    stats = AlignmentStats()
+    work = [(chunk, input_format) for chunk in get_chunks(paths, cores)]
+    for result in map_chunks(_stats_worker, work, cores):
+        stats.merge(result)
+    return stats
+
+
+def update_stats(paths, db, input_format=None, cores=1):
+    """compute and store the statistics for files that are new, or have
+    changed, since they were stored in `db`, saving each chunk as it
+    finishes.  Files that no longer exist are dropped from `db`."""
+    stored = AlignmentStats.stored_signatures(db)
+    removed = [path for path in stored if not os.path.exists(path)]
+    if removed:
+        AlignmentStats.delete(db, removed)
+    stale = [path for path in paths if stored.get(os.path.abspath(path)) != get_signature(path)]
+    work = [(chunk, input_format) for chunk in get_chunks(stale, cores)]
+    for result in map_chunks(_stats_worker, work, cores):
+        result.save(db)
+
+
+def get_stats(paths, input_format=None, cores=1, db=None):
+    """return statistics for alignment files, taking those already stored in
+    `db` from the database and computing (and storing) the rest"""
+    if db is None:
+        return compute_stats(paths, input_format, cores)
+    update_stats(paths, db, input_format, cores)
+    return AlignmentStats.load(db, paths)
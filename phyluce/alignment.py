@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+File: alignment.py
+Author: Brant Faircloth
+
+Copyright (c) 2012 Brant C. Faircloth. All rights reserved.
+
+Description: A compact, array-backed alignment class.  Taxon names are
+kept in a list and the alignment characters in a contiguous (taxa x columns)
+matrix of uint8 character codes, so that rows and columns can be sliced
+without copying and per-column work can be done across the whole matrix
+at once.
+
+"""
+
+import numpy
+from Bio.Seq import Seq
+from Bio.SeqRecord import SeqRecord
+from Bio.Alphabet import IUPAC, Gapped
+from Bio.Align import MultipleSeqAlignment
+
+
+def encode(characters):
+    """return the uint8 codes for a string of characters"""
+    return numpy.frombuffer(bytearray(characters), dtype=numpy.uint8)
+
+
+class Alignment(object):
+    """Taxon names plus a (taxa x columns) uint8 matrix of characters"""
+    def __init__(self, names, matrix):
+        if matrix.ndim != 2 or matrix.shape[0] != len(names):
+            raise ValueError("The matrix must have one row per taxon name")
+        self.names = list(names)
+        self.matrix = matrix
+
+    @classmethod
+    def from_sequences(cls, names, sequences):
+        """create an alignment from lists of names and sequence strings"""
+        names, sequences = list(names), [str(seq) for seq in sequences]
+        if len(set([len(seq) for seq in sequences])) > 1:
+            raise ValueError("Sequences must all be the same length")
+        length = len(sequences[0]) if sequences else 0
+        matrix = encode(''.join(sequences)).copy()
+        return cls(names, matrix.reshape(len(sequences), length))
+
+    @classmethod
+    def from_biopython(cls, alignment):
+        """create an alignment from a biopython MultipleSeqAlignment"""
+        return cls.from_sequences(
+                [record.id for record in alignment],
+                [str(record.seq) for record in alignment]
+            )
+
+    def to_biopython(self, alphabet=Gapped(IUPAC.ambiguous_dna, "-")):
+        """return the alignment as a biopython MultipleSeqAlignment"""
+        records = [SeqRecord(Seq(seq, alphabet), id=name, name=name, description=name)
+                for name, seq in self]
+        return MultipleSeqAlignment(records, alphabet)
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def __iter__(self):
+        for idx, name in enumerate(self.names):
+            yield name, self.sequence(idx)
+
+    def __getitem__(self, index):
+        """slice rows (``aln[1:4]``) or rows and columns (``aln[:, 10:50]``),
+        returning a new alignment that shares the underlying matrix"""
+        if isinstance(index, tuple):
+            rows, columns = index
+        else:
+            rows, columns = index, slice(None)
+        if not isinstance(rows, slice) or not isinstance(columns, slice):
+            raise TypeError("Alignments are sliced with slices; use row() or column()")
+        return Alignment(self.names[rows], self.matrix[rows, columns])
+
+    def get_alignment_length(self):
+        return self.matrix.shape[1]
+
+    def copy(self):
+        return Alignment(self.names, self.matrix.copy())
+
+    def row(self, idx):
+        """return a view of the character codes of a row"""
+        return self.matrix[idx]
+
+    def column(self, idx):
+        """return a view of the character codes of a column"""
+        return self.matrix[:, idx]
+
+    def sequence(self, idx):
+        """return a row as a string"""
+        return self.matrix[idx].tostring()
+
+    def index(self, name):
+        return self.names.index(name)
+
+    def select(self, rows):
+        """return a new alignment holding only the rows given by index or mask"""
+        rows = numpy.asarray(rows)
+        if rows.dtype == bool:
+            rows = numpy.flatnonzero(rows)
+        return Alignment([self.names[i] for i in rows], self.matrix[rows])
+
+    def is_in(self, characters):
+        """return a boolean matrix, True where the character is in `characters`"""
+        return numpy.in1d(self.matrix, encode(characters)).reshape(self.matrix.shape)
+
+    def mask(self, mask, character='?'):
+        """return a copy of the alignment with positions where `mask` is True
+        replaced by `character`"""
+        masked = self.copy()
+        masked.matrix[mask] = ord(character)
+        return masked
+
+    def upper(self):
+        """return a copy of the alignment in upper case"""
+        upper = self.copy()
+        lower = (upper.matrix >= ord('a')) & (upper.matrix <= ord('z'))
+        upper.matrix[lower] -= 32
+        return upper
+
+    def lower(self):
+        """return a copy of the alignment in lower case"""
+        lower = self.copy()
+        upper = (lower.matrix >= ord('A')) & (lower.matrix <= ord('Z'))
+        lower.matrix[upper] += 32
+        return lower
+
+    def rows_only(self, character):
+        """return a boolean array, True for rows containing only `character`"""
+        only = (self.matrix == ord(character)).all(axis=1)
+        return only & (self.get_alignment_length() > 0)
+
+    def ends(self, characters='-'):
+        """return arrays of the first and (one past) the last positions of
+        each row that are not in `characters`.  rows made up entirely of
+        `characters` start at the alignment length and end at 0."""
+        length = self.get_alignment_length()
+        edge = self.is_in(characters)
+        all_edge = edge.all(axis=1)
+        start = numpy.where(all_edge, length, edge.argmin(axis=1))
+        end_gap = numpy.where(all_edge, length, edge[:, ::-1].argmin(axis=1))
+        return start, length - end_gap
+
+    def runs(self, characters='-'):
+        """
+        Run-length encode the positions of every row that are in
+        `characters`.  Returns arrays giving the row, start, and length of
+        each run, in row order, and a boolean array that is True for
+        terminal runs (those touching either end of their row).
+        """
+        length = self.get_alignment_length()
+        hit = numpy.zeros((len(self), length + 2), dtype=numpy.int8)
+        hit[:, 1:-1] = self.is_in(characters)
+        change = numpy.diff(hit, axis=1)
+        rows, starts = numpy.nonzero(change == 1)
+        ends = numpy.nonzero(change == -1)[1]
+        return rows, starts, ends - starts, (starts == 0) | (ends == length)
+
+    def terminal_runs(self, characters='-'):
+        """return arrays of the lengths of the leading and trailing runs of
+        `characters` in every row.  rows made up entirely of `characters`
+        have both equal to the alignment length."""
+        length = self.get_alignment_length()
+        rows, starts, lengths, terminal = self.runs(characters)
+        leading = numpy.zeros(len(self), dtype=numpy.int64)
+        trailing = numpy.zeros(len(self), dtype=numpy.int64)
+        first = starts == 0
+        leading[rows[first]] = lengths[first]
+        last = starts + lengths == length
+        trailing[rows[last]] = lengths[last]
+        return leading, trailing
+
+    def character_counts(self, exclude=''):
+        """
+        Count the characters in each column.  Returns the characters found
+        (as a string) and a (characters x columns) array of their counts.
+        Characters in `exclude` are not counted.
+        """
+        codes = numpy.unique(self.matrix)
+        codes = codes[~numpy.in1d(codes, encode(exclude))]
+        counts = numpy.zeros((codes.size, self.get_alignment_length()), dtype=numpy.int64)
+        for idx, code in enumerate(codes):
+            counts[idx] = (self.matrix == code).sum(axis=0)
+        return codes.tostring(), counts
+
+    def consensus(self, threshold=0.7, ambiguous='X'):
+        """return a consensus string for the alignment, computed in the same way
+        as biopython's AlignInfo.SummaryInfo.dumb_consensus"""
+        characters, counts = self.character_counts(exclude='-.')
+        length = self.get_alignment_length()
+        if not characters:
+            return ambiguous * length
+        maximum = counts.max(axis=0)
+        total = counts.sum(axis=0)
+        unique = (counts == maximum).sum(axis=0) == 1
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            proportion = maximum / total.astype(float)
+            good = (maximum > 0) & unique & (proportion >= threshold)
+        consensus = numpy.where(
+                good,
+                encode(characters)[counts.argmax(axis=0)],
+                ord(ambiguous)
+            )
+        return consensus.astype(numpy.uint8).tostring()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+File: bgzf.py
+Author: Brant Faircloth
+
+Copyright (c) 2012 Brant C. Faircloth. All rights reserved.
+
+Description: Read and write BGZF - gzip files made of many small,
+independently compressed members, each recording its own size.  Blocks are
+compressed and decompressed on a pool of threads (zlib releases the GIL),
+so that zipping reads scales with cores, while the output stays readable
+by gunzip, zcat, and the gzip module.
+
+"""
+
+import io
+import zlib
+import gzip
+import struct
+from collections import deque
+from multiprocessing.pool import ThreadPool
+
+
+# data per block, as in samtools/htslib, leaving room for incompressible data
+BLOCK_SIZE = 0xff00
+GZIP_MAGIC = '\x1f\x8b'
+# id1, id2, cm, flg, mtime, xfl, os, xlen, si1, si2, slen, bsize
+HEADER = struct.Struct('<4sIBBH2sHH')
+FOOTER = struct.Struct('<II')
+# empty block marking the end of a file
+EOF = HEADER.pack('\x1f\x8b\x08\x04', 0, 0, 0xff, 6, 'BC', 2, 27) + '\x03\x00' + FOOTER.pack(0, 0)
+
+
+def compress_block(data, level=6):
+    """return data as a single BGZF member"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    cdata = compressor.compress(data) + compressor.flush()
+    bsize = HEADER.size + len(cdata) + FOOTER.size - 1
+    return HEADER.pack('\x1f\x8b\x08\x04', 0, 0, 0xff, 6, 'BC', 2, bsize) + cdata + \
+            FOOTER.pack(zlib.crc32(data) & 0xffffffff, len(data))
+
+
+def decompress_block(block):
+    """return the data of a (cdata, crc, size) block, checking it"""
+    cdata, crc, size = block
+    data = zlib.decompress(cdata, -zlib.MAX_WBITS)
+    if len(data) != size or zlib.crc32(data) & 0xffffffff != crc:
+        raise IOError("BGZF block is corrupt")
+    return data
+
+
+def _block_size(header, extra):
+    """return the BSIZE of a gzip member from its header, or None if the
+    member is not BGZF"""
+    if header[:4] != '\x1f\x8b\x08\x04':
+        return None
+    position = 0
+    while position + 4 <= len(extra):
+        si, slen = extra[position:position + 2], struct.unpack('<H', extra[position + 2:position + 4])[0]
+        if si == 'BC' and slen == 2:
+            return struct.unpack('<H', extra[position + 4:position + 6])[0]
+        position += 4 + slen
+    return None
+
+
+def _file_header(filename):
+    """return the fixed gzip header and extra field of a file"""
+    with io.open(filename, 'rb') as infile:
+        header = infile.read(12)
+        if len(header) < 12:
+            return header, ''
+        return header, infile.read(struct.unpack('<H', header[10:12])[0])
+
+
+def is_bgzf(filename):
+    return _block_size(*_file_header(filename)) is not None
+
+
+def read_blocks(handle):
+    """yield the (cdata, crc, size) of each BGZF member of a file"""
+    while True:
+        header = handle.read(12)
+        if not header:
+            return
+        xlen = struct.unpack('<H', header[10:12])[0] if len(header) == 12 else 0
+        extra = handle.read(xlen)
+        bsize = _block_size(header, extra)
+        if bsize is None:
+            raise IOError("File is not BGZF")
+        rest = handle.read(bsize + 1 - 12 - xlen)
+        if len(rest) != bsize + 1 - 12 - xlen:
+            raise IOError("BGZF file is truncated")
+        crc, size = FOOTER.unpack(rest[-FOOTER.size:])
+        yield rest[:-FOOTER.size], crc, size
+
+
+def _ordered(pool, func, items, pending):
+    """apply func to items on the pool, yielding results in order with at
+    most `pending` items in flight"""
+    queue = deque()
+    for item in items:
+        queue.append(pool.apply_async(func, (item,)))
+        if len(queue) >= pending:
+            yield queue.popleft().get()
+    while queue:
+        yield queue.popleft().get()
+
+
+class BgzfWriter(object):
+    """A file-like writer compressing BGZF blocks across `threads`"""
+    def __init__(self, filename, threads=1, compresslevel=6):
+        self.handle = io.open(filename, 'wb')
+        self.threads = threads
+        self.level = compresslevel
+        self.pool = ThreadPool(threads)
+        self.queue = deque()
+        self.buffer = []
+        self.size = 0
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _drain(self, pending):
+        while len(self.queue) > pending:
+            self.handle.write(self.queue.popleft().get())
+
+    def _submit(self, data):
+        self.queue.append(self.pool.apply_async(compress_block, (data, self.level)))
+        self._drain(self.threads * 4)
+
+    def write(self, data):
+        self.buffer.append(data)
+        self.size += len(data)
+        if self.size >= BLOCK_SIZE:
+            data = ''.join(self.buffer)
+            end = len(data) - len(data) % BLOCK_SIZE
+            for start in xrange(0, end, BLOCK_SIZE):
+                self._submit(data[start:start + BLOCK_SIZE])
+            self.buffer = [data[end:]] if end < len(data) else []
+            self.size = len(data) - end
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        if self.size:
+            self._submit(''.join(self.buffer))
+            self.buffer, self.size = [], 0
+        self._drain(0)
+        self.handle.flush()
+
+    def close(self):
+        if self.closed:
+            return
+        self.flush()
+        self.handle.write(EOF)
+        self.handle.close()
+        self.pool.close()
+        self.pool.join()
+        self.closed = True
+
+
+class _BgzfStream(io.RawIOBase):
+    """raw stream of the data in a BGZF file, decompressed across `threads`"""
+    def __init__(self, filename, threads=1):
+        self.handle = io.open(filename, 'rb')
+        self.pool = ThreadPool(threads)
+        self.blocks = _ordered(self.pool, decompress_block, read_blocks(self.handle), threads * 4)
+        self.data = ''
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while self.position >= len(self.data):
+            try:
+                self.data, self.position = next(self.blocks), 0
+            except StopIteration:
+                return 0
+        chunk = self.data[self.position:self.position + len(b)]
+        b[:len(chunk)] = chunk
+        self.position += len(chunk)
+        return len(chunk)
+
+    def close(self):
+        if not self.closed:
+            self.pool.terminate()
+            self.handle.close()
+        super(_BgzfStream, self).close()
+
+
+def open(filename, mode='rb', threads=1, compresslevel=6):
+    """open a file for reading or writing.  Files are written as BGZF.
+    BGZF files are read across `threads`; other gzip files and uncompressed
+    files are read as they are."""
+    if 'w' in mode:
+        return BgzfWriter(filename, threads, compresslevel)
+    header, extra = _file_header(filename)
+    if _block_size(header, extra) is not None:
+        return io.BufferedReader(_BgzfStream(filename, threads), 4 * BLOCK_SIZE)
+    elif header.startswith(GZIP_MAGIC):
+        return gzip.open(filename, 'rb')
+    else:
+        return io.open(filename, 'rb')
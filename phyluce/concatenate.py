@@ -0,0 +1,329 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+File: concatenate.py
+Author: Brant Faircloth
+
+Copyright (c) 2012 Brant C. Faircloth. All rights reserved.
+
+Description: Concatenate alignments into a supermatrix.  A LocusStore
+reads each alignment once and keeps every locus in a single, contiguous
+buffer of character codes, so that any selection of loci (including the
+random samples of randomly_sample_and_concatenate.py) can be stacked into
+a supermatrix - padded with missing data for absent taxa, and with a
+charset for each locus - without parsing the files again.  Forked workers
+share the store, so replicate concatenations can be written in parallel.
+
+"""
+
+import os
+import re
+import mmap
+import numpy
+from collections import OrderedDict
+
+from phyluce import align_io
+from phyluce.scheduler import get_chunks, map_chunks
+from phyluce.alignment import Alignment
+
+
+NEXUS_BEGIN = re.compile(r"begin\s+(?:data|characters)\s*;", re.I)
+NEXUS_MATRIX_START = re.compile(r"\bmatrix\b", re.I)
+NEXUS_MATRIX_END = re.compile(r"\bmatrix\b[^;]*;", re.I)
+NEXUS_CHARSET = re.compile(r"\bcharset\s+('[^']*'|[^\s=]+)\s*=\s*([^;]*);", re.I)
+NEXUS_RANGE = re.compile(r"(\d+|\.)(?:\s*-\s*(\d+|\.))?(?:\s*\\\s*(\d+))?")
+
+class LocusStore(object):
+    """All the loci of a set of alignment files, held in one array"""
+    def __init__(self, loci, paths, taxa, rows, lengths, data):
+        self.loci = loci
+        self.paths = paths
+        # every taxon name in the store, and the index of the taxon of each
+        # row of each locus
+        self.taxa = taxa
+        self.rows = rows
+        self.lengths = numpy.asarray(lengths, dtype=numpy.int64)
+        self.data = data
+        sizes = numpy.array([len(r) for r in rows], dtype=numpy.int64) * self.lengths
+        self.offsets = numpy.concatenate(([0], numpy.cumsum(sizes)))
+        self._index = dict([(path, idx) for idx, path in enumerate(paths)])
+
+    @classmethod
+    def from_alignments(cls, paths, alignments):
+        """create a store from (already read) alignments"""
+        loci, taxa, rows, lengths = [], [], [], []
+        taxon_index = {}
+        for path, aln in zip(paths, alignments):
+            loci.append(os.path.splitext(os.path.basename(path))[0])
+            for name in aln.names:
+                if name not in taxon_index:
+                    taxon_index[name] = len(taxa)
+                    taxa.append(name)
+            rows.append(numpy.array([taxon_index[name] for name in aln.names], dtype=numpy.int64))
+            lengths.append(aln.get_alignment_length())
+        if alignments:
+            data = numpy.concatenate([aln.matrix.ravel() for aln in alignments])
+        else:
+            data = numpy.zeros(0, dtype=numpy.uint8)
+        return cls(loci, list(paths), taxa, rows, lengths, data)
+
+    @classmethod
+    def from_files(cls, paths, input_format='nexus', cores=1):
+        """read alignment files, in chunks across `cores` processes, into
+        a store"""
+        work = [(chunk, input_format) for chunk in get_chunks(paths, cores)]
+        alignments = []
+        for chunk in map_chunks(_read_worker, work, cores):
+            alignments.extend(chunk)
+        return cls.from_alignments(paths, alignments)
+
+    def __len__(self):
+        return len(self.loci)
+
+    def index(self, path):
+        """return the index of the locus read from `path`"""
+        return self._index[path]
+
+    def alignment(self, idx):
+        """return locus `idx` as an Alignment sharing the store's buffer"""
+        rows, length = self.rows[idx], self.lengths[idx]
+        matrix = self.data[self.offsets[idx]:self.offsets[idx + 1]].reshape(len(rows), length)
+        return Alignment([self.taxa[i] for i in rows], matrix)
+
+    def supermatrix(self, loci=None, missing='?'):
+        """
+        Concatenate loci (indices into the store, in order; all loci by
+        default) into one alignment, padding taxa missing from a locus with
+        `missing`.  Taxa are ordered as they first appear among the loci.
+        Returns the alignment and a list of (name, start, end) charsets,
+        counted from 1 and inclusive.  A locus given more than once is
+        concatenated each time, and its charsets renamed (name.copy, ...).
+        """
+        if loci is None:
+            loci = range(len(self))
+        seen = numpy.zeros(len(self.taxa), dtype=bool)
+        order = []
+        for idx in loci:
+            for taxon in self.rows[idx]:
+                if not seen[taxon]:
+                    seen[taxon] = True
+                    order.append(taxon)
+        position = numpy.zeros(len(self.taxa), dtype=numpy.int64)
+        position[order] = numpy.arange(len(order))
+        ends = numpy.cumsum([self.lengths[idx] for idx in loci]).astype(numpy.int64)
+        total = int(ends[-1]) if len(ends) else 0
+        matrix = numpy.empty((len(order), total), dtype=numpy.uint8)
+        matrix.fill(ord(missing))
+        charsets, names = [], set()
+        for idx, end in zip(loci, ends.tolist()):
+            start = end - int(self.lengths[idx])
+            matrix[position[self.rows[idx]], start:end] = self.alignment(idx).matrix
+            name = align_io._nexus_unique_label(names, self.loci[idx])
+            names.add(name)
+            charsets.append((name, start + 1, end))
+        return Alignment([self.taxa[i] for i in order], matrix), charsets
+
+
+def _read_worker(work):
+    paths, input_format = work
+    return [align_io.read(path, input_format) for path in paths]
+
+
+def format_sets(charsets):
+    """return a NEXUS sets block with a charset for each locus, and a
+    charpartition of them all"""
+    charsets = [(align_io.nexus_safename(name), start, end) for name, start, end in charsets]
+    lines = ['\nbegin sets']
+    lines.extend(['charset {0} = {1}-{2}'.format(*charset) for charset in charsets])
+    lines.append('charpartition combined = {0}'.format(
+            ', '.join(['{0}: {1}-{2}'.format(*charset) for charset in charsets])
+        ))
+    lines.append('end;\n')
+    return ';\n'.join(lines)
+
+
+def format_nexus(aln, charsets):
+    """return a supermatrix as (non-interleaved) NEXUS, with its sets block"""
+    return align_io.to_string(aln, 'nexus', interleave=False) + format_sets(charsets)
+
+
+def format_phylip(aln):
+    """return a supermatrix as sequential, relaxed PHYLIP (one line per
+    taxon, names not truncated), as RAxML reads it"""
+    lines = ['{0} {1}'.format(len(aln), aln.get_alignment_length())]
+    lines.extend(['{0} {1}'.format(align_io.nexus_safename(name), sequence) for name, sequence in aln])
+    return '\n'.join(lines) + '\n'
+
+
+def format_partitions(charsets, datatype='DNA'):
+    """return a RAxML partition file with a partition for each locus"""
+    return ''.join(['{0}, {1} = {2}-{3}\n'.format(datatype, name, start, end)
+            for name, start, end in charsets])
+
+
+def write(aln, charsets, outfile, format='nexus'):
+    """write a supermatrix to `outfile` as nexus or phylip.  With phylip,
+    the charsets are written to a RAxML partition file alongside, named
+    for `outfile` with a .partitions extension"""
+    if format == 'nexus':
+        with open(outfile, 'wb') as out:
+            out.write(format_nexus(aln, charsets))
+    elif format == 'phylip':
+        with open(outfile, 'wb') as out:
+            out.write(format_phylip(aln))
+        with open(os.path.splitext(outfile)[0] + '.partitions', 'wb') as out:
+            out.write(format_partitions(charsets))
+    else:
+        raise ValueError("Supermatrices are written as nexus or phylip")
+
+
+# the store or supermatrix, in each worker process
+_shared = None
+
+
+def _init_worker(shared):
+    global _shared
+    _shared = shared
+
+
+def _concatenate_worker(work):
+    loci, outfile, format = work
+    aln, charsets = _shared.supermatrix(loci)
+    write(aln, charsets, outfile, format)
+    return outfile
+
+
+def write_supermatrices(store, work, cores=1):
+    """
+    For each (loci, outfile, format) in work, concatenate the loci of the
+    store and write the supermatrix, yielding the output files in order.
+    With cores > 1, supermatrices are written by a pool of processes that
+    inherit the store when they are forked.
+    """
+    return map_chunks(_concatenate_worker, work, cores, _init_worker, (store,),
+            max(1, len(work) / (cores * 4)))
+
+
+def parse_charsets(text, nchar):
+    """
+    Return an OrderedDict of charset name: array of (0-based) positions for
+    the charset commands in `text` (a NEXUS sets or assumptions block), and
+    a list of the charsets skipped.  Ranges (1-100), steps (1-100\\3), single
+    positions, and '.' for the last position are understood; charsets
+    referring to other sets are skipped.
+    """
+    charsets, skipped = OrderedDict(), []
+    for match in NEXUS_CHARSET.finditer(align_io.NEXUS_COMMENT.sub('', text)):
+        name, spec = align_io._nexus_word(match.group(1).strip())[0], match.group(2)
+        if NEXUS_RANGE.sub('', spec).strip():
+            skipped.append(name)
+            continue
+        positions = []
+        for start, end, step in NEXUS_RANGE.findall(spec):
+            start = nchar if start == '.' else int(start)
+            end = start if not end else nchar if end == '.' else int(end)
+            positions.extend(range(start - 1, end, int(step) if step else 1))
+        charsets[name] = numpy.unique(numpy.array(positions, dtype=numpy.int64))
+    return charsets, skipped
+
+
+def _map_nexus_matrix(mapped):
+    """
+    Return an Alignment viewing the matrix of a NEXUS file in place, and
+    the position after the matrix.  This needs a non-interleaved matrix in
+    which each taxon is on one line, padded to the same width (as the
+    supermatrices written by phyluce, Bio.Nexus, and AlignIO are); other
+    layouts raise NativeFormatError.
+    """
+    begin = NEXUS_BEGIN.search(mapped)
+    matrix = begin and NEXUS_MATRIX_START.search(mapped, begin.end())
+    if not matrix:
+        raise ValueError('No records found in handle')
+    header = align_io.NEXUS_COMMENT.sub('', mapped[begin.end():matrix.start()])
+    ntax, nchar = align_io.NEXUS_NTAX.search(header), align_io.NEXUS_NCHAR.search(header)
+    if not ntax or not nchar:
+        # e.g. ntax in a separate taxa block - leave it to align_io
+        raise align_io.NativeFormatError("Missing ntax or nchar")
+    ntax, nchar = int(ntax.group(1)), int(nchar.group(1))
+    interleave = align_io.NEXUS_INTERLEAVE.search(header)
+    if (interleave and (interleave.group(1) or 'yes').lower() != 'no') or \
+            align_io.NEXUS_MATCHCHAR.search(header):
+        raise align_io.NativeFormatError("Interleaved or matchchar matrix")
+    # the first row gives the layout of the others
+    first = matrix.end()
+    while mapped[first:first + 1].isspace():
+        first += 1
+    line_end = mapped.find('\n', first)
+    if line_end == -1:
+        raise align_io.NativeFormatError("Matrix on one line")
+    line = mapped[first:line_end + 1]
+    rest = align_io._nexus_word(line)[1]
+    width = len(line) - len(rest.lstrip())
+    stride = len(line)
+    if len(line.rstrip()) != width + nchar:
+        raise align_io.NativeFormatError("Wrapped or spaced sequences")
+    names = []
+    for idx in xrange(ntax):
+        start = first + idx * stride
+        label = mapped[start:start + width]
+        name, rest = align_io._nexus_word(label)
+        if rest.strip() or mapped[start + stride - 1] != '\n' or \
+                mapped[start + width + nchar:start + stride].strip():
+            raise align_io.NativeFormatError("Rows are not evenly spaced")
+        names.append(align_io._nexus_unique_label(names, name))
+    end = first + ntax * stride
+    if mapped[end:end + 1024].lstrip()[:1] != ';':
+        raise align_io.NativeFormatError("Too many taxa in matrix")
+    view = numpy.ndarray(
+            (ntax, nchar),
+            dtype=numpy.uint8,
+            buffer=mapped,
+            offset=first + width,
+            strides=(stride, 1)
+        )
+    return Alignment(names, view), end
+
+
+def read_supermatrix(filename):
+    """
+    Read a NEXUS supermatrix and its charsets in one pass, returning an
+    Alignment, the charsets, and the names of charsets skipped (see
+    parse_charsets).  Where it can be, the
+    matrix is memory-mapped rather than read, so partitions are sliced out
+    of it without holding the file in memory.
+    """
+    with open(filename, 'rb') as infile:
+        mapped = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        aln, end = _map_nexus_matrix(mapped)
+        tail = mapped[end:]
+    except align_io.NativeFormatError:
+        aln = align_io.read(filename, 'nexus')
+        tail = mapped[NEXUS_MATRIX_END.search(mapped, NEXUS_BEGIN.search(mapped).end()).end():]
+    charsets, skipped = parse_charsets(tail, aln.get_alignment_length())
+    return aln, charsets, skipped
+
+
+def _split_worker(work):
+    name, positions, outfile = work
+    if (numpy.diff(positions) == 1).all():
+        locus = _shared[:, int(positions[0]):int(positions[-1]) + 1]
+    else:
+        locus = Alignment(_shared.names, _shared.matrix[:, positions])
+    align_io.write(locus, outfile, 'nexus')
+    return name
+
+
+def split_supermatrix(aln, charsets, output, cores=1):
+    """
+    Write each charset of a supermatrix to <output>/<charset>.nex, in
+    parallel when cores > 1, yielding the names of the charsets written.
+    Empty charsets are skipped.
+    """
+    work = []
+    for name, positions in charsets.iteritems():
+        if positions.size == 0:
+            continue
+        work.append((name, positions, os.path.join(output, "{}.nex".format(name))))
+    return map_chunks(_split_worker, work, cores, _init_worker, (aln,),
+            max(1, len(work) / (cores * 4)))
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+File: contigs.py
+Author: Brant Faircloth
+
+Copyright (c) 2012 Brant C. Faircloth. All rights reserved.
+
+Description: Summarize assembled contigs from their fasta headers and
+sequence lengths alone.  Files are read in large blocks, and the lines of
+each block measured at once, so sequences are never assembled into
+strings; lengths are kept as histograms and velvet coverages as arrays of
+one value per contig.
+
+"""
+
+import math
+import numpy
+from itertools import izip
+
+from phyluce.reads import LengthHistogram
+
+
+# contigs having less than these coverages are counted
+COVERAGE_LIMITS = [10, 25, 50, 100]
+
+
+def fasta_lengths(handle, size=1 << 22):
+    """yield the (header, length) of each sequence in a fasta stream,
+    which is read in blocks of `size` bytes.  Headers lose their '>'."""
+    header, length, tail = None, 0, ''
+    while True:
+        block = handle.read(size)
+        data = tail + block
+        if not block:
+            if not data:
+                break
+            # a last line without a newline
+            data += '\n'
+        raw = numpy.frombuffer(data, dtype=numpy.uint8)
+        ends = numpy.flatnonzero(raw == 10)
+        if not len(ends):
+            tail = data
+            continue
+        starts = numpy.concatenate(([0], ends[:-1] + 1))
+        is_header = raw[starts] == ord('>')
+        sizes = numpy.where(is_header, 0, ends - starts)
+        # strip carriage returns from sequence lines
+        sizes -= (~is_header & (ends > starts)) * (raw[ends - 1] == 13)
+        cumulative = numpy.concatenate(([0], numpy.cumsum(sizes)))
+        heads = numpy.flatnonzero(is_header)
+        bounds = numpy.concatenate((heads, [len(starts)]))
+        # sequence continuing from the previous block
+        length += int(cumulative[bounds[0]])
+        for index, count in izip(heads.tolist(), (cumulative[bounds[1:]] - cumulative[heads]).tolist()):
+            if header is not None:
+                yield header, length
+            header, length = data[starts[index] + 1:ends[index]].rstrip('\r'), count
+        tail = data[ends[-1] + 1:]
+        if not block:
+            break
+    if header is not None:
+        yield header, length
+
+
+def get_node(header):
+    """return the velvet node of a contig, as it is named in match_map"""
+    return '_'.join(header.split('_')[:2]).lower()
+
+
+def get_coverage(header):
+    """return the k-mer coverage in a velvet header, or None"""
+    parts = header.split()[0].split('_')
+    if len(parts) > 2 and parts[-2] == 'cov':
+        try:
+            return float(parts[-1])
+        except ValueError:
+            return None
+    return None
+
+
+class ContigStats(object):
+    """The distributions of length and coverage of a set of contigs"""
+    def __init__(self):
+        self.lengths = LengthHistogram()
+        self.coverages = []
+
+    def add(self, length, coverage=None):
+        self.lengths.add(length)
+        if coverage is not None:
+            self.coverages.append(coverage)
+
+    def coverage_summary(self, scale=1.):
+        """return the mean, 95% CI, min, max, and median of coverage, times
+        `scale`, and the counts of contigs below COVERAGE_LIMITS"""
+        if not self.coverages:
+            return [''] * (5 + len(COVERAGE_LIMITS))
+        coverages = numpy.array(self.coverages) * scale
+        if len(coverages) > 1:
+            ci = 1.96 * (numpy.std(coverages, ddof=1) / math.sqrt(len(coverages)))
+        else:
+            ci = float('nan')
+        return [coverages.mean(), ci, coverages.min(), coverages.max(), numpy.median(coverages)] + \
+                [int((coverages < limit).sum()) for limit in COVERAGE_LIMITS]
+
+    def length_summary(self):
+        """return the count, bp, mean, 95% CI, min, max, and median of
+        length"""
+        if not self.lengths.reads:
+            return [0, 0] + [''] * 5
+        lengths = self.lengths
+        return [lengths.reads, lengths.bp, lengths.mean, lengths.ci, lengths.min, lengths.max,
+                lengths.median]
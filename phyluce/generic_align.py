@@ -14,13 +14,12 @@ Description:
 import os
 import re
 import numpy
-from collections import Counter
 from Bio.Seq import Seq
 from Bio.SeqRecord import SeqRecord
 from Bio import AlignIO
-from Bio.Align import AlignInfo
 from Bio.Alphabet import IUPAC, Gapped
-from Bio.Align import MultipleSeqAlignment
+
+from phyluce.alignment import Alignment
 
 
 class GenericAlign(object):
@@ -72,9 +71,9 @@ class GenericAlign(object):
         return seq
 
     def _alignment_consensus(self, alignment):
-        """return consensus for an alignment object using BioPython"""
-        consensus = AlignInfo.SummaryInfo(alignment).dumb_consensus()
-        return consensus.tostring().replace('X', '-')
+        """return consensus for an alignment object (as BioPython's
+        dumb_consensus would)"""
+        return alignment.consensus().replace('X', '-')
 
     def _read(self, format):
         """read an alignment from the CLI - largely for testing purposes"""
@@ -94,38 +93,25 @@ class GenericAlign(object):
         sufficient data, determined by `proportion`. Filter out columns
         having sufficient data where running average is > `threshold`
         """
-        # iterate across the columns of the alignment and determine presence
-        # or absence of base-identity in the column
-        good_alignment = []
         # get count of taxa in alignment
         taxa = len(alignment)
         # get what constitutes the count of characters we need to
         # make a "majority" (this could be < 50% by changing
         # proportion
         majority_of_characters = int(round(proportion * taxa, 0))
-        for column in xrange(alignment.get_alignment_length()):
-            # get the count of different bases in a column
-            column_count = Counter(alignment[:, column])
-            # don't start considering base differences until we
-            # have data from > required_characters (meaning we've
-            # past the gappy parts of a given alignment)
-            if column_count['-'] <= majority_of_characters:
-                # remove the insertion marker
-                del column_count['-']
-                # alignment is "good" where the count of identities
-                # at a given base is >= 50% across all taxa
-                if column_count.most_common(1)[0][1] >= majority_of_characters:
-                    good_alignment.append(True)
-                # alignment is "bad" when we have < majority_of_characters
-                # identities at a given base.
-                else:
-                    good_alignment.append(False)
-            # alignment is also "bad" when we have > majority_of_characters
-            # gaps in a column
-            else:
-                good_alignment.append(False)
-        # convert good_alignment to array
-        good_alignment = numpy.array(good_alignment)
+        # get the count of gaps and of the most common base in every column
+        gaps = (alignment.matrix == ord('-')).sum(axis=0)
+        characters, counts = alignment.character_counts(exclude='-')
+        if characters:
+            most_common = counts.max(axis=0)
+        else:
+            most_common = numpy.zeros(alignment.get_alignment_length(), dtype=int)
+        # don't start considering base differences until we have data from
+        # > required_characters (meaning we've past the gappy parts of a given
+        # alignment). alignment is "good" where the count of identities at a
+        # given base is >= 50% across all taxa and "bad" otherwise.
+        good_alignment = (gaps <= majority_of_characters) & \
+            (most_common >= majority_of_characters)
         # setup weights for running average
         weight = numpy.repeat(1.0, window_size) / window_size
         # compute running average - will have edge effect
@@ -140,7 +126,7 @@ class GenericAlign(object):
             start_clip = None
             end_clip = None
         return start_clip, end_clip
-    
+
     def stage_one_trimming(self, alignment, window_size, threshold, proportion):
         """
         First stage (of 3) alignment trimming to find and trim edges of a given
@@ -150,78 +136,105 @@ class GenericAlign(object):
         # get the trim positions that we determine begin and end "good"
         # alignments
         start, end = self.running_average(alignment, window_size, threshold, proportion)
-        # create a new alignment object to hold our alignment
-        s1_trimmed = MultipleSeqAlignment([], Gapped(IUPAC.ambiguous_dna, "-"))
-        for sequence in alignment:
-            if start >= 0 and end:
-                trim = sequence[start:end]
-                # ensure we don't just add a taxon with only gaps/missing
-                # data
-                if set(trim) != set(['-']) and set(trim) != (['?']):
-                    s1_trimmed.append(sequence[start:end])
-                else:
-                    s1_trimmed = None
-                    break
-            else:
-                s1_trimmed = None
-                break
+        if start is None or not end:
+            return None
+        s1_trimmed = alignment[:, start:end]
+        # ensure we don't just add a taxon with only gaps/missing
+        # data
+        if s1_trimmed.rows_only('-').any():
+            return None
         return s1_trimmed
-    
+
+    def _get_conserved_runs(self, gm, start, end, run=5):
+        """
+        For every row of `gm`, locate the first position opening and the last
+        position closing a block of `run` True values inside the [start, end)
+        window of that row.  As when slicing the row, blocks may be cut short
+        by the window edges.  Returns the row-wise positions, and masks of
+        the rows where an opening or closing block was found.
+        """
+        rows, length = gm.shape
+        row = numpy.arange(rows)[:, None]
+        position = numpy.arange(length)
+        start, end = start[:, None], end[:, None]
+        inside = (position >= start) & (position < end)
+        # running count of True values, with a leading zero column so that
+        # the count over [i, j) is csum[:, j] - csum[:, i]
+        csum = numpy.zeros((rows, length + 1), dtype=numpy.int64)
+        numpy.cumsum(gm, axis=1, out=csum[:, 1:])
+        # blocks opening at each position - gm[i:i + run]
+        stop = numpy.minimum(position + run, end)
+        opening = (csum[row, stop] - csum[:, :-1]) == (stop - position)
+        opening &= inside
+        # blocks closing at each position - gm[k - run:k], with k = i + 1
+        begin = numpy.maximum(position + 1 - run, start)
+        closing = (csum[:, 1:] - csum[row, begin]) == (position + 1 - begin)
+        closing &= inside
+        first = opening.argmax(axis=1)
+        last = length - closing[:, ::-1].argmax(axis=1)
+        return first, last, opening.any(axis=1), closing.any(axis=1)
+
+    def _fill_forward(self, values, found, missing):
+        """replace values where not `found` with the closest preceding found
+        value, or with `missing` when there is none"""
+        if found.all():
+            return values
+        source = numpy.maximum.accumulate(numpy.where(found, numpy.arange(found.size), -1))
+        return numpy.where(source >= 0, values[source], missing)
+
     def stage_two_trimming(self, s1_trimmed, window_size=5):
         """
-        Alignment row-by-row trimming.  After stage one trimming, iterate
-        over rows of alignment to find differences between the alignment
-        consensus and the row of data.  Trim those ends coming before
-        (or after at 3' end) a block of 5 contiguous highly conserved
-        positions.  Goes to third round of filtering to remove edges that
-        end up with only '----' characters to start or end alignment block.
+        Alignment row-by-row trimming.  After stage one trimming, compare
+        all rows of alignment to the alignment consensus at once to find
+        differences between the consensus and each row of data.  Trim those
+        ends coming before (or after at 3' end) a block of 5 contiguous highly
+        conserved positions.  Goes to third round of filtering to remove edges
+        that end up with only '----' characters to start or end alignment block.
         """
-        # create new alignment object to hold trimmed alignment
-        s2_trimmed = MultipleSeqAlignment([], Gapped(IUPAC.ambiguous_dna, "-?"))
         # get consensus of alignment in array form
-        consensus_array = numpy.array(list(self._alignment_consensus(s1_trimmed)))
-        # iterate over each alignment sequence
-        for sequence in s1_trimmed:
-            #if sequence.id == 'phaenicophaeus_curvirostris2':
-            #    pdb.set_trace()
-            start, end = self._get_ends(sequence)
-            # convert sequence to array
-            orig_seq_array = numpy.array(list(sequence))
-            # trim down edge gaps so they do not exert undue influence
-            # on the running average
-            seq_array = orig_seq_array[start:end]
-            compare = (seq_array == consensus_array[start:end])
-            weight = numpy.repeat(1.0, window_size) / window_size
-            # compute running average across window size
-            running_average = numpy.convolve(compare, weight, 'same')
-            # get first 5' and 3' positions where quality > 1 over
-            # 5 positions ([True, True, True, True, True]). This helps
-            # us find the ends of the alignment where there are likely
-            # problems)
-            gm = (running_average > 0.99)
-            for i in xrange(gm.size):
-                # get 5 value slices
-                if numpy.all(gm[i:i+5] == True):
-                    bad_start = i
-                    break
-            reversed_gm = gm[::-1]
-            for i in xrange(reversed_gm.size):
-                # get 5 value slices
-                if numpy.all(reversed_gm[i:i+5] == True):
-                    bad_end = reversed_gm.size - i
-                    break
-            orig_seq_array[:start + bad_start] = '-'
-            orig_seq_array[start + bad_end:] = '-'
-            trim = ''.join(orig_seq_array)
-            # feed those up to replacement engine to set all
-            # missing/trimmed data at edges to "?" which is
-            # missing data designator
-            #trim = self._replace_ends(trim)
-            if set(trim) != set(['-']) and set(trim) != (['?']):
-                s2_trimmed.append(self._record_formatter(trim, sequence.id))
-            else:
-                s2_trimmed = None
-                break
+        consensus_array = numpy.frombuffer(
+                bytearray(self._alignment_consensus(s1_trimmed)),
+                dtype=numpy.uint8
+            )
+        # work on a copy of the alignment, which we mask in place
+        s2_trimmed = s1_trimmed.copy()
+        seq_array = s2_trimmed.matrix
+        rows, length = seq_array.shape
+        start, end = s2_trimmed.ends('-')
+        # ignore edge gaps so they do not exert undue influence on the
+        # running average.  data outside [start, end) counts as zero, just
+        # as the zero-padding of a convolution over the sliced row would.
+        position = numpy.arange(length)
+        inside = (position >= start[:, None]) & (position < end[:, None])
+        compare = (seq_array == consensus_array) & inside
+        # compute running average across window size, using the same
+        # window alignment as numpy.convolve(..., 'same')
+        lo = window_size // 2
+        csum = numpy.zeros((rows, length + window_size), dtype=numpy.int64)
+        numpy.cumsum(compare, axis=1, out=csum[:, lo + 1:lo + 1 + length])
+        csum[:, lo + 1 + length:] = csum[:, [lo + length]]
+        running_sum = csum[:, window_size:] - csum[:, :length]
+        running_average = running_sum * (1.0 / window_size)
+        # get first 5' and 3' positions where quality > 1 over
+        # 5 positions ([True, True, True, True, True]). This helps
+        # us find the ends of the alignment where there are likely
+        # problems)
+        gm = (running_average > 0.99)
+        first, last, found_start, found_end = self._get_conserved_runs(gm, start, end)
+        # rows lacking a conserved block reuse the clip position of the
+        # preceding row, as the row-by-row implementation did.  with no
+        # preceding row to borrow from, mask the row entirely.
+        bad_start = self._fill_forward(first - start, found_start, length)
+        bad_end = self._fill_forward(last - start, found_end, length)
+        masked = (position < (start + bad_start)[:, None]) | \
+            (position >= (start + bad_end)[:, None])
+        seq_array[masked] = ord('-')
+        # feed those up to replacement engine to set all
+        # missing/trimmed data at edges to "?" which is
+        # missing data designator
+        #trim = self._replace_ends(trim)
+        if s2_trimmed.rows_only('-').any():
+            return None
         return s2_trimmed
 
     def trim_alignment(self, method='running', window_size=20, threshold=0.75, proportion=0.65):
@@ -229,16 +242,26 @@ class GenericAlign(object):
         Trim a given alignment from one of the alignment engines.  Uses three-pass
         approach - one to trim alignment block ends, one to trim row data, and a
         third to re-trim alignment block ends after trimming row data.
-        
+
+        Trimming works on the array-backed form of the alignment; self.trimmed
+        is returned as a BioPython alignment.
+
         Returns self.trimmed
         """
         if method == 'notrim':
             self.trimmed = self.alignment
         else:
-            s1_trimmed = self.stage_one_trimming(self.alignment, window_size, threshold, proportion)
-            s2_trimmed = self.stage_two_trimming(s1_trimmed)
-            # cleanup any edges on which we've masked the data
-            self.trimmed = self.stage_one_trimming(s2_trimmed, window_size, threshold, proportion)
+            alignment = Alignment.from_biopython(self.alignment)
+            trimmed = self.stage_one_trimming(alignment, window_size, threshold, proportion)
+            if trimmed is not None:
+                trimmed = self.stage_two_trimming(trimmed)
+            if trimmed is not None:
+                # cleanup any edges on which we've masked the data
+                trimmed = self.stage_one_trimming(trimmed, window_size, threshold, proportion)
+            if trimmed is not None:
+                self.trimmed = trimmed.to_biopython()
+            else:
+                self.trimmed = None
         # report failed (complete) trimming
         if not self.trimmed:
             print "\tAlignment {0} dropped due to trimming".format(self.alignment._records[0].description)
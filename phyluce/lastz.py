@@ -23,10 +23,17 @@ import os
 import tempfile
 import subprocess
 from collections import namedtuple
-from collections import defaultdict
 
 #import pdb
 
+# the fields of lastz results, in the default (short) and long formats
+Lastz = namedtuple('Lastz', 'score,name1,strand1,zstart1,end1,length1,name2,'+
+        'strand2,zstart2,end2,length2,diff,cigar,identity,percent_identity,'+
+        'continuity,percent_continuity')
+LastzLong = namedtuple('LastzLong', 'score,name1,strand1,zstart1,end1,length1,name2,'+
+        'strand2,zstart2,end2,length2,diff,cigar,identity,percent_identity,'+
+        'continuity,percent_continuity,coverage,percent_coverage')
+
 class Align():
     '''docstring for lastz'''
     def __init__(self, target, query, matchcount, identity, out=False):
@@ -65,6 +72,7 @@ class Reader():
     def __init__(self, lastz_file, long_format = False):
         self.file = open(lastz_file, 'rU')
         self.long_format = long_format
+        self.record = LastzLong if long_format else Lastz
         
     def __del__(self):
         """close files"""
@@ -80,15 +88,6 @@ class Reader():
         lastz_result = self.file.readline()
         if not lastz_result:
             raise StopIteration
-        if not self.long_format:
-            Lastz = namedtuple('Lastz', 'score,name1,strand1,zstart1,end1,length1,name2,'+
-            'strand2,zstart2,end2,length2,diff,cigar,identity,percent_identity,'+
-            'continuity,percent_continuity')
-        else:
-            Lastz = namedtuple('Lastz', 'score,name1,strand1,zstart1,end1,length1,name2,'+
-            'strand2,zstart2,end2,length2,diff,cigar,identity,percent_identity,'+
-            'continuity,percent_continuity,coverage,percent_coverage')
-        aligns = defaultdict(lambda: defaultdict(list))
         lastz_result_split = lastz_result.strip('\n').split('\t')
         for k,v in enumerate(lastz_result_split):
             if k in [3,4,5,8,9,10]:
@@ -97,7 +96,7 @@ class Reader():
                 lastz_result_split[k] = float(v.strip('%'))
         lastz_result_split[1] = lastz_result_split[1].lstrip('>')
         lastz_result_split[6] = lastz_result_split[6].lstrip('>')
-        return Lastz._make(lastz_result_split)
+        return self.record._make(lastz_result_split)
 
 if __name__ == '__main__':
     pass
\ No newline at end of file
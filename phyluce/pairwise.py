@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+File: pairwise.py
+Author: Brant Faircloth
+
+Copyright (c) 2012 Brant C. Faircloth. All rights reserved.
+
+Description: All-pairs uncorrected (p) distances between the taxa of an
+Alignment.  Each row is one-hot encoded by character, so that the number
+of sites two taxa share, and the number at which they agree, are matrix
+products over blocks of taxa rather than base-by-base comparisons.
+
+"""
+
+import numpy
+
+from phyluce.alignment import encode
+
+# characters that do not count as data when comparing two sequences
+MISSING = '-?NnXx'
+
+
+def pairwise_counts(aln, missing=MISSING, block_size=256):
+    """return (taxa x taxa) arrays of the number of sites compared (where
+    neither taxon has a character in `missing`) and the number of those
+    sites that differ.  Comparisons are case-insensitive."""
+    matrix = aln.upper().matrix
+    valid = ~numpy.in1d(matrix, encode(missing.upper())).reshape(matrix.shape)
+    codes = numpy.unique(matrix[valid])
+    ntax = len(aln)
+    compared = numpy.zeros((ntax, ntax), dtype=numpy.int64)
+    same = numpy.zeros((ntax, ntax), dtype=numpy.int64)
+    # float32 products are exact for counts below 2**24
+    dtype = numpy.float32 if aln.get_alignment_length() < 2 ** 24 else numpy.float64
+    valid_f = valid.astype(dtype)
+    onehot = [((matrix == code) & valid).astype(dtype) for code in codes]
+    for start in xrange(0, ntax, block_size):
+        rows = slice(start, start + block_size)
+        compared[rows] = numpy.dot(valid_f[rows], valid_f.T)
+        agree = numpy.zeros((min(block_size, ntax - start), ntax), dtype=dtype)
+        for character in onehot:
+            agree += numpy.dot(character[rows], character.T)
+        same[rows] = agree
+    return compared, compared - same
+
+
+def p_distances(aln, missing=MISSING, block_size=256):
+    """return a (taxa x taxa) array of p-distances, which is NaN for pairs
+    sharing no sites, along with the number of sites compared"""
+    compared, differences = pairwise_counts(aln, missing, block_size)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        distances = differences / compared.astype(float)
+    return distances, compared
+
+
+def mean_distance(distances):
+    """return the mean distance over all pairs of taxa (ignoring NaN), or
+    NaN if there are no pairs"""
+    upper = distances[numpy.triu_indices(distances.shape[0], 1)]
+    upper = upper[~numpy.isnan(upper)]
+    if upper.size == 0:
+        return float('nan')
+    return float(upper.mean())
+
+
+def write_matrix(outf, names, distances, precision=6):
+    """write a distance matrix as csv with a header row of taxon names"""
+    outf.write(',' + ','.join(names) + '\n')
+    for name, row in zip(names, distances):
+        values = ['NA' if numpy.isnan(d) else '{0:.{1}f}'.format(d, precision) for d in row]
+        outf.write(name + ',' + ','.join(values) + '\n')
@@ -0,0 +1,355 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+File: reads.py
+Author: Brant Faircloth
+
+Copyright (c) 2012 Brant C. Faircloth. All rights reserved.
+
+Description: Lightweight fastq handling - reads are passed around as
+their raw lines, so they can be filtered and written back out without
+being parsed or reformatted - and read length histograms, which summarize
+any number of reads in constant memory.  For throughput, reads may also be
+handled in blocks of whole records, located, paired, and written in bulk.
+
+"""
+
+import io
+import math
+import numpy
+import Queue
+import threading
+from itertools import izip
+
+from phyluce import bgzf
+
+
+def open_fastq(filename, mode='rb', threads=1):
+    """open a fastq file for reading or writing, across `threads` when it
+    is (or is named as, for writing) BGZF"""
+    if 'w' in mode and not filename.endswith('.gz'):
+        return io.open(filename, 'wb')
+    return bgzf.open(filename, mode, threads)
+
+
+def fastq_records(handle):
+    """yield the (header, sequence, plus, quality) lines of each read in a
+    fastq stream, newlines included"""
+    while True:
+        header = handle.readline()
+        if not header:
+            return
+        yield header, handle.readline(), handle.readline(), handle.readline()
+
+
+class LengthHistogram(object):
+    """Counts of reads by length, growing to fit the longest read"""
+    def __init__(self, size=512):
+        self.counts = numpy.zeros(size, dtype=numpy.int64)
+
+    def _fit(self, size):
+        if size > len(self.counts):
+            counts = numpy.zeros(max(size, 2 * len(self.counts)), dtype=numpy.int64)
+            counts[:len(self.counts)] = self.counts
+            self.counts = counts
+
+    def add(self, length):
+        self._fit(length + 1)
+        self.counts[length] += 1
+
+    def update(self, lengths):
+        """count an array of lengths"""
+        if len(lengths):
+            counts = numpy.bincount(lengths)
+            self._fit(len(counts))
+            self.counts[:len(counts)] += counts
+
+    def merge(self, other):
+        self._fit(len(other.counts))
+        self.counts[:len(other.counts)] += other.counts
+        return self
+
+    @property
+    def reads(self):
+        return int(self.counts.sum())
+
+    @property
+    def bp(self):
+        return int(numpy.dot(self.counts, numpy.arange(len(self.counts))))
+
+    @property
+    def min(self):
+        return int(self.counts.nonzero()[0][0])
+
+    @property
+    def max(self):
+        return int(self.counts.nonzero()[0][-1])
+
+    @property
+    def mean(self):
+        if not self.reads:
+            return float('nan')
+        return float(self.bp) / self.reads
+
+    @property
+    def std(self):
+        """the sample standard deviation (ddof=1) of lengths"""
+        if self.reads < 2:
+            return float('nan')
+        deviations = numpy.arange(len(self.counts)) - self.mean
+        return math.sqrt(numpy.dot(self.counts, deviations ** 2) / (self.reads - 1))
+
+    @property
+    def std_error(self):
+        if not self.reads:
+            return float('nan')
+        return self.std / math.sqrt(self.reads)
+
+    @property
+    def ci(self):
+        """the 95% confidence interval of the mean length"""
+        return 1.96 * self.std_error
+
+    @property
+    def median(self):
+        cumulative = numpy.cumsum(self.counts)
+        low = numpy.searchsorted(cumulative, (self.reads - 1) // 2 + 1)
+        high = numpy.searchsorted(cumulative, self.reads // 2 + 1)
+        return (low + high) / 2.
+
+    def summary(self):
+        """return a dict of the summary statistics"""
+        if not self.reads:
+            return {'reads': 0, 'bp': 0}
+        return {'reads': self.reads, 'bp': self.bp, 'mean': self.mean, 'ci': self.ci,
+                'min': self.min, 'max': self.max, 'median': float(self.median)}
+
+
+def fastq_lengths(handle, histogram=None, size=1 << 22):
+    """return a LengthHistogram of the reads in a fastq stream, which is
+    read in blocks of `size` bytes, measuring the lines of each block at
+    once from the positions of their newlines"""
+    if histogram is None:
+        histogram = LengthHistogram()
+    # the number of lines before the start of the current block, mod 4
+    line, tail = 0, ''
+    while True:
+        block = handle.read(size)
+        if not block:
+            break
+        data = tail + block
+        ends = numpy.flatnonzero(numpy.frombuffer(data, dtype=numpy.uint8) == 10)
+        if not len(ends):
+            tail = data
+            continue
+        starts = numpy.concatenate(([0], ends[:-1] + 1))
+        histogram.update((ends - starts)[(1 - line) % 4::4])
+        line = (line + len(ends)) % 4
+        tail = data[ends[-1] + 1:]
+    if tail and line == 1:
+        histogram.add(len(tail.rstrip()))
+    return histogram
+
+
+class FastqBlock(object):
+    """A block of whole fastq records - their raw bytes, and the offsets of
+    each record in them (followed by the length of the data)"""
+    def __init__(self, data, starts):
+        self.data = data
+        self.starts = starts
+
+    def __len__(self):
+        return len(self.starts) - 1
+
+    def record_list(self, step=1, offset=0):
+        """return the raw bytes of every `step`th record, from `offset`"""
+        starts = self.starts.tolist()
+        return [self.data[start:end] for start, end in izip(starts[offset:-1:step],
+                starts[offset + 1::step])]
+
+    def records(self, keep):
+        """return the raw bytes of the records for which `keep` is True"""
+        if keep.all():
+            return self.data
+        starts = self.starts.tolist()
+        return ''.join([self.data[starts[i]:starts[i + 1]] for i in keep.nonzero()[0].tolist()])
+
+    def line_ends(self):
+        """return the offsets of the newlines ending the lines of the records,
+        one record per row"""
+        return numpy.flatnonzero(numpy.frombuffer(self.data, dtype=numpy.uint8) == 10).reshape(-1, 4)
+
+    def lengths(self, ends=None):
+        """return the length of the sequence of each record"""
+        if ends is None:
+            ends = self.line_ends()
+        return ends[:, 1] - ends[:, 0] - 1
+
+    def containing(self, base, ends=None):
+        """return whether the sequence of each record contains `base`"""
+        if ends is None:
+            ends = self.line_ends()
+        hits = numpy.flatnonzero(numpy.frombuffer(self.data, dtype=numpy.uint8) == ord(base))
+        found = numpy.zeros(len(self), dtype=bool)
+        if len(hits):
+            # the record and sequence line in which each hit falls
+            record = numpy.searchsorted(self.starts, hits, side='right') - 1
+            in_sequence = (hits > ends[record, 0]) & (hits < ends[record, 1])
+            found[record[in_sequence]] = True
+        return found
+
+    def tags(self, ends=None):
+        """return the index tag of each record - the header from its last '#'
+        to the next '/', as in @HWI-ST:1:1101:1234:2000#ACGTAC/1"""
+        if ends is None:
+            ends = self.line_ends()
+        array = numpy.frombuffer(self.data, dtype=numpy.uint8)
+        # the header, without '@' or a trailing carriage return
+        starts, stops = self.starts[:-1] + 1, ends[:, 0]
+        stops = stops - (array[stops - 1] == 13)
+        hashes = numpy.flatnonzero(array == ord('#'))
+        if len(hashes):
+            last = hashes[numpy.maximum(numpy.searchsorted(hashes, stops) - 1, 0)]
+            starts = numpy.where((last >= starts) & (last < stops), last + 1, starts)
+        slashes = numpy.flatnonzero(array == ord('/'))
+        if len(slashes):
+            first = slashes[numpy.minimum(numpy.searchsorted(slashes, starts), len(slashes) - 1)]
+            stops = numpy.where((first >= starts) & (first < stops), first, stops)
+        return [self.data[start:stop] for start, stop in izip(starts.tolist(), stops.tolist())]
+
+    def split(self, count):
+        """return blocks of the first `count` records and of the rest"""
+        cut = self.starts[count]
+        return FastqBlock(self.data[:cut], self.starts[:count + 1]), \
+                FastqBlock(self.data[cut:], self.starts[count:] - cut)
+
+    def names(self, width=64):
+        """return the names - headers to the first space, or to the end of the
+        line - of the records, as an array of their lengths and an array of
+        their bytes, one name per row, padded with zeros"""
+        array = numpy.frombuffer(self.data, dtype=numpy.uint8)
+        starts = self.starts[:-1]
+        # look for the end of each name within `width` bytes of its start,
+        # widening the search until every name ends
+        while True:
+            names = array.take(starts[:, None] + numpy.arange(width), mode='clip')
+            breaks = (names == 32) | (names == 10)
+            if breaks.any(axis=1).all() or width >= len(array):
+                break
+            width *= 2
+        lengths = breaks.argmax(axis=1)
+        names = names[:, :lengths.max() if len(lengths) else 0]
+        names[numpy.arange(names.shape[1]) >= lengths[:, None]] = 0
+        return lengths, names
+
+
+def same_names(names1, names2):
+    """return True if two sets of names from FastqBlock.names() match"""
+    return numpy.array_equal(names1[0], names2[0]) and numpy.array_equal(names1[1], names2[1])
+
+
+def fastq_blocks(handle, size=1 << 22, multiple=1):
+    """yield FastqBlocks of the records in a fastq stream, read `size` bytes
+    at a time, holding a multiple of `multiple` records (until the last)"""
+    tail = ''
+    while True:
+        block = handle.read(size)
+        data = tail + block
+        if not block:
+            if not data:
+                return
+            if not data.endswith('\n'):
+                data += '\n'
+        ends = numpy.flatnonzero(numpy.frombuffer(data, dtype=numpy.uint8) == 10)
+        complete = len(ends) // (4 * multiple) * 4 * multiple
+        if not block and complete < len(ends):
+            complete = len(ends) // 4 * 4
+            if complete < len(ends):
+                raise IOError("The fastq file is truncated")
+        if complete:
+            starts = numpy.concatenate(([0], ends[3:complete:4] + 1))
+            yield FastqBlock(data[:starts[-1]], starts)
+            tail = data[starts[-1]:]
+        else:
+            tail = data
+        if not block:
+            return
+
+
+def prefetch(iterable, depth=2):
+    """iterate over `iterable` on another thread, up to `depth` items ahead,
+    e.g. to read and decompress blocks while others are handled"""
+    queue = Queue.Queue(depth)
+    stop = threading.Event()
+    def fill():
+        try:
+            for item in iterable:
+                if stop.is_set():
+                    return
+                queue.put((item, None))
+        except Exception, e:
+            queue.put((None, e))
+        queue.put((None, StopIteration()))
+    thread = threading.Thread(target=fill)
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            item, error = queue.get()
+            if isinstance(error, StopIteration):
+                return
+            elif error is not None:
+                raise error
+            yield item
+    finally:
+        # when closed early, free a fill blocked on the full queue and let
+        # it finish the item it is reading
+        stop.set()
+        while thread.is_alive():
+            try:
+                queue.get(timeout=0.1)
+            except Queue.Empty:
+                pass
+
+
+def interleave_blocks(blocks1, blocks2):
+    """yield (data, pairs) for the interleaved records of two sequences of
+    FastqBlocks, checking that the names of each pair match"""
+    blocks1, blocks2 = iter(blocks1), iter(blocks2)
+    block1 = block2 = None
+    while True:
+        if not block1:
+            block1 = next(blocks1, None)
+        if not block2:
+            block2 = next(blocks2, None)
+        if block1 is None or block2 is None:
+            if block1 or block2:
+                raise ValueError("Read FASTQ files hold different numbers of reads.")
+            return
+        count = min(len(block1), len(block2))
+        pair1, block1 = block1.split(count)
+        pair2, block2 = block2.split(count)
+        if not same_names(pair1.names(), pair2.names()):
+            raise ValueError("Read FASTQ headers mismatch.")
+        records = [None] * (2 * count)
+        records[0::2] = pair1.record_list()
+        records[1::2] = pair2.record_list()
+        yield ''.join(records), count
+
+
+def split_blocks(blocks):
+    """yield (read1, read2, pairs) for the records of a sequence of
+    FastqBlocks of interleaved reads, checking that the first of each pair
+    is read 1 and that the names of each pair match"""
+    for block in blocks:
+        if len(block) % 2:
+            raise ValueError("File does not appear interleaved.")
+        array = numpy.frombuffer(block.data, dtype=numpy.uint8)
+        lengths, names = block.names()
+        # the read number follows the first space of the header
+        ends = block.starts[:-1] + lengths
+        first = (array[ends] == 32) & (array[numpy.minimum(ends + 1, len(array) - 1)] == ord('1'))
+        if not (first[0::2].all() and not first[1::2].any()) or \
+                not same_names((lengths[0::2], names[0::2]), (lengths[1::2], names[1::2])):
+            raise ValueError("File does not appear interleaved.")
+        yield ''.join(block.record_list(2, 0)), ''.join(block.record_list(2, 1)), len(block) // 2
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+File: scheduler.py
+Author: Brant Faircloth
+
+Copyright (c) 2012 Brant C. Faircloth. All rights reserved.
+
+Description: Run work across cores.  Batches of per-sample jobs run
+concurrently within a budget of cores and memory: each job states the
+cores and memory it needs (usually estimated from the size of its input
+files); jobs are started largest first, and smaller jobs are packed into
+whatever remains free, so that one big sample does not hold up a batch.
+Many small items (files, loci) are split into chunks and mapped across a
+pool of processes, in order.
+
+"""
+
+import os
+import select
+import traceback
+import multiprocessing
+from collections import deque
+from multiprocessing.pool import ThreadPool
+
+
+class Job(object):
+    """A call of func(*args), needing `cores` cores and `memory` bytes.
+    Jobs are started in order of `size` (by default, their memory), largest
+    first."""
+    def __init__(self, name, func, args=(), cores=1, memory=0, size=None):
+        self.name = name
+        self.func = func
+        self.args = args
+        self.cores = cores
+        self.memory = memory
+        self.size = memory if size is None else size
+
+    def __repr__(self):
+        return "<Job {0}: {1} cores, {2:.1f} GB>".format(self.name, self.cores,
+                self.memory / 1024. ** 3)
+
+
+def get_chunks(paths, cores=1):
+    """split files into chunks, several per core, to hand to workers"""
+    size = max(1, len(paths) / (cores * 4))
+    return [paths[i:i + size] for i in xrange(0, len(paths), size)]
+
+
+def map_chunks(worker, work, cores=1, initializer=None, initargs=(), chunksize=1):
+    """yield worker(item) for each item of work, in order, using a pool of
+    `cores` processes when cores > 1.  Each process (or this one, when run
+    serially) first calls initializer(*initargs).  The pool is torn down if
+    a worker raises or the results are not all consumed."""
+    if cores > 1 and len(work) > 1:
+        pool = multiprocessing.Pool(cores, initializer, initargs)
+        finished = False
+        try:
+            for result in pool.imap(worker, work, chunksize):
+                yield result
+            finished = True
+        finally:
+            if finished:
+                pool.close()
+            else:
+                pool.terminate()
+            pool.join()
+    else:
+        if initializer is not None:
+            initializer(*initargs)
+        for item in work:
+            yield worker(item)
+
+
+def get_size(paths):
+    """return the total size, in bytes, of files"""
+    return sum([os.path.getsize(path) for path in paths])
+
+
+def _call(func, args):
+    """call func(*args), returning (result, None), or (None, traceback) if it
+    raises - so that failures get back from pool workers"""
+    try:
+        return func(*args), None
+    except Exception:
+        return None, traceback.format_exc()
+
+
+def _failure(result):
+    """return the traceback of an AsyncResult that failed outside of _call,
+    e.g. because its arguments or result could not be pickled"""
+    try:
+        result.get()
+    except Exception:
+        return traceback.format_exc()
+
+
+def run_jobs(jobs, cores=1, memory=None, threads=False, abort=None):
+    """run jobs concurrently within `cores` and `memory` (bytes, or None for
+    no limit), yielding (job, result, error) as each job finishes, where
+    error is the traceback of a job that raised (and result is None), else
+    None.  A failed job does not stop the others.  Jobs asking for more than
+    the budget run alone.  Jobs run in worker processes, or in threads if
+    `threads` - for jobs that mostly wait on subprocesses.  Threads cannot be
+    terminated, so if the jobs are abandoned while some are running (e.g. on
+    an interrupt) abort() is first called, if given, to stop them."""
+    pending = sorted(jobs, key=lambda job: job.size, reverse=True)
+    if not pending:
+        return
+    pool = ThreadPool(cores) if threads else multiprocessing.Pool(cores)
+    # callbacks signal each finished job down a pipe - unlike waiting on a
+    # lock (in Queue.get or Event.wait), a read can be interrupted.  Jobs
+    # that fail in the pool itself never call back, so the running jobs are
+    # also checked whenever the pipe is quiet.
+    finished = deque()
+    ready, signal = os.pipe()
+    def done(result, job):
+        finished.append((job, result))
+        os.write(signal, '.')
+    submitted = {}
+    free_cores, free_memory, running = cores, memory, 0
+    try:
+        while pending or running:
+            # start the largest jobs that fit, or the largest job if none
+            # are running, whatever it needs
+            for job in list(pending):
+                fits = job.cores <= free_cores and (memory is None or job.memory <= free_memory)
+                if fits or not running:
+                    pending.remove(job)
+                    free_cores -= job.cores
+                    if memory is not None:
+                        free_memory -= job.memory
+                    running += 1
+                    submitted[job] = pool.apply_async(_call, (job.func, job.args),
+                            callback=lambda result, job=job: done(result, job))
+            while not finished:
+                if select.select([ready], [], [], 1)[0]:
+                    os.read(ready, 1)
+                else:
+                    for job, result in submitted.items():
+                        if result.ready() and not result.successful():
+                            finished.append((job, (None, _failure(result))))
+            job, (result, error) = finished.popleft()
+            del submitted[job]
+            free_cores += job.cores
+            if memory is not None:
+                free_memory += job.memory
+            running -= 1
+            yield job, result, error
+    finally:
+        if running:
+            if abort is not None:
+                abort()
+            pool.terminate()
+        else:
+            pool.close()
+        pool.join()
+        os.close(ready)
+        os.close(signal)
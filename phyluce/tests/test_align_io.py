@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+File: test_align_io.py
+Author: Brant Faircloth
+
+Copyright (c) 2012 Brant C. Faircloth. All rights reserved.
+
+Description: Tests that the native alignment readers and writers give
+the same alignments, and the same files, as BioPython's AlignIO.
+
+"""
+
+import numpy
+import pytest
+from Bio import AlignIO
+
+from phyluce import align_io
+from phyluce.alignment import Alignment
+
+
+FORMATS = ['fasta', 'nexus', 'phylip', 'phylip-relaxed']
+
+
+def get_alignment(taxa, columns, seed=1):
+    random = numpy.random.RandomState(seed)
+    sequences = [''.join(random.choice(list('ACGT-N?'), columns)) for i in xrange(taxa)]
+    return Alignment.from_sequences(['taxon{0}'.format(i) for i in xrange(taxa)], sequences)
+
+
+def as_tuples(alignment):
+    return [(record.id, str(record.seq)) for record in alignment]
+
+
+@pytest.mark.parametrize('format', FORMATS)
+@pytest.mark.parametrize('columns', [7, 50, 123, 1201])
+def test_writer_matches_biopython(format, columns):
+    aln = get_alignment(5, columns)
+    assert align_io.to_string(aln, format) == aln.to_biopython().format(format)
+
+
+@pytest.mark.parametrize('format', FORMATS)
+@pytest.mark.parametrize('columns', [7, 50, 123, 1201])
+def test_reader_matches_biopython(tmpdir, format, columns):
+    aln = get_alignment(5, columns)
+    path = str(tmpdir.join('aln'))
+    AlignIO.write(aln.to_biopython(), path, format)
+    assert list(align_io.read(path, format)) == as_tuples(AlignIO.read(path, format))
+
+
+@pytest.mark.parametrize('format', FORMATS)
+def test_round_trip(tmpdir, format):
+    aln = get_alignment(4, 80)
+    path = str(tmpdir.join('aln'))
+    align_io.write(aln, path, format)
+    assert list(align_io.read(path, format)) == list(aln)
+
+
+def test_detect_format(tmpdir):
+    aln = get_alignment(3, 20)
+    for format, expected in [('fasta', 'fasta'), ('nexus', 'nexus'), ('phylip', 'phylip')]:
+        path = str(tmpdir.join('aln.txt'))
+        align_io.write(aln, path, format)
+        assert align_io.detect_format(path) == expected
+
+
+def test_nexus_interleaved_and_quoted():
+    data = "\n".join([
+        "#NEXUS",
+        "begin data;",
+        "dimensions ntax=2 nchar=8;",
+        "format datatype=dna interleave gap=-;",
+        "matrix",
+        "'taxon one' ACGT [a comment]",
+        "taxon2      AC-T",
+        "",
+        "'taxon one' TTAA",
+        "taxon2      TT-A",
+        ";",
+        "end;",
+    ])
+    aln = align_io.READERS['nexus'](data)
+    assert list(aln) == [('taxon one', 'ACGTTTAA'), ('taxon2', 'AC-TTT-A')]
+
+
+def test_nexus_ntax_from_taxa_block():
+    data = "\n".join([
+        "#NEXUS",
+        "begin taxa;",
+        "dimensions ntax=2;",
+        "taxlabels a b;",
+        "end;",
+        "begin characters;",
+        "dimensions nchar=4;",
+        "format datatype=dna gap=-;",
+        "matrix",
+        "a ACGT",
+        "b AC-T",
+        ";",
+        "end;",
+    ])
+    assert list(align_io.READERS['nexus'](data)) == [('a', 'ACGT'), ('b', 'AC-T')]
+
+
+def test_nexus_without_ntax_is_left_to_biopython():
+    data = "#NEXUS\nbegin data;\nformat datatype=dna;\nmatrix\na ACGT\n;\nend;\n"
+    with pytest.raises(align_io.NativeFormatError):
+        align_io.READERS['nexus'](data)
+
+
+@pytest.mark.parametrize('format', ['fasta', 'nexus', 'phylip'])
+def test_empty_file(tmpdir, format):
+    path = tmpdir.join('empty')
+    path.write('')
+    with pytest.raises(ValueError):
+        align_io.read(str(path), format)
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+File: test_align_screen.py
+Author: Brant Faircloth
+
+Copyright (c) 2012 Brant C. Faircloth. All rights reserved.
+
+Description: Tests that screening the raw bytes of alignment files finds
+the same problems as screening the parsed alignments.
+
+"""
+
+import pytest
+
+from phyluce import align_io
+from phyluce import align_screen
+from phyluce.alignment import Alignment
+
+
+ALIGNMENTS = {
+        'clean': ['ACGTNNACGT', 'ACGT--ACGN', 'NNACGTACGT'],
+        'n-runs': ['ACNNNNACGT', 'ACGT--ACGN', 'NNNCGTANNN'],
+        'x-bases': ['ACGTXXACGT', 'ACGT--ACGx', 'NNACGTACGT'],
+    }
+
+
+@pytest.mark.parametrize('format', ['fasta', 'nexus', 'phylip-relaxed'])
+@pytest.mark.parametrize('name', sorted(ALIGNMENTS))
+def test_screen_file_matches_alignment(tmpdir, format, name):
+    aln = Alignment.from_sequences(['taxon1', 'taxon2', 'taxon3'], ALIGNMENTS[name])
+    path = str(tmpdir.join(name))
+    align_io.write(aln, path, format)
+    n_runs, x_bases = align_screen.screen_file(path, format)
+    assert (n_runs, x_bases) == align_screen.screen_alignment(aln)
+    if name == 'clean':
+        assert (n_runs, x_bases) == ([], [])
+    elif name == 'n-runs':
+        assert n_runs == [('taxon1', [4]), ('taxon3', [3, 3])]
+    else:
+        assert x_bases == [('taxon1', 2), ('taxon2', 1)]
+
+
+def test_malformed_clean_file_is_an_error(tmpdir):
+    # no N-run or X, but not an alignment
+    bad = tmpdir.join('bad.fasta')
+    bad.write('>a\nACGT\n>b\nAC\n')
+    with pytest.raises(ValueError):
+        align_screen.screen_file(str(bad), 'fasta')
+    results = list(align_screen.screen_files([str(bad)], 'fasta'))
+    assert results[0][0] == str(bad)
+    assert results[0][1]
+
+
+def test_screen_files_in_order(tmpdir):
+    paths = []
+    for name in sorted(ALIGNMENTS):
+        aln = Alignment.from_sequences(['taxon1', 'taxon2', 'taxon3'], ALIGNMENTS[name])
+        path = str(tmpdir.join('{0}.nexus'.format(name)))
+        align_io.write(aln, path, 'nexus')
+        paths.append(path)
+    serial = list(align_screen.screen_files(paths, 'nexus'))
+    assert [result[0] for result in serial] == paths
+    assert list(align_screen.screen_files(paths, 'nexus', cores=2)) == serial
@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+File: test_align_stats.py
+Author: Brant Faircloth
+
+Copyright (c) 2012 Brant C. Faircloth. All rights reserved.
+
+Description: Tests of the single-pass alignment statistics, against
+statistics computed character by character.
+
+"""
+
+import os
+import numpy
+import pytest
+from collections import Counter
+
+from phyluce import align_io
+from phyluce import align_stats
+from phyluce.alignment import Alignment
+
+
+def get_alignment(taxa, columns, seed):
+    random = numpy.random.RandomState(seed)
+    sequences = []
+    for i in xrange(taxa):
+        sequence = list(random.choice(list('AACCGGTTN?X'), columns))
+        # ragged ends, and a run of N
+        sequence[:random.randint(0, 4)] = '-' * random.randint(0, 4)
+        sequence = ''.join(sequence)[:columns].rjust(columns, '-')
+        if i == 0:
+            sequence = 'NNNN' + sequence[4:]
+        sequences.append(sequence)
+    return Alignment.from_sequences(['taxon{0}'.format(i) for i in xrange(taxa)], sequences)
+
+
+def slow_locus(aln):
+    """the locus statistics, a column at a time"""
+    informative = variable = characters = 0
+    for idx in xrange(aln.get_alignment_length()):
+        column = aln.column(idx).tostring()
+        counts = Counter([c for c in column if c not in '-N?'])
+        if len([c for c in counts.values() if c >= 2]) >= 2:
+            informative += 1
+        if len(counts) >= 2:
+            variable += 1
+        if set(column) - set('?nN-'):
+            characters += 1
+    trimmed = sum([len(seq) - len(seq.lstrip('-')) + len(seq) - len(seq.rstrip('-'))
+            for name, seq in aln if seq.strip('-')])
+    return informative, variable, characters, trimmed
+
+
+def slow_n_runs(sequence):
+    """the lengths of runs of 3 or more N, a character at a time"""
+    runs, length = [], 0
+    for c in sequence + '.':
+        if c == 'N':
+            length += 1
+        else:
+            if length >= 3:
+                runs.append(str(length))
+            length = 0
+    return ','.join(runs)
+
+
+@pytest.fixture
+def alignments(tmpdir):
+    paths = []
+    for seed in xrange(6):
+        path = str(tmpdir.join('locus{0}.nexus'.format(seed)))
+        align_io.write(get_alignment(5 + seed, 40 + seed * 7, seed), path, 'nexus')
+        paths.append(path)
+    return paths
+
+
+def test_compute_locus(alignments):
+    for path in alignments:
+        aln = align_io.read(path)
+        locus, taxa, bases = align_stats.compute_locus(path)
+        informative, variable, characters, trimmed = slow_locus(aln)
+        assert locus.length == aln.get_alignment_length()
+        assert locus.taxa == len(aln)
+        assert locus.informative == informative
+        assert locus.variable == variable
+        assert locus.characters == characters
+        assert locus.trimmed == trimmed
+        assert locus.x_bases == sum([seq.count('X') for name, seq in aln])
+        assert locus.gaps == sum([seq.count('-') for name, seq in aln])
+        assert bases == dict(Counter(''.join([seq for name, seq in aln])))
+        assert [taxon.taxon for taxon in taxa] == aln.names
+        assert [taxon.n_runs for taxon in taxa] == [slow_n_runs(seq) for name, seq in aln]
+        assert locus.n_runs == sum([len(taxon.n_runs.split(',')) for taxon in taxa if taxon.n_runs])
+
+
+def test_merge_equals_single_pass(alignments):
+    single = align_stats.compute_stats(alignments)
+    merged = align_stats.compute_stats(alignments[:2])
+    merged.merge(align_stats.compute_stats(alignments[2:]))
+    assert merged.totals == single.totals
+    assert merged.base_totals == single.base_totals
+    assert merged.loci == single.loci
+
+
+def test_parallel_equals_serial(alignments):
+    serial = align_stats.compute_stats(alignments)
+    parallel = align_stats.compute_stats(alignments, cores=2)
+    assert parallel.loci == serial.loci
+    assert parallel.totals == serial.totals
+
+
+def test_remove(alignments):
+    stats = align_stats.compute_stats(alignments)
+    stats.remove(alignments[0])
+    assert stats.totals == align_stats.compute_stats(alignments[1:]).totals
+    assert alignments[0] not in stats
+
+
+def test_bad_alignment_is_an_error(tmpdir, alignments):
+    bad = tmpdir.join('bad.fasta')
+    bad.write('>a\nACGT\n>b\nAC\n')
+    stats = align_stats.compute_stats(alignments + [str(bad)])
+    assert str(bad) in stats
+    assert stats.get_error(str(bad))
+    assert stats.totals['loci'] == len(alignments)
+
+
+def test_save_and_load(tmpdir, alignments):
+    db = str(tmpdir.join('stats.sqlite'))
+    stats = align_stats.compute_stats(alignments)
+    stats.save(db)
+    loaded = align_stats.AlignmentStats.load(db)
+    assert loaded.loci == stats.loci
+    assert loaded.taxa == stats.taxa
+    assert loaded.totals == stats.totals
+    some = align_stats.AlignmentStats.load(db, alignments[:2])
+    assert sorted(some.loci) == sorted([os.path.abspath(path) for path in alignments[:2]])
+
+
+def test_update_reads_only_changed_files(tmpdir, alignments):
+    db = str(tmpdir.join('stats.sqlite'))
+    align_stats.get_stats(alignments, db=db)
+    changed = alignments[0]
+    align_io.write(get_alignment(3, 20, 99), changed, 'nexus')
+    os.remove(alignments[1])
+    stats = align_stats.get_stats([changed] + alignments[2:], db=db)
+    assert stats.get_locus(changed).taxa == 3
+    assert align_stats.AlignmentStats.stored_paths(db) == \
+            set([os.path.abspath(path) for path in [changed] + alignments[2:]])
+
+
+@pytest.mark.parametrize('values', [[5], [3, 8], [1, 1, 1, 1], range(100), [2.5, -1, 7.25]])
+def test_running_stats_match_numpy(values):
+    stats = align_stats.RunningStats()
+    for value in values:
+        stats.add(value)
+    assert stats.n == len(values)
+    assert numpy.allclose(stats.mean(), numpy.mean(values))
+    assert numpy.allclose(stats.std(), numpy.std(values))
+    assert (stats.min, stats.max) == (min(values), max(values))
+    if len(values) > 1:
+        assert numpy.allclose(stats.std(ddof=1), numpy.std(values, ddof=1))
+
+
+def test_running_stats_empty():
+    stats = align_stats.RunningStats()
+    assert numpy.isnan(stats.mean())
+    assert numpy.isnan(stats.std())
+    assert stats.min is None and stats.max is None
+
+
+def test_running_stats_one_alignment(tmpdir):
+    # a 95% CI of one alignment is nan, as numpy gives, not an error
+    path = str(tmpdir.join('locus.nexus'))
+    align_io.write(get_alignment(4, 30, 1), path, 'nexus')
+    stats = align_stats.compute_stats([path])
+    lengths = align_stats.RunningStats()
+    for locus in stats.loci.values():
+        lengths.add(locus.length)
+    assert lengths.mean() == 30
+    assert numpy.isnan(lengths.std(ddof=1))
+
+
+def test_running_stats_merge():
+    values = range(20)
+    whole, first, second = [align_stats.RunningStats(histogram=True) for i in xrange(3)]
+    for value in values:
+        whole.add(value)
+        (first if value < 7 else second).add(value)
+    first.merge(second).merge(align_stats.RunningStats())
+    assert (first.n, first.total, first.sumsq, first.min, first.max) == \
+            (whole.n, whole.total, whole.sumsq, whole.min, whole.max)
+    assert first.histogram == whole.histogram
+    empty = align_stats.RunningStats().merge(whole)
+    assert (empty.min, empty.max, empty.mean()) == (0, 19, whole.mean())
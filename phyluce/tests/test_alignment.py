@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+File: test_alignment.py
+Author: Brant Faircloth
+
+Copyright (c) 2012 Brant C. Faircloth. All rights reserved.
+
+Description: Tests of the array-backed Alignment, against biopython.
+
+"""
+
+import numpy
+import pytest
+from Bio.Align import AlignInfo
+
+from phyluce.alignment import Alignment
+
+
+NAMES = ['taxon1', 'taxon2', 'taxon3', 'taxon4']
+SEQUENCES = [
+        '--ACGTTAGC-A',
+        'CTACGTAAGCAA',
+        'CTACNTTAGC--',
+        '---CGTTAGG--',
+    ]
+
+
+@pytest.fixture
+def aln():
+    return Alignment.from_sequences(NAMES, SEQUENCES)
+
+
+def test_from_sequences(aln):
+    assert len(aln) == 4
+    assert aln.get_alignment_length() == 12
+    assert list(aln) == zip(NAMES, SEQUENCES)
+
+
+def test_from_sequences_ragged():
+    with pytest.raises(ValueError):
+        Alignment.from_sequences(['a', 'b'], ['ACGT', 'ACG'])
+
+
+def test_biopython_round_trip(aln):
+    bio = aln.to_biopython()
+    assert [(record.id, str(record.seq)) for record in bio] == zip(NAMES, SEQUENCES)
+    assert list(Alignment.from_biopython(bio)) == list(aln)
+
+
+def test_slices_share_matrix(aln):
+    sliced = aln[1:3, 2:6]
+    assert sliced.names == NAMES[1:3]
+    assert [seq for name, seq in sliced] == ['ACGT', 'ACNT']
+    sliced.matrix[0, 0] = ord('G')
+    assert aln.sequence(1)[2] == 'G'
+
+
+def test_select(aln):
+    assert aln.select([True, False, False, True]).names == ['taxon1', 'taxon4']
+    assert aln.select([2]).names == ['taxon3']
+
+
+def test_case(aln):
+    lower = aln.lower()
+    assert lower.sequence(0) == SEQUENCES[0].lower()
+    assert lower.upper().sequence(0) == SEQUENCES[0]
+
+
+def test_ends(aln):
+    start, end = aln.ends()
+    assert start.tolist() == [2, 0, 0, 3]
+    assert end.tolist() == [12, 12, 10, 10]
+
+
+def test_ends_all_gaps():
+    start, end = Alignment.from_sequences(['a'], ['----']).ends()
+    assert start.tolist() == [4]
+    assert end.tolist() == [0]
+
+
+def test_runs(aln):
+    rows, starts, lengths, terminal = aln.runs()
+    assert rows.tolist() == [0, 0, 2, 3, 3]
+    assert starts.tolist() == [0, 10, 10, 0, 10]
+    assert lengths.tolist() == [2, 1, 2, 3, 2]
+    assert terminal.tolist() == [True, False, True, True, True]
+    leading, trailing = aln.terminal_runs()
+    assert leading.tolist() == [2, 0, 0, 3]
+    assert trailing.tolist() == [0, 0, 2, 2]
+
+
+def test_character_counts(aln):
+    characters, counts = aln.character_counts(exclude='-')
+    assert characters == 'ACGNT'
+    assert counts[:, 2].tolist() == [3, 0, 0, 0, 0]
+    assert counts.sum() == sum([len(seq.replace('-', '')) for seq in SEQUENCES])
+
+
+@pytest.mark.parametrize('threshold', [0.5, 0.7, 1.])
+def test_consensus_matches_biopython(aln, threshold):
+    summary = AlignInfo.SummaryInfo(aln.to_biopython())
+    expected = str(summary.dumb_consensus(threshold=threshold, ambiguous='X'))
+    assert aln.consensus(threshold=threshold) == expected
+
+
+def test_consensus_random_matches_biopython():
+    random = numpy.random.RandomState(1)
+    sequences = [''.join(random.choice(list('AACGT-'), 50)) for i in xrange(6)]
+    aln = Alignment.from_sequences(['t{0}'.format(i) for i in xrange(6)], sequences)
+    summary = AlignInfo.SummaryInfo(aln.to_biopython())
+    assert aln.consensus() == str(summary.dumb_consensus(ambiguous='X'))
+
+
+def test_consensus_all_gaps():
+    aln = Alignment.from_sequences(['a', 'b'], ['A-', 'A-'])
+    assert aln.consensus() == 'AX'
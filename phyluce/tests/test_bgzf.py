@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+File: test_bgzf.py
+Author: Brant Faircloth
+
+Copyright (c) 2012 Brant C. Faircloth. All rights reserved.
+
+Description: Tests that BGZF files round-trip through the gzip module.
+
+"""
+
+import io
+import gzip
+import numpy
+import pytest
+
+from phyluce import bgzf
+
+
+def get_data(size, seed=1):
+    random = numpy.random.RandomState(seed)
+    # compressible, like reads, with a stretch that is not
+    data = ''.join(random.choice(list('ACGTN\n'), size))
+    return data[:size // 2] + random.bytes(size - size // 2)
+
+
+SIZES = [0, 1, 1000, bgzf.BLOCK_SIZE, bgzf.BLOCK_SIZE + 1, 5 * bgzf.BLOCK_SIZE + 17]
+
+
+@pytest.mark.parametrize('size', SIZES)
+@pytest.mark.parametrize('threads', [1, 3])
+def test_bgzf_read_by_gzip(tmpdir, size, threads):
+    data = get_data(size)
+    path = str(tmpdir.join('data.gz'))
+    with bgzf.open(path, 'wb', threads=threads) as outfile:
+        # in uneven pieces, crossing block boundaries
+        for start in xrange(0, size, 9999):
+            outfile.write(data[start:start + 9999])
+    assert bgzf.is_bgzf(path)
+    with gzip.open(path, 'rb') as infile:
+        assert infile.read() == data
+    with bgzf.open(path, threads=threads) as infile:
+        assert infile.read() == data
+
+
+@pytest.mark.parametrize('size', SIZES)
+def test_gzip_read_by_bgzf(tmpdir, size):
+    data = get_data(size)
+    path = str(tmpdir.join('data.gz'))
+    with gzip.open(path, 'wb') as outfile:
+        outfile.write(data)
+    assert not bgzf.is_bgzf(path)
+    with bgzf.open(path) as infile:
+        assert infile.read() == data
+
+
+def test_uncompressed_read_by_bgzf(tmpdir):
+    data = get_data(1000)
+    path = tmpdir.join('data')
+    path.write(data, mode='wb')
+    with bgzf.open(str(path)) as infile:
+        assert infile.read() == data
+
+
+def test_readline_across_blocks(tmpdir):
+    lines = ['@read{0}\n{1}\n+\n{2}\n'.format(i, 'ACGT' * 25, 'I' * 100) for i in xrange(3000)]
+    path = str(tmpdir.join('reads.fastq.gz'))
+    with bgzf.open(path, 'wb', threads=2) as outfile:
+        outfile.writelines(lines)
+    with bgzf.open(path, threads=2) as infile:
+        assert ''.join(infile) == ''.join(lines)
+
+
+def test_truncated_file(tmpdir):
+    path = str(tmpdir.join('data.gz'))
+    with bgzf.open(path, 'wb') as outfile:
+        outfile.write(get_data(3 * bgzf.BLOCK_SIZE))
+    with open(path, 'rb') as infile:
+        data = infile.read()
+    with open(path, 'wb') as outfile:
+        outfile.write(data[:len(data) // 2])
+    with pytest.raises(IOError):
+        with bgzf.open(path) as infile:
+            infile.read()
+
+
+def test_corrupt_block():
+    block = bgzf.compress_block('ACGT' * 100)
+    cdata, crc, size = list(bgzf.read_blocks(io.BytesIO(block)))[0]
+    with pytest.raises(IOError):
+        bgzf.decompress_block((cdata, crc ^ 1, size))
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+File: test_concatenate.py
+Author: Brant Faircloth
+
+Copyright (c) 2012 Brant C. Faircloth. All rights reserved.
+
+Description: Tests of supermatrices built from a LocusStore, against
+Bio.Nexus.combine.
+
+"""
+
+import os
+import numpy
+import pytest
+from Bio.Nexus import Nexus
+
+from phyluce import align_io
+from phyluce import concatenate
+from phyluce.alignment import Alignment
+
+
+TAXA = ['taxon{0}'.format(i) for i in xrange(6)]
+
+
+def get_alignment(columns, seed):
+    random = numpy.random.RandomState(seed)
+    # each locus lacks some taxa, in a shuffled order
+    taxa = [TAXA[i] for i in random.permutation(len(TAXA))[:random.randint(2, len(TAXA) + 1)]]
+    sequences = [''.join(random.choice(list('ACGT-'), columns)) for taxon in taxa]
+    return Alignment.from_sequences(taxa, sequences)
+
+
+@pytest.fixture
+def loci(tmpdir):
+    paths = []
+    for seed in xrange(8):
+        path = str(tmpdir.join('uce-{0}.nexus'.format(seed)))
+        align_io.write(get_alignment(10 + seed * 3, seed), path, 'nexus')
+        paths.append(path)
+    return paths
+
+
+def test_supermatrix_matches_nexus_combine(loci):
+    store = concatenate.LocusStore.from_files(loci)
+    aln, charsets = store.supermatrix()
+    combined = Nexus.combine([(path, Nexus.Nexus(path)) for path in loci])
+    assert sorted(aln.names) == sorted(combined.taxlabels)
+    for name, sequence in aln:
+        assert sequence == str(combined.matrix[name])
+    assert [(start, end) for name, start, end in charsets] == \
+            [(min(combined.charsets[path]) + 1, max(combined.charsets[path]) + 1) for path in loci]
+
+
+def test_supermatrix_of_a_selection(loci):
+    store = concatenate.LocusStore.from_files(loci)
+    aln, charsets = store.supermatrix([3, 1, 3])
+    assert [name for name, start, end in charsets] == ['uce-3', 'uce-1', 'uce-3.copy']
+    for name, start, end in charsets:
+        locus = align_io.read(loci[int(name.split('.')[0][4:])])
+        part = aln[:, start - 1:end]
+        for taxon, sequence in part:
+            if taxon in locus.names:
+                assert sequence == locus.sequence(locus.index(taxon))
+            else:
+                assert sequence == '?' * locus.get_alignment_length()
+
+
+def test_parallel_read_equals_serial(loci):
+    serial = concatenate.LocusStore.from_files(loci)
+    parallel = concatenate.LocusStore.from_files(loci, cores=2)
+    assert parallel.taxa == serial.taxa
+    assert (parallel.data == serial.data).all()
+
+
+def test_write_supermatrices(tmpdir, loci):
+    store = concatenate.LocusStore.from_files(loci)
+    work = [([0, 1, 2], str(tmpdir.join('one.nexus')), 'nexus'),
+            ([4, 5], str(tmpdir.join('two.phylip')), 'phylip')]
+    assert list(concatenate.write_supermatrices(store, work, cores=2)) == [w[1] for w in work]
+    aln, charsets = store.supermatrix([0, 1, 2])
+    assert list(align_io.read(work[0][1], 'nexus')) == list(aln)
+    assert list(align_io.read(work[1][1], 'phylip-relaxed')) == list(store.supermatrix([4, 5])[0])
+    with open(str(tmpdir.join('two.partitions'))) as partitions:
+        assert partitions.readline().startswith('DNA, uce-4 = 1-')
+
+
+def test_parse_charsets():
+    text = "begin sets;\ncharset a = 1-4;\ncharset 'b c' = 5 7 9-10\\2 [comment];\n" + \
+            "charset d = 8-.;\ncharset e = a b;\nend;\n"
+    charsets, skipped = concatenate.parse_charsets(text, 12)
+    assert charsets.keys() == ['a', 'b c', 'd']
+    assert charsets['a'].tolist() == [0, 1, 2, 3]
+    assert charsets['b c'].tolist() == [4, 6, 8]
+    assert charsets['d'].tolist() == [7, 8, 9, 10, 11]
+    assert skipped == ['e']
+
+
+@pytest.mark.parametrize('writer', ['phyluce', 'biopython'])
+def test_read_supermatrix(tmpdir, loci, writer):
+    store = concatenate.LocusStore.from_files(loci)
+    aln, charsets = store.supermatrix()
+    path = str(tmpdir.join('supermatrix.nexus'))
+    if writer == 'phyluce':
+        concatenate.write(aln, charsets, path)
+    else:
+        combined = Nexus.combine([(p, Nexus.Nexus(p)) for p in loci])
+        combined.write_nexus_data(filename=path)
+    read, read_charsets, skipped = concatenate.read_supermatrix(path)
+    assert sorted(read) == sorted(aln)
+    assert len(read_charsets) == len(loci)
+    assert skipped == []
+
+
+def test_read_interleaved_supermatrix(tmpdir, loci):
+    # not laid out for mapping, so read with align_io
+    store = concatenate.LocusStore.from_files(loci)
+    aln, charsets = store.supermatrix()
+    path = str(tmpdir.join('supermatrix.nexus'))
+    with open(path, 'wb') as outfile:
+        outfile.write(align_io.to_string(aln, 'nexus', interleave=True, blocksize=7))
+        outfile.write(concatenate.format_sets(charsets))
+    read, read_charsets, skipped = concatenate.read_supermatrix(path)
+    assert list(read) == list(aln)
+    assert read_charsets.keys() == [name for name, start, end in charsets]
+
+
+def test_split_supermatrix_matches_biopython(tmpdir, loci):
+    store = concatenate.LocusStore.from_files(loci)
+    aln, charsets = store.supermatrix()
+    path = str(tmpdir.join('supermatrix.nexus'))
+    concatenate.write(aln, charsets, path)
+    read, read_charsets, skipped = concatenate.read_supermatrix(path)
+    output = tmpdir.mkdir('split')
+    written = list(concatenate.split_supermatrix(read, read_charsets, str(output), cores=2))
+    assert written == read_charsets.keys()
+    bio = aln.to_biopython()
+    for name, start, end in charsets:
+        with open(os.path.join(str(output), '{0}.nex'.format(name)), 'rb') as infile:
+            assert infile.read() == bio[:, start - 1:end].format('nexus')
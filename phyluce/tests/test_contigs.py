@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+File: test_contigs.py
+Author: Brant Faircloth
+
+Copyright (c) 2012 Brant C. Faircloth. All rights reserved.
+
+Description: Tests of contig lengths read in blocks, against fasta read a
+line at a time, and of contig summaries.
+
+"""
+
+import io
+import numpy
+import pytest
+
+from phyluce import contigs
+
+
+def get_fasta(count, seed=1, width=60):
+    random = numpy.random.RandomState(seed)
+    lines = []
+    for i in xrange(count):
+        length = random.randint(0, 300)
+        sequence = ''.join(random.choice(list('ACGT'), length))
+        lines.append('>NODE_{0}_length_{1}_cov_{2:.6f}'.format(i + 1, length, random.rand() * 50))
+        lines.extend([sequence[j:j + width] for j in xrange(0, length, width)])
+    return '\n'.join(lines) + '\n'
+
+
+def slow_lengths(data):
+    """the (header, length) of each sequence, a line at a time"""
+    records = []
+    for line in data.splitlines():
+        if line.startswith('>'):
+            records.append([line[1:], 0])
+        else:
+            records[-1][1] += len(line)
+    return [tuple(record) for record in records]
+
+
+@pytest.mark.parametrize('size', [1, 3, 7, 64, 1 << 22])
+@pytest.mark.parametrize('width', [1, 60, 1000])
+def test_fasta_lengths_across_blocks(size, width):
+    data = get_fasta(30, width=width)
+    assert list(contigs.fasta_lengths(io.BytesIO(data), size)) == slow_lengths(data)
+
+
+@pytest.mark.parametrize('size', [1, 5, 1 << 22])
+def test_fasta_lengths_crlf_and_no_final_newline(size):
+    data = get_fasta(20)
+    expected = slow_lengths(data)
+    assert list(contigs.fasta_lengths(io.BytesIO(data.replace('\n', '\r\n')), size)) == expected
+    assert list(contigs.fasta_lengths(io.BytesIO(data.rstrip('\n')), size)) == expected
+
+
+def test_fasta_lengths_empty():
+    assert list(contigs.fasta_lengths(io.BytesIO(''))) == []
+    assert list(contigs.fasta_lengths(io.BytesIO('>a\n>b\nAC\n'), 2)) == [('a', 0), ('b', 2)]
+
+
+def test_get_coverage_and_node():
+    assert contigs.get_coverage('NODE_3_length_120_cov_12.500000') == 12.5
+    assert contigs.get_coverage('NODE_3_length_120_cov_x') is None
+    assert contigs.get_coverage('contig1') is None
+    assert contigs.get_node('NODE_3_length_120_cov_12.500000') == 'node_3'
+
+
+def test_contig_stats():
+    stats = contigs.ContigStats()
+    assert stats.length_summary() == [0, 0] + [''] * 5
+    assert stats.coverage_summary() == [''] * (5 + len(contigs.COVERAGE_LIMITS))
+    lengths, coverages = [100, 250, 75, 400], [5., 30., 60., 120.]
+    for length, coverage in zip(lengths, coverages):
+        stats.add(length, coverage)
+    count, bp, mean, ci, low, high, median = stats.length_summary()
+    assert (count, bp, low, high, median) == (4, sum(lengths), 75, 400, numpy.median(lengths))
+    assert mean == numpy.mean(lengths)
+    assert numpy.allclose(ci, 1.96 * numpy.std(lengths, ddof=1) / 2)
+    summary = stats.coverage_summary(scale=0.5)
+    scaled = numpy.array(coverages) * 0.5
+    assert numpy.allclose(summary[:5], [scaled.mean(), 1.96 * numpy.std(scaled, ddof=1) / 2,
+            scaled.min(), scaled.max(), numpy.median(scaled)])
+    assert summary[5:] == [int((scaled < limit).sum()) for limit in contigs.COVERAGE_LIMITS]
+
+
+def test_contig_stats_single():
+    stats = contigs.ContigStats()
+    stats.add(100, 4.)
+    assert numpy.isnan(stats.length_summary()[3])
+    assert numpy.isnan(stats.coverage_summary()[1])
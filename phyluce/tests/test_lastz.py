@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+File: test_lastz.py
+Author: Brant Faircloth
+
+Copyright (c) 2012 Brant C. Faircloth. All rights reserved.
+
+Description: Tests of reading lastz results, which are passed between
+processes, so must pickle.
+
+"""
+
+import pickle
+import pytest
+
+from phyluce import lastz
+
+
+SHORT = "3000\t>uce-1\t+\t10\t110\t100\t>chr1\t-\t500\t600\t100\t2\t100M\t98/100\t98.0%\t100/100\t100.0%\n"
+LONG = SHORT.rstrip('\n') + "\t100/120\t83.3%\n"
+
+
+@pytest.mark.parametrize('long_format, line, record', [
+        (False, SHORT, lastz.Lastz),
+        (True, LONG, lastz.LastzLong),
+    ])
+def test_reader_records_pickle(tmpdir, long_format, line, record):
+    path = tmpdir.join('hits.lastz')
+    path.write(line * 2)
+    hits = list(lastz.Reader(str(path), long_format))
+    assert len(hits) == 2
+    hit = hits[0]
+    assert type(hit) is record
+    assert (hit.name1, hit.name2, hit.zstart1, hit.percent_identity) == ('uce-1', 'chr1', 10, 98.0)
+    if long_format:
+        assert hit.percent_coverage == 83.3
+    for protocol in xrange(pickle.HIGHEST_PROTOCOL + 1):
+        copy = pickle.loads(pickle.dumps(hit, protocol))
+        assert copy == hit and type(copy) is record
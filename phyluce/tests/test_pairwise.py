@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+File: test_pairwise.py
+Author: Brant Faircloth
+
+Copyright (c) 2012 Brant C. Faircloth. All rights reserved.
+
+Description: Tests of the all-pairs p-distances, against a comparison of
+every pair of taxa, base by base.
+
+"""
+
+import numpy
+import pytest
+from StringIO import StringIO
+
+from phyluce import pairwise
+from phyluce.alignment import Alignment
+
+
+def get_alignment(taxa, columns, seed):
+    random = numpy.random.RandomState(seed)
+    sequences = [''.join(random.choice(list('ACGTacgt-?NXR'), columns)) for i in xrange(taxa)]
+    return Alignment.from_sequences(['taxon{0}'.format(i) for i in xrange(taxa)], sequences)
+
+
+def slow_counts(aln, missing=pairwise.MISSING):
+    ntax = len(aln)
+    compared = numpy.zeros((ntax, ntax), dtype=int)
+    differences = numpy.zeros((ntax, ntax), dtype=int)
+    sequences = [seq.upper() for name, seq in aln]
+    for i in xrange(ntax):
+        for j in xrange(ntax):
+            for a, b in zip(sequences[i], sequences[j]):
+                if a in missing.upper() or b in missing.upper():
+                    continue
+                compared[i, j] += 1
+                differences[i, j] += a != b
+    return compared, differences
+
+
+@pytest.mark.parametrize('seed', range(10))
+@pytest.mark.parametrize('block_size', [1, 3, 256])
+def test_counts_match_pair_by_pair(seed, block_size):
+    aln = get_alignment(2 + seed, 30 + seed * 5, seed)
+    compared, differences = pairwise.pairwise_counts(aln, block_size=block_size)
+    slow_compared, slow_differences = slow_counts(aln)
+    assert (compared == slow_compared).all()
+    assert (differences == slow_differences).all()
+
+
+def test_p_distances():
+    aln = Alignment.from_sequences(['a', 'b', 'c'], ['ACGT', 'ACGA', 'NN--'])
+    distances, compared = pairwise.p_distances(aln)
+    assert distances[0, 1] == distances[1, 0] == 0.25
+    assert distances[0, 0] == 0
+    assert numpy.isnan(distances[0, 2])
+    assert compared[0, 2] == 0
+    assert pairwise.mean_distance(distances) == 0.25
+
+
+def test_mean_distance_without_pairs():
+    assert numpy.isnan(pairwise.mean_distance(numpy.zeros((1, 1))))
+
+
+def test_write_matrix():
+    outf = StringIO()
+    pairwise.write_matrix(outf, ['a', 'b'], numpy.array([[0, 0.5], [0.5, float('nan')]]), 2)
+    assert outf.getvalue() == ",a,b\na,0.00,0.50\nb,0.50,NA\n"
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+File: test_reads.py
+Author: Brant Faircloth
+
+Copyright (c) 2012 Brant C. Faircloth. All rights reserved.
+
+Description: Tests of read length histograms and of fastq blocks, against
+numpy and reads handled one record at a time.
+
+"""
+
+import io
+import time
+import numpy
+import pytest
+import threading
+
+from phyluce import reads
+
+
+def get_fastq(count, seed=1, first=1):
+    random = numpy.random.RandomState(seed)
+    records = []
+    for i in xrange(count):
+        length = random.randint(1, 120)
+        sequence = ''.join(random.choice(list('ACGTN'), length))
+        records.append('@HWI-ST:1:1101:{0}:2000#ACGTAC/1 {1}:N:0\n{2}\n+\n{3}\n'.format(
+                i, first, sequence, 'I' * length))
+    return records
+
+
+def test_histogram_empty():
+    lengths = reads.LengthHistogram()
+    assert (lengths.reads, lengths.bp) == (0, 0)
+    for value in (lengths.mean, lengths.std, lengths.std_error, lengths.ci):
+        assert numpy.isnan(value)
+    assert lengths.summary() == {'reads': 0, 'bp': 0}
+
+
+def test_histogram_single():
+    lengths = reads.LengthHistogram()
+    lengths.add(75)
+    assert lengths.mean == 75
+    assert (lengths.min, lengths.max, lengths.median) == (75, 75, 75)
+    assert numpy.isnan(lengths.std) and numpy.isnan(lengths.ci)
+
+
+@pytest.mark.parametrize('values', [[3, 8], [1, 1, 1, 1], range(1, 1000, 7), [5, 2, 900, 14, 14]])
+def test_histogram_matches_numpy(values):
+    lengths = reads.LengthHistogram(size=4)
+    lengths.update(numpy.array(values))
+    assert (lengths.reads, lengths.bp) == (len(values), sum(values))
+    assert numpy.allclose(lengths.mean, numpy.mean(values))
+    assert numpy.allclose(lengths.std, numpy.std(values, ddof=1))
+    assert numpy.allclose(lengths.std_error, numpy.std(values, ddof=1) / numpy.sqrt(len(values)))
+    assert lengths.median == numpy.median(values)
+    assert (lengths.min, lengths.max) == (min(values), max(values))
+
+
+def test_histogram_merge():
+    whole, first, second = [reads.LengthHistogram(size=8) for i in xrange(3)]
+    for value in range(1, 300, 3):
+        whole.add(value)
+        (first if value < 100 else second).add(value)
+    first.merge(second).merge(reads.LengthHistogram())
+    assert first.summary() == whole.summary()
+
+
+@pytest.mark.parametrize('size', [1, 7, 64, 1 << 22])
+def test_fastq_lengths_across_blocks(size):
+    records = get_fastq(50)
+    expected = [len(record.split('\n')[1]) for record in records]
+    lengths = reads.fastq_lengths(io.BytesIO(''.join(records)), size=size)
+    assert lengths.counts.tolist()[:max(expected) + 1] == numpy.bincount(expected).tolist()
+    assert not lengths.counts[max(expected) + 1:].any()
+    # without a final newline
+    lengths = reads.fastq_lengths(io.BytesIO(''.join(records).rstrip()), size=size)
+    assert (lengths.reads, lengths.bp) == (len(expected), sum(expected))
+
+
+@pytest.mark.parametrize('size', [1, 100, 1 << 22])
+@pytest.mark.parametrize('multiple', [1, 2])
+def test_fastq_blocks_match_records(size, multiple):
+    records = get_fastq(60)
+    blocks = list(reads.fastq_blocks(io.BytesIO(''.join(records)), size, multiple))
+    assert [len(block) % multiple for block in blocks[:-1]] == [0] * (len(blocks) - 1)
+    assert sum([block.record_list() for block in blocks], []) == records
+    block = reads.FastqBlock(''.join(records), numpy.cumsum([0] + map(len, records)))
+    sequences = [record.split('\n')[1] for record in records]
+    assert block.lengths().tolist() == map(len, sequences)
+    assert block.containing('N').tolist() == ['N' in seq for seq in sequences]
+    assert block.tags() == ['ACGTAC'] * len(records)
+    keep = ~block.containing('N')
+    assert block.records(keep) == ''.join([r for r, k in zip(records, keep) if k])
+
+
+def test_fastq_blocks_truncated():
+    # the last record lacks its plus and quality lines
+    data = ''.join(get_fastq(5)).split('\n')
+    with pytest.raises(IOError):
+        list(reads.fastq_blocks(io.BytesIO('\n'.join(data[:-3]))))
+
+
+@pytest.mark.parametrize('size', [50, 1 << 22])
+def test_interleave_and_split(size):
+    read1, read2 = get_fastq(40, 1, 1), get_fastq(40, 2, 2)
+    blocks1 = reads.fastq_blocks(io.BytesIO(''.join(read1)), size)
+    blocks2 = reads.fastq_blocks(io.BytesIO(''.join(read2)), size * 3)
+    interleaved = list(reads.interleave_blocks(blocks1, blocks2))
+    data = ''.join([d for d, count in interleaved])
+    assert data == ''.join([r1 + r2 for r1, r2 in zip(read1, read2)])
+    assert sum([count for d, count in interleaved]) == 40
+    split = list(reads.split_blocks(reads.fastq_blocks(io.BytesIO(data), size, 2)))
+    assert ''.join([s[0] for s in split]) == ''.join(read1)
+    assert ''.join([s[1] for s in split]) == ''.join(read2)
+
+
+def test_interleave_mismatch():
+    read1, read2 = get_fastq(10, 1, 1), get_fastq(10, 2, 2)
+    read2[3] = read2[3].replace('1101:3:', '1101:33:')
+    with pytest.raises(ValueError):
+        list(reads.interleave_blocks(reads.fastq_blocks(io.BytesIO(''.join(read1))),
+                reads.fastq_blocks(io.BytesIO(''.join(read2)))))
+    with pytest.raises(ValueError):
+        list(reads.interleave_blocks(reads.fastq_blocks(io.BytesIO(''.join(read1))),
+                reads.fastq_blocks(io.BytesIO(''.join(read2[:-1])))))
+
+
+def test_split_not_interleaved():
+    data = ''.join(get_fastq(10, 1, 1))
+    with pytest.raises(ValueError):
+        list(reads.split_blocks(reads.fastq_blocks(io.BytesIO(data), multiple=2)))
+
+
+def test_prefetch_close_stops_thread():
+    def items():
+        for i in xrange(1000):
+            yield i
+    before = threading.active_count()
+    fetched = reads.prefetch(items(), depth=2)
+    assert next(fetched) == 0
+    fetched.close()
+    time.sleep(0.1)
+    assert threading.active_count() == before
+
+
+def test_prefetch_raises():
+    def items():
+        yield 1
+        raise IOError("bad")
+    fetched = reads.prefetch(items())
+    assert next(fetched) == 1
+    with pytest.raises(IOError):
+        next(fetched)
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+File: test_scheduler.py
+Author: Brant Faircloth
+
+Copyright (c) 2012 Brant C. Faircloth. All rights reserved.
+
+Description: Tests of running jobs and mapping chunks of work across cores.
+
+"""
+
+import time
+import threading
+import pytest
+
+from phyluce.scheduler import Job, run_jobs, get_chunks, map_chunks
+
+
+def work(name, seconds=0):
+    time.sleep(seconds)
+    if name == 'bad':
+        raise ValueError("bad sample")
+    return name.upper()
+
+
+def unpicklable(name):
+    return lambda: name
+
+
+def square(value):
+    return value * value
+
+
+INITIALIZED = []
+
+
+def initialize(value):
+    INITIALIZED.append(value)
+
+
+def worker_initialized(value):
+    return INITIALIZED[-1] + value
+
+
+@pytest.mark.parametrize('threads', [False, True])
+def test_run_jobs_reports_failures(threads):
+    jobs = [Job(name, work, (name, 0.05), size=size) for name, size in
+            [('a', 3), ('bad', 4), ('c', 1), ('d', 2)]]
+    results = {}
+    errors = {}
+    for job, result, error in run_jobs(jobs, 2, threads=threads):
+        results[job.name] = result
+        errors[job.name] = error
+    assert results == {'a': 'A', 'bad': None, 'c': 'C', 'd': 'D'}
+    assert 'ValueError: bad sample' in errors['bad']
+    assert [errors[name] for name in 'acd'] == [None, None, None]
+
+
+def test_run_jobs_largest_first():
+    jobs = [Job(str(size), work, (str(size),), size=size) for size in [1, 5, 3]]
+    assert [job.name for job, result, error in run_jobs(jobs, 1, threads=True)] == ['5', '3', '1']
+
+
+def test_run_jobs_over_budget():
+    # a job needing more than the budget runs alone
+    jobs = [Job('big', work, ('big',), cores=4, memory=10), Job('small', work, ('small',), memory=1)]
+    results = dict([(job.name, result) for job, result, error in run_jobs(jobs, 2, memory=5)])
+    assert results == {'big': 'BIG', 'small': 'SMALL'}
+
+
+def test_run_jobs_unpicklable_result():
+    # fails in the pool, without a callback, so must not hang
+    jobs = [Job('a', unpicklable, ('a',)), Job('b', work, ('b',))]
+    results = {}
+    for job, result, error in run_jobs(jobs, 2):
+        results[job.name] = (result, error)
+    assert results['b'] == ('B', None)
+    assert results['a'][0] is None
+    assert results['a'][1]
+
+
+def test_run_jobs_abort():
+    stop = threading.Event()
+    aborted = []
+    def wait(name):
+        if name == 'slow':
+            stop.wait(10)
+        return name
+    def abort():
+        aborted.append(True)
+        stop.set()
+    jobs = [Job('slow', wait, ('slow',), size=2), Job('fast', wait, ('fast',), size=1)]
+    results = run_jobs(jobs, 2, threads=True, abort=abort)
+    job, result, error = next(results)
+    assert job.name == 'fast'
+    start = time.time()
+    results.close()
+    assert aborted == [True]
+    assert time.time() - start < 5
+
+
+def test_run_jobs_empty():
+    assert list(run_jobs([], 2)) == []
+
+
+def test_get_chunks():
+    paths = range(50)
+    for cores in [1, 3, 20]:
+        chunks = get_chunks(paths, cores)
+        assert sum(chunks, []) == paths
+        assert len(chunks) >= min(cores, len(paths))
+
+
+@pytest.mark.parametrize('cores', [1, 3])
+def test_map_chunks_in_order(cores):
+    assert list(map_chunks(square, range(20), cores)) == [value * value for value in range(20)]
+    assert list(map_chunks(worker_initialized, range(5), cores, initialize, (10,))) == range(10, 15)
+
+
+def test_map_chunks_raises():
+    with pytest.raises(ValueError):
+        list(map_chunks(work, ['a', 'bad', 'c'], 2))